@@ -0,0 +1,102 @@
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, List, Optional
+
+from rag_elements.tracing import annotate
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_query(query: str) -> str:
+    """Normalize a chat query so trivially different spellings coalesce."""
+    return " ".join(query.lower().split()).rstrip("?!. ")
+
+
+class _Broadcast:
+    """Items produced by one shared stream, replayed to every subscriber."""
+
+    def __init__(self):
+        self.items: List[Any] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.changed = asyncio.Condition()
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent identical work.
+
+    Callers that ask for a key while a computation for it is running share that
+    computation instead of starting their own. Keys are forgotten as soon as the
+    computation finishes, so results are never served after the fact.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+        self._streams: Dict[Hashable, _Broadcast] = {}
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        """Run func for key, or wait for the run already in flight."""
+        future = self._calls.get(key)
+        if future is None:
+            future = asyncio.ensure_future(func())
+            self._calls[key] = future
+            future.add_done_callback(lambda done: self._forget(self._calls, key, done))
+        else:
+            self.coalesced += 1
+            # The shared work is traced by the caller that started it
+            annotate(coalesced=True)
+        # A caller that disconnects must not cancel the work others are waiting for
+        return await asyncio.shield(future)
+
+    async def stream(self, key: Hashable, factory: Callable[[], AsyncIterator[Any]]) -> AsyncIterator[Any]:
+        """
+        Iterate the items of factory() for key, sharing one producer among concurrent callers.
+
+        Callers that join late first receive the items already produced.
+        """
+        broadcast = self._streams.get(key)
+        if broadcast is None:
+            broadcast = _Broadcast()
+            self._streams[key] = broadcast
+            asyncio.ensure_future(self._pump(key, broadcast, factory))
+        else:
+            self.coalesced += 1
+            annotate(coalesced=True)
+
+        index = 0
+        while True:
+            async with broadcast.changed:
+                await broadcast.changed.wait_for(lambda: index < len(broadcast.items) or broadcast.done)
+            while index < len(broadcast.items):
+                yield broadcast.items[index]
+                index += 1
+            if broadcast.done and index == len(broadcast.items):
+                if broadcast.error:
+                    raise broadcast.error
+                return
+
+    async def _pump(self, key: Hashable, broadcast: _Broadcast, factory: Callable[[], AsyncIterator[Any]]):
+        # Runs to completion even if every subscriber disconnects, so the result still gets cached
+        try:
+            async for item in factory():
+                async with broadcast.changed:
+                    broadcast.items.append(item)
+                    broadcast.changed.notify_all()
+        except Exception as e:
+            logger.error(f"Shared stream failed: {str(e)}")
+            broadcast.error = e
+        finally:
+            async with broadcast.changed:
+                broadcast.done = True
+                broadcast.changed.notify_all()
+            self._forget(self._streams, key, broadcast)
+
+    @staticmethod
+    def _forget(registry: Dict[Hashable, Any], key: Hashable, value: Any):
+        if registry.get(key) is value:
+            del registry[key]
+
+
+chat_flights = SingleFlight()
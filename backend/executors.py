@@ -0,0 +1,30 @@
+import asyncio
+import functools
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+from rag_elements.config import Config
+
+# Embedding, FAISS and PDF parsing spend most of their time in native code that releases
+# the GIL, so threads give real parallelism while sharing the loaded indexes and models
+cpu_executor = ThreadPoolExecutor(max_workers=Config.CPU_EXECUTOR_WORKERS, thread_name_prefix="rag-cpu")
+io_executor = ThreadPoolExecutor(max_workers=Config.IO_EXECUTOR_WORKERS, thread_name_prefix="rag-io")
+# Streaming upload jobs wait on the client between files, so they get threads of their own
+# rather than holding up saves, loads and directory ingestion on the job pool
+upload_executor = ThreadPoolExecutor(max_workers=Config.UPLOAD_JOB_WORKERS, thread_name_prefix="rag-upload")
+
+
+def _in_context(func: Callable[..., Any], *args, **kwargs) -> Callable[[], Any]:
+    # Executor threads do not inherit context variables, so the request's trace is carried over
+    return functools.partial(contextvars.copy_context().run, func, *args, **kwargs)
+
+
+async def run_cpu(func: Callable[..., Any], *args, **kwargs) -> Any:
+    """Run CPU-bound work (embedding, vector search, parsing) off the event loop."""
+    return await asyncio.get_running_loop().run_in_executor(cpu_executor, _in_context(func, *args, **kwargs))
+
+
+async def run_io(func: Callable[..., Any], *args, **kwargs) -> Any:
+    """Run blocking I/O (synchronous LLM calls, loading collections from disk) off the event loop."""
+    return await asyncio.get_running_loop().run_in_executor(io_executor, _in_context(func, *args, **kwargs))
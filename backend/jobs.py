@@ -0,0 +1,179 @@
+import time
+import uuid
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from rag_elements.config import Config
+from shared_state import SharedStateStore, shared_state
+
+logger = logging.getLogger(__name__)
+
+
+class JobProgress:
+    """Per-stage progress of a running job, with throughput and an ETA for each stage."""
+
+    def __init__(self, on_update: Optional[Callable[[], None]] = None):
+        self.on_update = on_update
+        self._stages: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def update(self, stage: str, done: int, total: int):
+        """Record that done of total items of a stage are finished."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._stages.setdefault(stage, {"started": now})
+            entry.update(done=done, total=total, updated=now)
+        if self.on_update:
+            self.on_update()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            stages = {}
+            for stage, entry in self._stages.items():
+                elapsed = entry["updated"] - entry["started"]
+                throughput = entry["done"] / elapsed if elapsed > 0 else None
+                remaining = entry["total"] - entry["done"]
+                stages[stage] = {
+                    "done": entry["done"],
+                    "total": entry["total"],
+                    "per_second": round(throughput, 2) if throughput else None,
+                    "eta_seconds": 0 if remaining <= 0 else (round(remaining / throughput, 1) if throughput else None)
+                }
+            return {"stage": next(reversed(self._stages), None), "stages": stages}
+
+
+class JobManager:
+    """
+    Run long operations on a background thread pool and track their status.
+
+    With a shared store, job status is also published there, so a job started by one
+    worker process can be polled through any other. Publishing is a SQLite write that can
+    wait on other workers, so it only happens on job threads, never in submit: submitting
+    is safe on the event loop, and a queued job shows on other workers once it starts.
+    """
+
+    def __init__(self, max_workers: int = Config.BACKGROUND_JOB_WORKERS,
+                 max_finished_jobs: int = Config.MAX_FINISHED_JOBS,
+                 store: Optional[SharedStateStore] = None):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="rag-job")
+        self.max_finished_jobs = max_finished_jobs
+        self.store = store
+        self._jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._progress: Dict[str, JobProgress] = {}
+        self._published: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, job_type: str, func: Callable[..., Any], *args, owner: Optional[str] = None,
+               executor: Optional[ThreadPoolExecutor] = None, **kwargs) -> str:
+        """Queue a function to run in the background, on executor instead of the job pool if given, and return its job ID."""
+        return self._submit(job_type, func, args, kwargs, owner, executor=executor)
+
+    def submit_with_progress(self, job_type: str, func: Callable[..., Any], *args,
+                             owner: Optional[str] = None, executor: Optional[ThreadPoolExecutor] = None,
+                             **kwargs) -> str:
+        """
+        Queue a function that reports progress and return its job ID.
+
+        The function is called with a progress=callback(stage, done, total) keyword
+        argument, and the job's status includes the per-stage progress it reported.
+        """
+        job_id = uuid.uuid4().hex
+        progress = JobProgress(on_update=lambda: self._publish(job_id, throttle=True))
+        return self._submit(job_type, func, args, {**kwargs, "progress": progress.update}, owner, progress, job_id,
+                            executor)
+
+    def _submit(self, job_type: str, func: Callable[..., Any], args: tuple, kwargs: dict, owner: Optional[str] = None,
+                progress: Optional[JobProgress] = None, job_id: Optional[str] = None,
+                executor: Optional[ThreadPoolExecutor] = None) -> str:
+        job_id = job_id or uuid.uuid4().hex
+        with self._lock:
+            self._jobs[job_id] = {
+                "id": job_id,
+                "type": job_type,
+                "owner": owner,
+                "status": "queued",
+                "created_at": datetime.now().isoformat(),
+                "started_at": None,
+                "finished_at": None,
+                "result": None,
+                "error": None
+            }
+            if progress:
+                self._progress[job_id] = progress
+            self._prune()
+
+        (executor or self.executor).submit(self._run, job_id, func, args, kwargs)
+        return job_id
+
+    def _run(self, job_id: str, func: Callable[..., Any], args: tuple, kwargs: dict):
+        # First publication of the job's status, from the job thread
+        self._update(job_id, status="running", started_at=datetime.now().isoformat())
+        try:
+            result = func(*args, **kwargs)
+            self._update(job_id, status="completed", result=result, finished_at=datetime.now().isoformat())
+        except Exception as e:
+            logger.error(f"Background job {job_id} failed: {str(e)}")
+            self._update(job_id, status="failed", error=str(e), finished_at=datetime.now().isoformat())
+
+    def _update(self, job_id: str, **fields):
+        with self._lock:
+            if job_id in self._jobs:
+                self._jobs[job_id].update(fields)
+        self._publish(job_id)
+
+    def _publish(self, job_id: str, throttle: bool = False):
+        """Copy a job's status to the shared store; throttled calls publish at most every few hundred ms."""
+        if not self.store:
+            return
+        now = time.monotonic()
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if not job or (throttle and now - self._published.get(job_id, 0) < Config.JOB_PROGRESS_PUBLISH_SECONDS):
+                return
+            self._published[job_id] = now
+            status = self._status(job_id, job)
+        try:
+            self.store.put_job(status, self.max_finished_jobs)
+        except Exception as e:
+            logger.warning(f"Could not publish status of job {job_id}: {str(e)}")
+
+    def _prune(self):
+        """Forget the oldest finished jobs beyond the retention limit. Caller holds the lock."""
+        finished = [job_id for job_id, job in self._jobs.items() if job["status"] in ("completed", "failed")]
+        for job_id in finished[:max(0, len(finished) - self.max_finished_jobs)]:
+            del self._jobs[job_id]
+            self._progress.pop(job_id, None)
+            self._published.pop(job_id, None)
+
+    def _status(self, job_id: str, job: Dict[str, Any]) -> Dict[str, Any]:
+        """Copy of a job's status with its progress, if it reports any. Caller holds the lock."""
+        status = dict(job)
+        if job_id in self._progress:
+            status["progress"] = self._progress[job_id].snapshot()
+        return status
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Get a copy of a job's status, from the shared store if another worker runs it."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job:
+                return self._status(job_id, job)
+        return self.store.get_job(job_id) if self.store else None
+
+    def list_jobs(self, owner: Optional[str] = None) -> List[Dict[str, Any]]:
+        """List tracked jobs, only those submitted for owner if one is given, oldest first."""
+        with self._lock:
+            local = {job_id: self._status(job_id, job) for job_id, job in self._jobs.items()}
+        # This worker's own jobs are fresher than their published copies
+        jobs = {job["id"]: job for job in self.store.list_jobs()} if self.store else {}
+        jobs.update(local)
+        if owner is not None:
+            jobs = {job_id: job for job_id, job in jobs.items() if job.get("owner") == owner}
+        return sorted(jobs.values(), key=lambda job: job["created_at"])
+
+
+job_manager = JobManager(store=shared_state)
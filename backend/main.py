@@ -6,7 +6,8 @@ import uvicorn
 from dotenv import load_dotenv
 
 # Import route modules
-from . routes import main_router, upload_router, chat_router, store_router
+from . routes import main_router, upload_router, chat_router, store_router, job_router
+from . sessions import SessionMiddleware
 
 # Load environment variables
 load_dotenv()
@@ -22,6 +23,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Scope collections, chat history and jobs to the client's session
+app.add_middleware(SessionMiddleware)
+
 # Mount static files for the frontend
 frontend_path = os.path.join(os.path.dirname(__file__), "..", "frontend")
 app.mount("/static", StaticFiles(directory=frontend_path), name="static")
@@ -31,6 +35,7 @@ app.include_router(main_router)
 app.include_router(upload_router)
 app.include_router(chat_router)
 app.include_router(store_router)
+app.include_router(job_router)
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=7860, log_level="info")
@@ -1,9 +1,13 @@
 from pydantic import BaseModel
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
+
+from rag_elements.config import Config
 
 
 class ChatMessage(BaseModel):
     message: str
+    collection: str = Config.DEFAULT_COLLECTION_NAME
+    debug: bool = False
 
 
 class ChatResponse(BaseModel):
@@ -11,6 +15,7 @@ class ChatResponse(BaseModel):
     citations: List[Dict[str, Any]]
     themes: Dict[str, Any]
     timestamp: str
+    trace: Optional[Dict[str, Any]] = None
 
 
 class ProcessingStats(BaseModel):
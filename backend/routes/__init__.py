@@ -8,5 +8,6 @@ from .main_routes import router as main_router
 from .upload_routes import router as upload_router
 from .chat_routes import router as chat_router
 from .store_routes import router as store_router
+from .job_routes import router as job_router
 
-__all__ = ["main_router", "upload_router", "chat_router", "store_router"]
+__all__ = ["main_router", "upload_router", "chat_router", "store_router", "job_router"]
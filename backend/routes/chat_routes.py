@@ -1,44 +1,188 @@
 import os
 import sys
-from fastapi import APIRouter, HTTPException
+import json
+import asyncio
+import logging
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 
 # Add parent directory to path for imports
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
 from models import ChatMessage, ChatResponse
-from utils import get_processor, generate_response, get_global_state, update_global_state
+from rag_elements.config import Config
+from rag_elements.tracing import Trace, current_trace, write_trace
+from coalescing import chat_flights, normalize_query
+from executors import run_cpu, run_io
+from sessions import collection_key, session_collection
+from utils import (
+    get_processor, generate_response_with_themes, astream_response, compress_for_prompt, search_with_answer_cache,
+    cache_generated_answer, get_global_state, append_chat_history, aanalyze_themes
+)
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+NO_RESULTS_RESPONSE = "I couldn't find any relevant information in the documents for your query."
+
 
 @router.post("/chat", response_model=ChatResponse)
-async def chat(message: ChatMessage):
-    """Process a chat message and return response with citations and themes."""
+async def chat(message: ChatMessage, request: Request):
+    """
+    Process a chat message and return response with citations and themes.
+    
+    Identical questions (after normalization) to the same collection that arrive while
+    one is being answered share that answer instead of calling the LLM again.
+    With "debug": true the response includes a timing trace of the pipeline stages.
+    """
+    trace = _start_trace(message, "/chat")
     try:
-        processor = get_processor()
-        state = get_global_state()
+        collection = collection_key(request, message.collection)
+        processor = await run_io(get_processor, collection)
+        state = await run_io(get_global_state, collection)
         
-        if not state["vector_store_loaded"]:
+        if not processor or not state["vector_store_loaded"]:
             raise HTTPException(status_code=400, detail="No vector store loaded. Please upload and process documents first.")
         
-        # Search for relevant documents
-        search_results = processor.search_with_citations(message.message, k=5)
+        key = ("chat", collection, normalize_query(message.message))
+        answer = await chat_flights.do(key, lambda: _answer(processor, message.message))
         
-        if not search_results:
-            response_text = "I couldn't find any relevant information in the documents for your query."
-            chat_response = ChatResponse(
-                response=response_text,
-                citations=[],
-                themes={},
-                timestamp=datetime.now().isoformat()
-            )
-        else:
-            # Analyze themes
-            theme_analysis = processor.analyze_themes(message.message, search_results)
+        chat_response = ChatResponse(
+            response=answer["response"],
+            citations=answer["citations"],
+            themes=answer["themes"],
+            timestamp=datetime.now().isoformat()
+        )
+        
+        # Add to chat history
+        await _record_chat(collection, message, chat_response)
+        
+        await _log_trace(trace)
+        if message.debug:
+            chat_response.trace = trace.to_dict()
+        
+        return chat_response
+        
+    except Exception as e:
+        await _log_trace(trace, error=str(e))
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+async def _answer(processor, query: str) -> Dict[str, Any]:
+    """Retrieve documents for a query and answer it from the answer cache or the LLM."""
+    # Search for relevant documents and check for a cached answer to a similar question
+    search_results, cached, cache_key = await run_cpu(search_with_answer_cache, processor, query, k=5)
+    
+    if cached:
+        return {"response": cached["response"], "citations": search_results, "themes": cached["themes"]}
+    
+    if not search_results:
+        return {"response": NO_RESULTS_RESPONSE, "citations": [], "themes": {}}
+    
+    # Generate the response and analyze themes concurrently
+    response_text, theme_analysis = await generate_response_with_themes(
+        processor, query, search_results, query_vector=cache_key[0]
+    )
+    cache_generated_answer(processor, cache_key, query, search_results, response_text, theme_analysis)
+    
+    return {"response": response_text, "citations": search_results, "themes": theme_analysis}
+
+
+async def _record_chat(collection: str, message: ChatMessage, chat_response: ChatResponse):
+    """Append an exchange to the chat history of a collection."""
+    await run_io(append_chat_history, collection, {
+        "user_message": message.message,
+        "assistant_response": chat_response.dict(exclude={"trace"}),
+        "timestamp": datetime.now().isoformat()
+    })
+
+
+def _start_trace(message: ChatMessage, endpoint: str) -> Optional[Trace]:
+    """Trace a chat request when the caller asked for debug output or traces are logged."""
+    if not (message.debug or Config.TRACE_LOG_PATH):
+        return None
+    trace = Trace(endpoint=endpoint, collection=message.collection, query=message.message)
+    # Each request runs in its own task, so the trace never leaks into another request
+    current_trace.set(trace)
+    return trace
+
+
+async def _log_trace(trace: Optional[Trace], **attributes):
+    """Finish a trace and append it to Config.TRACE_LOG_PATH when traces are logged."""
+    if trace is None:
+        return
+    trace.attributes.update(attributes)
+    trace.finish()
+    if Config.TRACE_LOG_PATH:
+        try:
+            await run_io(write_trace, trace, Config.TRACE_LOG_PATH)
+        except OSError as e:
+            logger.warning(f"Could not write trace {trace.id}: {str(e)}")
+
+
+def _sse_event(event: str, data) -> str:
+    """Format a server-sent event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@router.post("/chat/stream")
+async def chat_stream(message: ChatMessage, request: Request):
+    """
+    Process a chat message and stream the response as server-sent events.
+    
+    Events are sent in order: "citations" as soon as retrieval finishes, "token" for each
+    piece of the answer as the LLM produces it, "themes" once theme analysis completes
+    and finally "done" with the timestamp of the exchange, and the timing trace
+    of the pipeline stages when "debug" is true.
+    """
+    trace = _start_trace(message, "/chat/stream")
+    try:
+        collection = collection_key(request, message.collection)
+        processor = await run_io(get_processor, collection)
+        state = await run_io(get_global_state, collection)
+        
+        if not processor or not state["vector_store_loaded"]:
+            raise HTTPException(status_code=400, detail="No vector store loaded. Please upload and process documents first.")
+        
+        # Search for relevant documents before streaming so failures still get a status code
+        search_results, cached, cache_key = await run_cpu(search_with_answer_cache, processor, message.message, k=5)
+        
+    except Exception as e:
+        await _log_trace(trace, error=str(e))
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    async def event_stream():
+        if trace:
+            # The response streams from another task, which must record into the request's trace
+            current_trace.set(trace)
+        try:
+            yield _sse_event("citations", search_results)
             
-            # Generate response
-            response_text = generate_response(processor, message.message, search_results, theme_analysis)
+            if cached:
+                response_text, theme_analysis = cached["response"], cached["themes"]
+                yield _sse_event("token", {"text": response_text})
+                yield _sse_event("themes", theme_analysis)
+            elif not search_results:
+                response_text = NO_RESULTS_RESPONSE
+                yield _sse_event("token", {"text": response_text})
+                theme_analysis = {}
+            else:
+                # Concurrent identical questions subscribe to one generation
+                key = ("stream", collection, normalize_query(message.message))
+                response_parts, theme_analysis = [], {}
+                events = chat_flights.stream(
+                    key, lambda: _answer_events(processor, message.message, search_results, cache_key)
+                )
+                async for event, data in events:
+                    if event == "token":
+                        response_parts.append(data["text"])
+                    else:
+                        theme_analysis = data
+                    yield _sse_event(event, data)
+                response_text = "".join(response_parts)
             
             chat_response = ChatResponse(
                 response=response_text,
@@ -46,31 +190,58 @@ async def chat(message: ChatMessage):
                 themes=theme_analysis,
                 timestamp=datetime.now().isoformat()
             )
+            await _record_chat(collection, message, chat_response)
+            
+            done = {"timestamp": chat_response.timestamp}
+            if message.debug:
+                trace.finish()
+                done["trace"] = trace.to_dict()
+            yield _sse_event("done", done)
+        finally:
+            await _log_trace(trace)
+
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+async def _answer_events(processor, query: str, search_results: List[Dict[str, Any]],
+                         cache_key) -> AsyncIterator[Tuple[str, Any]]:
+    """Stream the answer to a query as ("token", ...) events followed by a ("themes", ...) event."""
+    # Theme analysis runs while the answer streams
+    prompt_results = await compress_for_prompt(processor, query, search_results, cache_key[0])
+    theme_task = asyncio.create_task(aanalyze_themes(processor, query, prompt_results))
+    try:
+        response_parts = []
+        async for token in astream_response(processor, query, prompt_results):
+            response_parts.append(token)
+            yield "token", {"text": token}
+        response_text = "".join(response_parts)
         
-        # Add to chat history
-        current_history = state["chat_history"]
-        current_history.append({
-            "user_message": message.message,
-            "assistant_response": chat_response.dict(),
-            "timestamp": datetime.now().isoformat()
-        })
-        
-        update_global_state(chat_history=current_history)
-        
-        return chat_response
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        theme_analysis = await theme_task
+        yield "themes", theme_analysis
+        cache_generated_answer(processor, cache_key, query, search_results, response_text, theme_analysis)
+    finally:
+        theme_task.cancel()
 
 
 @router.delete("/clear-chat")
-async def clear_chat():
-    """Clear chat history and reset session data."""
+async def clear_chat(collection: str = Depends(session_collection)):
+    """
+    Clear the chat history of a collection.
+    
+    Only the history is cleared, on every worker alike: the collection's documents, index
+    and statistics stay as they are, in memory and on disk. Remove documents with
+    DELETE /documents.
+    """
     import sys
     import os
     sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
-    from utils import clear_session_data
+    from utils import clear_chat_history
     
-    clear_session_data()
+    await run_io(clear_chat_history, collection)
     
-    return {"status": "success", "message": "Chat history and session data cleared"}
+    return {"status": "success", "message": "Chat history cleared"}
@@ -0,0 +1,36 @@
+import os
+import sys
+from typing import Any, Dict
+from fastapi import APIRouter, HTTPException, Request
+
+# Add parent directory to path for imports
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from jobs import job_manager
+from executors import run_io
+from sessions import request_session
+
+router = APIRouter()
+
+
+def _public(job: Dict[str, Any]) -> Dict[str, Any]:
+    """A job's status without the session token it belongs to."""
+    return {field: value for field, value in job.items() if field != "owner"}
+
+
+@router.get("/jobs")
+async def list_jobs(request: Request):
+    """List the background jobs of the requesting session and their status."""
+    jobs = await run_io(job_manager.list_jobs, owner=request_session(request))
+    return {"jobs": [_public(job) for job in jobs]}
+
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str, request: Request):
+    """Get the status of a background job of the requesting session."""
+    job = await run_io(job_manager.get, job_id)
+    session_id = request_session(request)
+    # Another session's job is reported as missing, so job IDs reveal nothing across sessions
+    if not job or (session_id is not None and job.get("owner") != session_id):
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+    return _public(job)
@@ -1,13 +1,20 @@
 import os
 import sys
-from fastapi import APIRouter
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import FileResponse, PlainTextResponse
 
 # Add parent directory to path for imports
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
 from models import APIKeyRequest
-from utils import initialize_processor, get_global_state
+from utils import initialize_processor, get_global_state, get_chat_history as read_chat_history
+from executors import run_io
+from sessions import session_collection
+from coalescing import chat_flights
+from rag_elements.config import Config
+from rag_elements.collection_registry import CollectionRegistry
+from rag_elements.llm_gateway import get_llm_gateway
+from rag_elements.metrics import pipeline_metrics
 
 router = APIRouter()
 
@@ -23,7 +30,8 @@ async def read_root():
 async def set_api_key(request: APIKeyRequest):
     """Set the GROQ API key."""
     try:
-        initialize_processor(request.api_key)
+        # Spills loaded collections to disk
+        await run_io(initialize_processor, request.api_key)
         return {"status": "success", "message": "API key set successfully"}
     except Exception as e:
         from fastapi import HTTPException
@@ -31,14 +39,47 @@ async def set_api_key(request: APIKeyRequest):
 
 
 @router.get("/stats")
-async def get_stats():
-    """Get processing statistics."""
-    state = get_global_state()
-    return {"stats": state["processing_stats"], "vector_store_loaded": state["vector_store_loaded"]}
+async def get_stats(collection: str = Depends(session_collection)):
+    """Get processing statistics for a collection."""
+    state = await run_io(get_global_state, collection)
+    return {
+        "stats": state["processing_stats"],
+        "vector_store_loaded": state["vector_store_loaded"],
+        "collection": CollectionRegistry.split_key(collection)[1]
+    }
 
 
 @router.get("/chat-history")
-async def get_chat_history():
-    """Get chat history."""
-    state = get_global_state()
-    return {"history": state["chat_history"]}
+async def get_chat_history(collection: str = Depends(session_collection),
+                           limit: int = Query(Config.CHAT_HISTORY_PAGE_SIZE, ge=1, le=Config.CHAT_HISTORY_MAX_PAGE_SIZE),
+                           offset: int = Query(0, ge=0)):
+    """Get a page of chat history for a collection, oldest first; offset counts back from the newest exchange."""
+    return await run_io(read_chat_history, collection, limit, offset)
+
+
+def _gateway_metrics() -> str:
+    """LLM call counters from the gateway and the number of coalesced chat requests."""
+    lines = []
+    calls = get_llm_gateway().metrics.snapshot()
+    for name, help_text in (("calls", "LLM calls made"), ("errors", "LLM calls that failed"),
+                            ("retries", "LLM calls retried after a transient failure")):
+        lines.append(f"# HELP rag_llm_{name}_total {help_text}.")
+        lines.append(f"# TYPE rag_llm_{name}_total counter")
+        for key, stats in sorted(calls.items()):
+            model, method = key.rsplit(":", 1)
+            lines.append(f'rag_llm_{name}_total{{model="{model}",method="{method}"}} {stats[name]}')
+    lines += [
+        "# HELP rag_chat_coalesced_total Chat requests answered by sharing an identical request in flight.",
+        "# TYPE rag_chat_coalesced_total counter",
+        f"rag_chat_coalesced_total {chat_flights.coalesced}"
+    ]
+    return "\n".join(lines) + "\n"
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Per-stage pipeline latency and throughput of this worker in the Prometheus text format."""
+    return PlainTextResponse(
+        pipeline_metrics.render() + _gateway_metrics(),
+        media_type="text/plain; version=0.0.4"
+    )
@@ -1,72 +1,117 @@
 import os
 import sys
-import json
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 
 # Add parent directory to path for imports
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
-from utils import get_processor, get_global_state, update_global_state
+from utils import (
+    get_processor, get_collection_registry, get_global_state, update_global_state, load_collection_stats
+)
+from jobs import job_manager
+from executors import run_cpu, run_io
+from sessions import request_session, session_collection
+from rag_elements.collection_registry import CollectionRegistry
 
 router = APIRouter()
 
 
+@router.get("/collections")
+async def list_collections(request: Request):
+    """List the requesting session's collections saved on disk or loaded in memory."""
+    try:
+        registry = get_collection_registry()
+        return {"collections": await run_io(registry.list_collections, request_session(request))}
+        
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/themes")
+async def get_theme_map(collection: str = Depends(session_collection)):
+    """Browse the corpus theme map of a collection, largest theme first."""
+    try:
+        processor = await run_io(get_processor, collection)
+        
+        if not processor or not processor.vector_store:
+            raise HTTPException(status_code=400, detail="No vector store loaded. Please upload and process documents first.")
+        
+        return {"collection": CollectionRegistry.split_key(collection)[1], "themes": processor.get_theme_map()}
+        
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+def _delete_source(collection: str, source: str) -> dict:
+    """Delete a source's chunks from a collection and record the change."""
+    with get_collection_registry().writing(collection) as processor:
+        deleted = processor.delete_source(source)
+        if deleted:
+            update_global_state(collection, vector_store_updated=True)
+        return {"status": "success", "deleted_chunks": deleted, "dead_ratio": processor.dead_ratio()}
+
+
+@router.delete("/documents")
+async def delete_documents(source: str = Query(...), collection: str = Depends(session_collection)):
+    """Delete every chunk of a source file from a collection."""
+    try:
+        processor = await run_io(get_processor, collection)
+        
+        if not processor or not processor.vector_store:
+            raise HTTPException(status_code=400, detail="No vector store loaded. Please upload and process documents first.")
+        
+        return await run_cpu(_delete_source, collection, source)
+        
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @router.post("/save-vector-store")
-async def save_vector_store():
-    """Save the current vector store."""
+async def save_vector_store(request: Request, collection: str = Depends(session_collection)):
+    """Save the vector store of a collection in a background job."""
     try:
-        processor = get_processor()
+        processor = await run_io(get_processor, collection)
         
-        if not processor.vector_store:
+        if not processor or not processor.vector_store:
             raise HTTPException(status_code=400, detail="No vector store to save. Process documents first.")
         
-        save_path = "vector_store"
-        processor.save_vector_store(save_path)
+        registry = get_collection_registry()
+        job_id = job_manager.submit("save-vector-store", registry.save, collection, owner=request_session(request))
         
-        return {"status": "success", "message": "Vector store saved successfully"}
+        return {"status": "accepted", "message": "Saving vector store in the background", "job_id": job_id}
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def _load_collection(collection: str):
+    """Load a collection from disk and refresh its statistics."""
+    registry = get_collection_registry()
+    processor = registry.load(collection)
+    
+    if not processor or not processor.vector_store:
+        raise RuntimeError("Failed to load vector store. Check if it exists.")
+    
+    stats = load_collection_stats(registry.path_for(collection))
+    
+    # Update global state
+    update_global_state(collection, processing_stats=stats)
+    
+    return {"stats": stats}
+
+
 @router.post("/load-vector-store")
-async def load_vector_store():
-    """Load a previously saved vector store."""
+async def load_vector_store(request: Request, collection: str = Depends(session_collection)):
+    """Load a previously saved vector store into a collection in a background job."""
     try:
-        processor = get_processor()
+        registry = get_collection_registry()
         
-        load_path = "vector_store"
-        vector_store = processor.load_vector_store(load_path)
-        
-        if vector_store:
-            # Load metadata if available
-            metadata_path = f"{load_path}/enhanced_metadata.json"
-            stats = {}
-            
-            if os.path.exists(metadata_path):
-                with open(metadata_path, "r") as f:
-                    metadata = json.load(f)
-                
-                processed_files = metadata.get("processed_files", [])
-                unique_files = len(set(f.get("source", "") for f in processed_files))
-                
-                stats = {
-                    "total_files": unique_files,
-                    "total_documents": metadata.get("num_documents", 0),
-                    "total_chunks": metadata.get("num_chunks", 0),
-                    "file_types": list(set(f["type"] for f in processed_files if "type" in f)),
-                    "processed_at": metadata.get("created_at", "Unknown")
-                }
-            
-            # Update global state
-            update_global_state(
-                vector_store_loaded=True,
-                processing_stats=stats
-            )
-            
-            return {"status": "success", "message": "Vector store loaded successfully", "stats": stats}
-        else:
+        if not await run_io(registry.vector_store_exists, collection):
             raise HTTPException(status_code=400, detail="Failed to load vector store. Check if it exists.")
+        
+        job_id = job_manager.submit("load-vector-store", _load_collection, collection, owner=request_session(request))
+        
+        return {"status": "accepted", "message": "Loading vector store in the background", "job_id": job_id}
             
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -1,107 +1,271 @@
 import os
 import sys
+import queue
+import asyncio
+import logging
 import tempfile
 import shutil
-from fastapi import APIRouter, File, UploadFile, HTTPException, Form
-from typing import List
+from fastapi import APIRouter, HTTPException, Form, Request
+from typing import Callable, List, Set, Tuple
 
 # Add parent directory to path for imports
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
 from utils import (
-    get_processor, save_uploaded_file, calculate_processing_stats,
+    get_processor, get_collection_registry, calculate_processing_stats,
     update_global_state, get_global_state
 )
+from jobs import job_manager
+from executors import run_io, upload_executor
+from sessions import collection_key, request_session
+from uploads import stream_multipart_upload, UploadError
+from rag_elements.config import Config
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+UPLOAD_FORM_SCHEMA = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["files"],
+                    "properties": {
+                        "collection": {"type": "string", "default": Config.DEFAULT_COLLECTION_NAME},
+                        "append": {"type": "boolean", "default": False},
+                        "files": {"type": "array", "items": {"type": "string", "format": "binary"}}
+                    }
+                }
+            }
+        }
+    }
+}
 
-@router.post("/upload-files")
-async def upload_files(files: List[UploadFile] = File(...)):
-    """Upload and process multiple files."""
-    try:
-        processor = get_processor()
-        
-        # Create temporary directory
-        temp_dir = tempfile.mkdtemp()
-        temp_files = []
+
+def _index_documents(collection: str, processor, documents, append: bool, progress) -> dict:
+    """Index parsed documents into a collection and refresh its statistics."""
+    # Create vector store, or add the documents to it as a new segment
+    if append:
+        vector_store = processor.add_documents_to_vector_store(documents, progress)
+    else:
+        vector_store = processor.create_enhanced_vector_store(documents, progress)
+    
+    if not vector_store:
+        raise RuntimeError("Failed to create vector store")
+    
+    # Calculate statistics
+    stats = calculate_processing_stats(processor.processed_documents, vector_store)
+    
+    # Update global state
+    update_global_state(
+        collection,
+        processing_stats=stats,
+        vector_store_updated=True
+    )
+    
+    return stats
+
+
+def _parse_uploads(processor, uploads: queue.Queue, progress) -> Tuple[List, int]:
+    """
+    Parse uploaded files as they arrive.
+    
+    uploads yields {"path", "sha256", ...} for each received file and None once the upload
+    is complete, or an exception if it failed. Returns the documents and the number of
+    files skipped because the same content came earlier in the upload.
+    """
+    seen_hashes = set()
+    documents = []
+    parsed = skipped = 0
+    while True:
+        try:
+            upload = uploads.get(timeout=Config.UPLOAD_IDLE_TIMEOUT_SECONDS)
+        except queue.Empty:
+            raise TimeoutError(f"No file arrived for {Config.UPLOAD_IDLE_TIMEOUT_SECONDS} seconds; giving up on the upload")
+        if upload is None:
+            break
+        if isinstance(upload, Exception):
+            raise upload
         
-        # Save uploaded files
-        for file in files:
-            if file.filename:
-                file_path = await save_uploaded_file(file, temp_dir)
-                temp_files.append(file_path)
+        if upload["sha256"] in seen_hashes:
+            logger.info(f"Skipping {upload['filename']}: identical content was already uploaded")
+            skipped += 1
+        else:
+            seen_hashes.add(upload["sha256"])
+            file_documents = processor.process_files([upload["path"]])
+            for doc in file_documents:
+                doc.metadata["content_sha256"] = upload["sha256"]
+            documents.extend(file_documents)
         
-        # Process files
-        documents = processor.process_files(temp_files)
+        # The total grows while files are still arriving
+        parsed += 1
+        progress("parse", parsed, parsed + uploads.qsize())
+    progress("parse", parsed, parsed)
+    return documents, skipped
+
+
+def _ingest_files(collection: str, uploads: queue.Queue, append: bool, finished: Callable[[], None], progress):
+    """Parse and index uploaded files, skipping content already in the collection, and call finished once done."""
+    try:
+        documents, skipped = _parse_uploads(get_processor(collection, create=True), uploads, progress)
         
-        if documents:
-            # Create vector store
-            vector_store = processor.create_enhanced_vector_store(documents)
+        with get_collection_registry().writing(collection, create=True) as processor:
+            if append:
+                known_hashes = {doc.metadata.get("content_sha256") for doc in processor.processed_documents}
+                duplicates = {doc.metadata["content_sha256"] for doc in documents} & known_hashes
+                documents = [doc for doc in documents if doc.metadata["content_sha256"] not in duplicates]
+                skipped += len(duplicates)
             
-            if vector_store:
-                # Calculate statistics
-                stats = calculate_processing_stats(documents, vector_store)
-                
-                # Update global state
-                update_global_state(
-                    vector_store_loaded=True,
-                    processing_stats=stats
-                )
-                
-                # Clean up temp files
-                shutil.rmtree(temp_dir)
-                
-                return {
-                    "status": "success",
-                    "message": f"Successfully processed {stats['total_files']} files",
-                    "stats": stats
-                }
-            else:
-                raise HTTPException(status_code=500, detail="Failed to create vector store")
-        else:
-            raise HTTPException(status_code=400, detail="No documents were processed successfully")
+            if not documents and skipped and processor.vector_store:
+                stats = calculate_processing_stats(processor.processed_documents, processor.vector_store)
+                return {"message": f"All {skipped} files were already in the collection", "stats": stats}
+            if not documents:
+                raise RuntimeError("No documents were processed successfully")
             
+            stats = _index_documents(collection, processor, documents, append, progress)
+        return {"message": f"Successfully processed {stats['total_files']} files", "stats": stats}
+    finally:
+        finished()
+
+
+# Pending removals of upload directories; the event loop only keeps weak references to tasks
+_cleanups: Set[asyncio.Task] = set()
+
+
+async def _remove_when_ingested(temp_dir: str, ingested: asyncio.Event):
+    """Remove an upload's temporary directory once its ingestion job has stopped reading it."""
+    try:
+        await ingested.wait()
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def _notifier(event: asyncio.Event) -> Callable[[], None]:
+    """A callable any thread can use to set an event of the running event loop."""
+    loop = asyncio.get_running_loop()
+    
+    def notify():
+        try:
+            loop.call_soon_threadsafe(event.set)
+        except RuntimeError:
+            # The loop has closed with the server; nothing is left waiting
+            pass
+    return notify
+
+
+def _ingest_directory(collection: str, directory_path: str, append: bool, progress):
+    """Parse and index the documents of a directory."""
+    processor = get_processor(collection, create=True)
+    documents = processor.process_directory(directory_path, recursive=True, progress=progress)
+    if not documents:
+        raise RuntimeError("No documents found or processed in the directory")
+    
+    with get_collection_registry().writing(collection, create=True) as processor:
+        stats = _index_documents(collection, processor, documents, append, progress)
+    return {"message": f"Successfully processed {stats['total_files']} files from directory", "stats": stats}
+
+
+@router.post("/upload-files", openapi_extra=UPLOAD_FORM_SCHEMA)
+async def upload_files(request: Request):
+    """
+    Upload files and process them into a collection in a background job.
+    
+    The body is read as a stream: each file is written to disk in chunks and handed to
+    the job as soon as it is complete, so parsing overlaps the upload of the remaining
+    files. Send the collection and append fields before the files. Poll /jobs/{job_id}
+    for per-stage progress; the job's result holds the processing statistics.
+    """
+    if not request.headers.get("content-type", "").startswith("multipart/form-data"):
+        raise HTTPException(status_code=422, detail="Expected a multipart/form-data upload with files")
+    
+    fields = {}
+    uploads = None
+    ingested = asyncio.Event()
+    received = 0
+    ending = UploadError("The upload was interrupted")
+    temp_dir = tempfile.mkdtemp()
+    try:
+        async for kind, item in stream_multipart_upload(request, temp_dir):
+            if kind == "field":
+                if uploads is not None and item[0] in ("collection", "append"):
+                    raise UploadError(f"The '{item[0]}' field must be sent before the files")
+                fields[item[0]] = item[1]
+                continue
+            
+            if uploads is None:
+                # The first complete file starts the ingestion job
+                collection = collection_key(request, fields.get("collection", Config.DEFAULT_COLLECTION_NAME))
+                append = fields.get("append", "false").lower() in ("true", "1", "on", "yes")
+                # Fails early without an API key
+                await run_io(get_processor, collection, create=True)
+                pending = queue.Queue()
+                job_id = job_manager.submit_with_progress(
+                    "upload-files", _ingest_files, collection, pending, append, _notifier(ingested),
+                    owner=request_session(request), executor=upload_executor
+                )
+                uploads = pending
+            uploads.put(item)
+            received += 1
+        ending = None
+        
     except Exception as e:
-        # Clean up temp files in case of error
-        if 'temp_dir' in locals():
+        # The job fails on the error; a client disconnect has no message, so it keeps the default one
+        if str(e):
+            ending = e
+        status_code = 400 if isinstance(e, UploadError) else 500
+        raise HTTPException(status_code=status_code, detail=str(e))
+    
+    finally:
+        # The route owns the directory: it goes once nothing is written to it and the job is done reading it
+        if uploads is None:
             shutil.rmtree(temp_dir, ignore_errors=True)
-        raise HTTPException(status_code=500, detail=str(e))
+        else:
+            uploads.put(ending)
+            cleanup = asyncio.create_task(_remove_when_ingested(temp_dir, ingested))
+            _cleanups.add(cleanup)
+            cleanup.add_done_callback(_cleanups.discard)
+    
+    if uploads is None:
+        raise HTTPException(status_code=422, detail="No files were uploaded")
+    
+    return {
+        "status": "accepted",
+        "message": f"Processing {received} files in the background",
+        "job_id": job_id
+    }
 
 
 @router.post("/process-directory")
-async def process_directory(directory_path: str = Form(...)):
-    """Process documents from a directory."""
+async def process_directory(request: Request,
+                            directory_path: str = Form(...),
+                            collection: str = Form(Config.DEFAULT_COLLECTION_NAME),
+                            append: bool = Form(False)):
+    """
+    Process documents from a directory into a collection in a background job.
+    
+    Poll /jobs/{job_id} for per-stage progress; the job's result holds the processing statistics.
+    """
     try:
-        processor = get_processor()
+        collection = collection_key(request, collection)
+        # Fails early without an API key
+        await run_io(get_processor, collection, create=True)
         
         if not os.path.exists(directory_path):
             raise HTTPException(status_code=400, detail=f"Directory does not exist: {directory_path}")
         
-        documents = processor.process_directory(directory_path, recursive=True)
+        job_id = job_manager.submit_with_progress(
+            "process-directory", _ingest_directory, collection, directory_path, append,
+            owner=request_session(request)
+        )
         
-        if documents:
-            vector_store = processor.create_enhanced_vector_store(documents)
-            
-            if vector_store:
-                # Calculate statistics
-                stats = calculate_processing_stats(documents, vector_store)
-                
-                # Update global state
-                update_global_state(
-                    vector_store_loaded=True,
-                    processing_stats=stats
-                )
-                
-                return {
-                    "status": "success",
-                    "message": f"Successfully processed {stats['total_files']} files from directory",
-                    "stats": stats
-                }
-            else:
-                raise HTTPException(status_code=500, detail="Failed to create vector store")
-        else:
-            raise HTTPException(status_code=400, detail="No documents found or processed in the directory")
+        return {
+            "status": "accepted",
+            "message": f"Processing {directory_path} in the background",
+            "job_id": job_id
+        }
             
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,70 @@
+import re
+import secrets
+from http.cookies import SimpleCookie
+from typing import Optional
+
+from fastapi import HTTPException, Query, Request
+
+from rag_elements.config import Config
+from utils import get_collection_registry
+
+
+class SessionMiddleware:
+    """
+    Give every client a session token.
+
+    The token is read from the Config.SESSION_HEADER header or the Config.SESSION_COOKIE_NAME
+    cookie. Clients without a valid one get a new token, set as a cookie so browsers keep it.
+    The token is echoed in the response header for API clients.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = {name.decode("latin-1").lower(): value.decode("latin-1") for name, value in scope["headers"]}
+        session_id = headers.get(Config.SESSION_HEADER.lower())
+        if not session_id:
+            cookie = SimpleCookie(headers.get("cookie", ""))
+            session_id = cookie[Config.SESSION_COOKIE_NAME].value if Config.SESSION_COOKIE_NAME in cookie else None
+        issued = not re.match(Config.SESSION_ID_PATTERN, session_id or "")
+        if issued:
+            session_id = secrets.token_urlsafe(24)
+        scope.setdefault("state", {})["session_id"] = session_id
+
+        async def send_with_session(message):
+            if message["type"] == "http.response.start":
+                response_headers = list(message.get("headers", []))
+                response_headers.append((Config.SESSION_HEADER.lower().encode(), session_id.encode()))
+                if issued:
+                    cookie = (f"{Config.SESSION_COOKIE_NAME}={session_id}; Path=/; HttpOnly; SameSite=Lax; "
+                              f"Max-Age={Config.SESSION_COOKIE_MAX_AGE_SECONDS}")
+                    response_headers.append((b"set-cookie", cookie.encode()))
+                message = {**message, "headers": response_headers}
+            await send(message)
+
+        await self.app(scope, receive, send_with_session)
+
+
+def request_session(request: Request) -> Optional[str]:
+    """The session a request belongs to, or None when sessions are not isolated."""
+    return request.state.session_id if Config.SESSION_ISOLATION else None
+
+
+def collection_key(request: Request, collection: str) -> str:
+    """Resolve a collection name to the registry key of the requesting session's collection."""
+    registry = get_collection_registry()
+    session_id = request_session(request)
+    try:
+        return registry.session_key(session_id, collection) if session_id else registry.validate_name(collection)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def session_collection(request: Request, collection: str = Query(Config.DEFAULT_COLLECTION_NAME)) -> str:
+    """Dependency resolving the collection query parameter for the requesting session."""
+    return collection_key(request, collection)
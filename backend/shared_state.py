@@ -0,0 +1,148 @@
+import os
+import json
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional
+
+from rag_elements.config import Config
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS processing_stats (collection TEXT PRIMARY KEY, stats TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS chat_history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    collection TEXT NOT NULL,
+    entry TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS chat_history_collection ON chat_history (collection, id);
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    created_at TEXT NOT NULL,
+    finished INTEGER NOT NULL DEFAULT 0,
+    job TEXT NOT NULL
+);
+"""
+
+
+class SharedStateStore:
+    """
+    State shared by every worker process: settings, processing statistics, chat history and jobs.
+
+    Backed by one SQLite database in WAL mode so concurrent workers read without blocking
+    each other and writes are serialized by SQLite. Each thread gets its own connection.
+    """
+
+    def __init__(self, path: str = Config.SHARED_STATE_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._initialized = False
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            with self._init_lock:
+                if not self._initialized:
+                    os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                    # The database holds the API key, so only the owner may read it
+                    os.close(os.open(self.path, os.O_CREAT | os.O_WRONLY, 0o600))
+            connection = sqlite3.connect(self.path, timeout=Config.SHARED_STATE_BUSY_TIMEOUT_SECONDS)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            with self._init_lock:
+                if not self._initialized:
+                    connection.executescript(SCHEMA)
+                    self._initialized = True
+            self._local.connection = connection
+        return connection
+
+    def get_setting(self, key: str) -> Optional[str]:
+        row = self._connection().execute("SELECT value FROM settings WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_setting(self, key: str, value: str):
+        with self._connection() as connection:
+            connection.execute("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)", (key, value))
+
+    def get_stats(self, collection: str) -> Dict[str, Any]:
+        row = self._connection().execute(
+            "SELECT stats FROM processing_stats WHERE collection = ?", (collection,)
+        ).fetchone()
+        return json.loads(row[0]) if row else {}
+
+    def set_stats(self, collection: str, stats: Dict[str, Any]):
+        with self._connection() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO processing_stats (collection, stats) VALUES (?, ?)",
+                (collection, json.dumps(stats))
+            )
+
+    def get_chat_history(self, collection: str, limit: int = -1, offset: int = 0) -> List[Dict[str, Any]]:
+        """
+        Get a collection's exchanges, oldest first.
+
+        limit and offset page back from the newest exchange: offset 0 ends with the newest one.
+        """
+        rows = self._connection().execute(
+            "SELECT entry FROM chat_history WHERE collection = ? ORDER BY id DESC LIMIT ? OFFSET ?",
+            (collection, limit, offset)
+        ).fetchall()
+        return [json.loads(row[0]) for row in reversed(rows)]
+
+    def count_chat_history(self, collection: str) -> int:
+        row = self._connection().execute(
+            "SELECT COUNT(*) FROM chat_history WHERE collection = ?", (collection,)
+        ).fetchone()
+        return row[0]
+
+    def append_chat(self, collection: str, entry: Dict[str, Any],
+                    max_entries: int = Config.MAX_CHAT_HISTORY_ENTRIES):
+        """Add an exchange, dropping the oldest ones beyond max_entries."""
+        with self._connection() as connection:
+            connection.execute(
+                "INSERT INTO chat_history (collection, entry) VALUES (?, ?)", (collection, json.dumps(entry))
+            )
+            connection.execute(
+                "DELETE FROM chat_history WHERE collection = ? AND id <= "
+                "(SELECT id FROM chat_history WHERE collection = ? ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                (collection, collection, max_entries)
+            )
+
+    def set_chat_history(self, collection: str, history: List[Dict[str, Any]]):
+        with self._connection() as connection:
+            connection.execute("DELETE FROM chat_history WHERE collection = ?", (collection,))
+            connection.executemany(
+                "INSERT INTO chat_history (collection, entry) VALUES (?, ?)",
+                [(collection, json.dumps(entry)) for entry in history]
+            )
+
+    def clear_chat_history(self, collection: str):
+        """Forget the chat history of a collection."""
+        with self._connection() as connection:
+            connection.execute("DELETE FROM chat_history WHERE collection = ?", (collection,))
+
+    def put_job(self, job: Dict[str, Any], max_finished_jobs: int = Config.MAX_FINISHED_JOBS):
+        """Store a job's status, forgetting the oldest finished jobs beyond the retention limit."""
+        finished = job["status"] in ("completed", "failed")
+        with self._connection() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO jobs (id, created_at, finished, job) VALUES (?, ?, ?, ?)",
+                (job["id"], job["created_at"], int(finished), json.dumps(job, default=str))
+            )
+            if finished:
+                connection.execute(
+                    "DELETE FROM jobs WHERE finished = 1 AND id NOT IN "
+                    "(SELECT id FROM jobs WHERE finished = 1 ORDER BY created_at DESC LIMIT ?)",
+                    (max_finished_jobs,)
+                )
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        row = self._connection().execute("SELECT job FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def list_jobs(self) -> List[Dict[str, Any]]:
+        rows = self._connection().execute("SELECT job FROM jobs ORDER BY created_at").fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+
+shared_state = SharedStateStore()
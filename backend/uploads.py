@@ -0,0 +1,130 @@
+import os
+import hashlib
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import aiofiles
+from fastapi import Request
+from multipart.multipart import MultipartParser, parse_options_header
+
+
+class UploadError(Exception):
+    """The request body is not a well-formed multipart upload."""
+
+
+class _Part:
+    """One part of a multipart body: a form field, or a file streamed to disk."""
+
+    def __init__(self):
+        self.headers: Dict[bytes, bytes] = {}
+        self.name = ""
+        self.filename: Optional[str] = None
+        self.data = b""
+        self.path: Optional[str] = None
+        self.file = None
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+
+async def stream_multipart_upload(request: Request, temp_dir: str) -> AsyncIterator[Tuple[str, Any]]:
+    """
+    Parse a multipart/form-data request as it arrives.
+
+    File parts are written under temp_dir in the chunks they arrive in, hashing them
+    on the way, so no upload is ever held in memory whole. Yields ("field", (name, value))
+    for form fields and ("file", {"filename", "path", "sha256", "size"}) as soon as each
+    file is complete, while later parts are still being received.
+    """
+    _, params = parse_options_header(request.headers.get("content-type", ""))
+    if b"boundary" not in params:
+        raise UploadError("Missing boundary in multipart upload")
+
+    part = _Part()
+    header_name, header_value = b"", b""
+    pending: List[Tuple[str, Any]] = []  # ("data", (part, bytes)) and ("end", part) in body order
+    num_files = 0
+
+    def on_part_begin():
+        nonlocal part
+        part = _Part()
+
+    def on_header_field(data, start, end):
+        nonlocal header_name
+        header_name += data[start:end]
+
+    def on_header_value(data, start, end):
+        nonlocal header_value
+        header_value += data[start:end]
+
+    def on_header_end():
+        nonlocal header_name, header_value
+        part.headers[header_name.lower()] = header_value
+        header_name, header_value = b"", b""
+
+    def on_headers_finished():
+        nonlocal num_files
+        _, options = parse_options_header(part.headers.get(b"content-disposition", b""))
+        if b"name" not in options:
+            raise UploadError('The Content-Disposition header field "name" must be provided')
+        part.name = options[b"name"].decode("utf-8", errors="replace")
+        if b"filename" in options:
+            part.filename = os.path.basename(options[b"filename"].decode("utf-8", errors="replace"))
+            if part.filename:
+                # One directory per file keeps the original name even when two uploads share it
+                num_files += 1
+                file_dir = os.path.join(temp_dir, str(num_files))
+                os.makedirs(file_dir, exist_ok=True)
+                part.path = os.path.join(file_dir, part.filename)
+
+    def on_part_data(data, start, end):
+        if part.filename is None:
+            part.data += data[start:end]
+        elif part.path:
+            pending.append(("data", (part, data[start:end])))
+
+    def on_part_end():
+        pending.append(("end", part))
+
+    parser = MultipartParser(params[b"boundary"], {
+        "on_part_begin": on_part_begin,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished
+    })
+
+    open_files = []
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            # Parser callbacks cannot await, so their output is written out after each chunk
+            for kind, item in pending:
+                if kind == "data":
+                    current, data = item
+                    if current.file is None:
+                        current.file = await aiofiles.open(current.path, "wb")
+                        open_files.append(current.file)
+                    await current.file.write(data)
+                    current.sha256.update(data)
+                    current.size += len(data)
+                elif item.filename is None:
+                    yield "field", (item.name, item.data.decode("utf-8", errors="replace"))
+                elif item.path:
+                    if item.file is None:
+                        # Empty file
+                        item.file = await aiofiles.open(item.path, "wb")
+                        open_files.append(item.file)
+                    await item.file.close()
+                    open_files.remove(item.file)
+                    yield "file", {
+                        "filename": item.filename,
+                        "path": item.path,
+                        "sha256": item.sha256.hexdigest(),
+                        "size": item.size
+                    }
+            pending.clear()
+        parser.finalize()
+    finally:
+        for file in open_files:
+            await file.close()
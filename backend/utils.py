@@ -3,50 +3,92 @@ import sys
 import tempfile
 import shutil
 import json
-import aiofiles
-from fastapi import HTTPException, UploadFile
-from typing import List, Dict
+import time
+import asyncio
+import logging
+from fastapi import HTTPException
+from typing import AsyncIterator, List, Dict, Optional, Tuple
 from datetime import datetime
 
 # Add the parent directory to the path
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
+from rag_elements.config import Config
 from rag_elements.enhanced_vectordb import EnhancedDocumentProcessor
+from rag_elements.collection_registry import CollectionRegistry
+from rag_elements.context_packing import format_context
+from rag_elements.llm_providers import provider_requires_api_key
+from rag_elements.metrics import pipeline_metrics
+from rag_elements.tracing import annotate, record_span, span, token_usage, traced
+from executors import run_cpu, io_executor
+from shared_state import shared_state
 
-# Global variables
-processor_instance = None
-vector_store_loaded = False
-processing_stats = {}
-chat_history = []
+logger = logging.getLogger(__name__)
 
+# Per-worker state; settings, statistics and chat history shared by all workers live in shared_state
+collection_registry = None
+groq_api_key = None  # the key this worker's loaded collections were created with
+api_key_checked_at = None  # time.monotonic() of the last look at the shared API key
 
-def initialize_processor(groq_api_key: str = None):
-    """Initialize the document processor."""
-    global processor_instance
-    
+
+def _create_processor():
+    """Create a processor for a collection using the configured API key."""
     api_key = groq_api_key or os.getenv("GROQ_API_KEY")
+    if not api_key and provider_requires_api_key():
+        raise HTTPException(status_code=400, detail="GROQ API key is required")
+    
+    return EnhancedDocumentProcessor(api_key)
+
+
+def initialize_processor(api_key: str = None):
+    """Set the GROQ API key used by collection processors."""
+    api_key = api_key or os.getenv("GROQ_API_KEY")
     if not api_key:
         raise HTTPException(status_code=400, detail="GROQ API key is required")
     
-    processor_instance = EnhancedDocumentProcessor(api_key)
-    return processor_instance
+    # Other workers pick the key up from the shared store
+    shared_state.set_setting("groq_api_key", api_key)
+    registry = get_collection_registry()
+    _sync_api_key(registry, force=True)
+    return registry
+
+
+def _sync_api_key(registry: CollectionRegistry, force: bool = False):
+    """
+    Switch to the API key last set through any worker.
+    
+    The shared store is checked at most every Config.SHARED_SETTINGS_CHECK_SECONDS unless forced.
+    """
+    global groq_api_key, api_key_checked_at
+    now = time.monotonic()
+    if not force and api_key_checked_at is not None and now - api_key_checked_at < Config.SHARED_SETTINGS_CHECK_SECONDS:
+        return
+    api_key_checked_at = now
+    
+    api_key = shared_state.get_setting("groq_api_key")
+    if api_key and api_key != groq_api_key:
+        groq_api_key = api_key
+        # Loaded collections are spilled to disk and reloaded lazily with the new key; the
+        # spill runs in the background because callers may be on the event loop, and waits
+        # for any collection being written to until its writer is done
+        io_executor.submit(registry.clear, True)
 
 
-def get_processor():
-    """Get the processor instance."""
-    global processor_instance
-    if not processor_instance:
-        initialize_processor()
-    return processor_instance
+def get_collection_registry():
+    """Get the collection registry, creating it on first use."""
+    global collection_registry
+    if not collection_registry:
+        collection_registry = CollectionRegistry(_create_processor)
+    _sync_api_key(collection_registry)
+    return collection_registry
 
 
-async def save_uploaded_file(upload_file: UploadFile, temp_dir: str) -> str:
-    """Save an uploaded file to temporary directory."""
-    file_path = os.path.join(temp_dir, upload_file.filename)
-    async with aiofiles.open(file_path, 'wb') as f:
-        content = await upload_file.read()
-        await f.write(content)
-    return file_path
+def get_processor(collection: str = Config.DEFAULT_COLLECTION_NAME, create: bool = False):
+    """Get the processor for a collection, loading it from disk on first use."""
+    try:
+        return get_collection_registry().get(collection, create=create)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 
 def calculate_processing_stats(documents, vector_store):
@@ -73,27 +115,51 @@ def calculate_processing_stats(documents, vector_store):
     }
 
 
-def generate_response(processor, query: str, search_results: List[Dict], theme_analysis: Dict) -> str:
-    """Generate a comprehensive response based on search results and theme analysis."""
-    if not processor.chat_llm:
-        # Fallback response without LLM
-        response_parts = [
-            f"Based on your query '{query}', I found {len(search_results)} relevant document sections.",
-            "\n**Key Information:**"
-        ]
-        
-        for i, result in enumerate(search_results[:3], 1):
-            content_preview = result['content'][:200] + "..." if len(result['content']) > 200 else result['content']
-            response_parts.append(f"\n{i}. From {result['citation']}: {content_preview}")
-        
-        return "\n".join(response_parts)
+def load_collection_stats(path: str) -> Dict:
+    """Build processing statistics from a saved collection's enhanced metadata."""
+    metadata_path = os.path.join(path, Config.ENHANCED_METADATA_FILENAME)
+    if not os.path.exists(metadata_path):
+        return {}
     
-    try:
-        # Use LLM to generate comprehensive response
-        context_content = "\n\n".join([f"Document {i+1} ({result['citation']}):\n{result['content']}" 
-                                     for i, result in enumerate(search_results)])
-        
-        response_prompt = f"""
+    with open(metadata_path, "r") as f:
+        metadata = json.load(f)
+    
+    processed_files = metadata.get("processed_files", [])
+    unique_files = len(set(f.get("source", "") for f in processed_files))
+    
+    return {
+        "total_files": unique_files,
+        "total_documents": metadata.get("num_documents", 0),
+        "total_chunks": metadata.get("num_chunks", 0),
+        "file_types": list(set(f["type"] for f in processed_files if "type" in f)),
+        "processed_at": metadata.get("created_at", "Unknown")
+    }
+
+
+def _fallback_response(query: str, search_results: List[Dict]) -> str:
+    """Summarize the top search results without an LLM."""
+    response_parts = [
+        f"Based on your query '{query}', I found {len(search_results)} relevant document sections.",
+        "\n**Key Information:**"
+    ]
+    
+    for i, result in enumerate(search_results[:3], 1):
+        content_preview = result['content'][:200] + "..." if len(result['content']) > 200 else result['content']
+        response_parts.append(f"\n{i}. From {result['citation']}: {content_preview}")
+    
+    return "\n".join(response_parts)
+
+
+def _error_response(query: str, search_results: List[Dict]) -> str:
+    return f"Based on your query '{query}', I found relevant information in {len(search_results)} document sections. Please see the citations below for detailed information."
+
+
+def _response_prompt(query: str, search_results: List[Dict]) -> str:
+    """Build the answer prompt from the search results."""
+    # Merge overlapping chunks and fit the excerpts into the context token budget
+    context_content = format_context(search_results)
+    
+    return f"""
         Based on the following document excerpts, provide a comprehensive answer to the user's query: "{query}"
         
         Document excerpts:
@@ -107,46 +173,167 @@ def generate_response(processor, query: str, search_results: List[Dict], theme_a
         
         Make sure to reference the information from the documents and provide a helpful, accurate response.
         """
-        
-        llm_response = processor.chat_llm.invoke(response_prompt)
+
+
+@traced("generate_response")
+async def agenerate_response(processor, query: str, search_results: List[Dict],
+                             timeout: float = Config.RESPONSE_GENERATION_TIMEOUT_SECONDS) -> str:
+    """Generate a response through the LLM's async interface, giving up after timeout seconds."""
+    if not processor.chat_llm:
+        return _fallback_response(query, search_results)
+    
+    try:
+        with pipeline_metrics.timed("answer_llm", streamed="false"):
+            llm_response = await asyncio.wait_for(
+                processor.chat_llm.ainvoke(_response_prompt(query, search_results)),
+                timeout=timeout
+            )
+            annotate(**token_usage(llm_response))
         return llm_response.content
         
     except Exception as e:
-        # Fallback to simple response
-        return f"Based on your query '{query}', I found relevant information in {len(search_results)} document sections. Please see the citations below for detailed information."
+        logger.error(f"Error generating response: {str(e) or type(e).__name__}")
+        return _error_response(query, search_results)
+
+
+async def astream_response(processor, query: str, search_results: List[Dict]) -> AsyncIterator[str]:
+    """Stream the response text as the LLM produces it."""
+    if not processor.chat_llm:
+        yield _fallback_response(query, search_results)
+        return
+    
+    streamed = False
+    chunks, first_token_ms = 0, None
+    started = time.perf_counter()
+    try:
+        async for chunk in processor.chat_llm.astream(_response_prompt(query, search_results)):
+            if chunk.content:
+                if not streamed:
+                    pipeline_metrics.observe("answer_llm_first_token", time.perf_counter() - started)
+                    first_token_ms = round((time.perf_counter() - started) * 1000, 3)
+                streamed = True
+                chunks += 1
+                yield chunk.content
+        pipeline_metrics.observe("answer_llm", time.perf_counter() - started, streamed="true")
+        # The span is recorded afterwards because the generator yields across the whole stage
+        record_span("answer_llm", started, streamed="true", first_token_ms=first_token_ms, output_chunks=chunks)
+                
+    except Exception as e:
+        pipeline_metrics.observe("answer_llm", time.perf_counter() - started, error=True, streamed="true")
+        record_span("answer_llm", started, error=str(e) or type(e).__name__, streamed="true",
+                    first_token_ms=first_token_ms, output_chunks=chunks)
+        logger.error(f"Error streaming response: {str(e)}")
+        # Close an interrupted answer with the same notice a failed one gets
+        yield ("\n\n" if streamed else "") + _error_response(query, search_results)
+
+
+async def compress_for_prompt(processor, query: str, search_results: List[Dict],
+                              query_vector: Optional[List[float]] = None) -> List[Dict]:
+    """Compress search results to their most relevant sentences, off the event loop."""
+    if not Config.ENABLE_CONTEXT_COMPRESSION or not search_results:
+        return search_results
+    # Only traced when compression runs, so disabled compression adds no stage to traces
+    with span("compress"):
+        return await run_cpu(processor.compress_results, query, search_results, query_vector)
+
+
+async def aanalyze_themes(processor, query: str, search_results: List[Dict]) -> Dict:
+    """Analyze themes without blocking the event loop; the local clustering modes run on the CPU pool."""
+    if search_results and Config.THEME_ANALYSIS_MODE != "llm":
+        return await run_cpu(processor.analyze_themes, query, search_results)
+    return await processor.aanalyze_themes(query, search_results)
+
+
+async def generate_response_with_themes(processor, query: str, search_results: List[Dict],
+                                        query_vector: Optional[List[float]] = None) -> Tuple[str, Dict]:
+    """
+    Generate the answer and the theme analysis concurrently.
+    
+    The answer does not depend on the themes, so both LLM calls are in flight at
+    once and the latency is that of the slower call, each bounded by its own timeout.
+    """
+    prompt_results = await compress_for_prompt(processor, query, search_results, query_vector)
+    response_text, theme_analysis = await asyncio.gather(
+        agenerate_response(processor, query, prompt_results),
+        aanalyze_themes(processor, query, prompt_results)
+    )
+    return response_text, theme_analysis
 
 
-def get_global_state():
-    """Get the current global state."""
+@traced("retrieve")
+def search_with_answer_cache(processor, query: str, k: int = 5) -> Tuple[List[Dict], Optional[Dict], Tuple]:
+    """
+    Search for a query and look up a cached answer for the retrieved chunks.
+    
+    Returns the search results, the cached {"response", "themes"} or None, and a
+    cache key to pass to cache_generated_answer after generating a fresh answer.
+    """
+    # Read the version first so an answer is never cached against a newer store than it saw
+    store_version = processor.store_version
+    with pipeline_metrics.timed("embed_query"):
+        query_vector = processor.embeddings.embed_query(query)
+    search_results = processor.search_with_citations(query, k=k, query_vector=query_vector)
+    
+    with span("answer_cache"):
+        cached = processor.get_cached_answer(query_vector, search_results, store_version) if search_results else None
+        annotate(hit=cached is not None)
+    return search_results, cached, (query_vector, store_version)
+
+
+def cache_generated_answer(processor, cache_key: Tuple, query: str, search_results: List[Dict],
+                           response_text: str, theme_analysis: Dict):
+    """Cache a generated answer unless generation fell back to a placeholder."""
+    if not processor.chat_llm or response_text.endswith(_error_response(query, search_results)):
+        return
+    if theme_analysis.get("themes") and theme_analysis["themes"][0].get("name") == "Error":
+        return
+    
+    query_vector, store_version = cache_key
+    processor.cache_answer(query_vector, search_results, store_version, response_text, theme_analysis)
+
+
+def get_global_state(collection: str = Config.DEFAULT_COLLECTION_NAME, include_history: bool = False):
+    """
+    Get the current state of a collection.
+    
+    Reads the shared store, so call it off the event loop. The chat history is only
+    included when asked for; use get_chat_history to page through it.
+    """
+    state = {
+        "vector_store_loaded": get_collection_registry().exists(collection),
+        "processing_stats": shared_state.get_stats(collection),
+        "collection_registry": collection_registry
+    }
+    if include_history:
+        state["chat_history"] = shared_state.get_chat_history(collection)
+    return state
+
+
+def get_chat_history(collection: str, limit: int = Config.CHAT_HISTORY_PAGE_SIZE, offset: int = 0) -> Dict:
+    """Get a page of a collection's chat history, ending offset exchanges before the newest one."""
     return {
-        "vector_store_loaded": vector_store_loaded,
-        "processing_stats": processing_stats,
-        "chat_history": chat_history,
-        "processor_instance": processor_instance
+        "history": shared_state.get_chat_history(collection, limit, offset),
+        "total": shared_state.count_chat_history(collection),
+        "limit": limit,
+        "offset": offset
     }
 
 
-def update_global_state(**kwargs):
-    """Update global state variables."""
-    global vector_store_loaded, processing_stats, chat_history, processor_instance
-    
-    if "vector_store_loaded" in kwargs:
-        vector_store_loaded = kwargs["vector_store_loaded"]
+def update_global_state(collection: str = Config.DEFAULT_COLLECTION_NAME, **kwargs):
+    """Update the state of a collection."""
     if "processing_stats" in kwargs:
-        processing_stats = kwargs["processing_stats"]
+        shared_state.set_stats(collection, kwargs["processing_stats"])
     if "chat_history" in kwargs:
-        chat_history = kwargs["chat_history"]
-    if "processor_instance" in kwargs:
-        processor_instance = kwargs["processor_instance"]
+        shared_state.set_chat_history(collection, kwargs["chat_history"])
+    if kwargs.get("vector_store_updated"):
+        get_collection_registry().mark_updated(collection)
 
 
-def clear_session_data():
-    """Clear all session data."""
-    global chat_history, vector_store_loaded, processing_stats, processor_instance
-    
-    chat_history = []
-    vector_store_loaded = False
-    processing_stats = {}
-    
-    if processor_instance and processor_instance.vector_store:
-        processor_instance.vector_store = None
+def append_chat_history(collection: str, entry: Dict):
+    """Add one exchange to the chat history of a collection."""
+    shared_state.append_chat(collection, entry)
+
+
+def clear_chat_history(collection: str = Config.DEFAULT_COLLECTION_NAME):
+    """Clear the chat history of a collection; its documents, index and statistics are kept."""
+    shared_state.clear_chat_history(collection)
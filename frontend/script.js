@@ -12,6 +12,7 @@ const directoryPathInput = document.getElementById('directoryPath');
 const processDirectoryBtn = document.getElementById('processDirectoryBtn');
 const saveVectorStoreBtn = document.getElementById('saveVectorStoreBtn');
 const loadVectorStoreBtn = document.getElementById('loadVectorStoreBtn');
+const collectionInput = document.getElementById('collectionName');
 const chatInput = document.getElementById('chatInput');
 const sendBtn = document.getElementById('sendBtn');
 const clearChatBtn = document.getElementById('clearChatBtn');
@@ -46,6 +47,7 @@ function initializeEventListeners() {
     // Vector store management
     saveVectorStoreBtn.addEventListener('click', saveVectorStore);
     loadVectorStoreBtn.addEventListener('click', loadVectorStore);
+    collectionInput.addEventListener('change', loadStats);
     
     // Chat
     sendBtn.addEventListener('click', sendMessage);
@@ -67,6 +69,15 @@ function initializeEventListeners() {
     loadStats();
 }
 
+// Collection Management
+function currentCollection() {
+    return collectionInput.value.trim() || 'default';
+}
+
+function collectionQuery() {
+    return `?collection=${encodeURIComponent(currentCollection())}`;
+}
+
 async function loadInitialState() {
     try {
         await loadStats();
@@ -126,7 +137,9 @@ async function uploadFiles() {
         return;
     }
     
+    // Fields go first so the server can start processing files while later ones upload
     const formData = new FormData();
+    formData.append('collection', currentCollection());
     for (let i = 0; i < files.length; i++) {
         formData.append('files', files[i]);
     }
@@ -142,12 +155,13 @@ async function uploadFiles() {
         const data = await response.json();
         
         if (response.ok) {
+            const job = await waitForJob(data.job_id, 1000, showJobProgress);
             hideProcessingModal();
-            processingStats = data.stats;
+            processingStats = job.result.stats;
             vectorStoreLoaded = true;
             updateUI();
-            showProcessingSummary(data.stats);
-            showAlert(data.message, 'success');
+            showProcessingSummary(job.result.stats);
+            showAlert(job.result.message, 'success');
             
             // Clear file input
             fileInput.value = '';
@@ -174,6 +188,7 @@ async function processDirectory() {
         
         const formData = new FormData();
         formData.append('directory_path', directoryPath);
+        formData.append('collection', currentCollection());
         
         const response = await fetch(`/process-directory`, {
             method: 'POST',
@@ -183,12 +198,13 @@ async function processDirectory() {
         const data = await response.json();
         
         if (response.ok) {
+            const job = await waitForJob(data.job_id, 1000, showJobProgress);
             hideProcessingModal();
-            processingStats = data.stats;
+            processingStats = job.result.stats;
             vectorStoreLoaded = true;
             updateUI();
-            showProcessingSummary(data.stats);
-            showAlert(data.message, 'success');
+            showProcessingSummary(job.result.stats);
+            showAlert(job.result.message, 'success');
         } else {
             throw new Error(data.detail || 'Failed to process directory');
         }
@@ -198,18 +214,64 @@ async function processDirectory() {
     }
 }
 
+// Background Jobs
+async function waitForJob(jobId, intervalMs = 1000, onProgress = null) {
+    while (true) {
+        const response = await fetch(`/jobs/${jobId}`);
+        const job = await response.json();
+        
+        if (!response.ok) {
+            throw new Error(job.detail || 'Failed to get job status');
+        }
+        if (onProgress && job.progress) {
+            onProgress(job.progress);
+        }
+        if (job.status === 'completed') {
+            return job;
+        }
+        if (job.status === 'failed') {
+            throw new Error(job.error || 'Background job failed');
+        }
+        
+        await new Promise(resolve => setTimeout(resolve, intervalMs));
+    }
+}
+
+const JOB_STAGE_LABELS = {
+    parse: 'Parsing files',
+    embed: 'Embedding chunks',
+    index: 'Indexing chunks'
+};
+
+function showJobProgress(progress) {
+    const stage = progress.stages[progress.stage];
+    if (!stage) {
+        return;
+    }
+    
+    let message = `${JOB_STAGE_LABELS[progress.stage] || progress.stage}: ${stage.done} / ${stage.total}`;
+    if (stage.per_second) {
+        message += ` (${stage.per_second}/s)`;
+    }
+    if (stage.eta_seconds) {
+        message += ` - about ${Math.ceil(stage.eta_seconds)}s left`;
+    }
+    document.getElementById('processingMessage').textContent = message;
+}
+
 // Vector Store Management
 async function saveVectorStore() {
     try {
         showLoading(true);
         
-        const response = await fetch(`/save-vector-store`, {
+        const response = await fetch(`/save-vector-store${collectionQuery()}`, {
             method: 'POST'
         });
         
         const data = await response.json();
         
         if (response.ok) {
+            await waitForJob(data.job_id);
             showAlert('Vector store saved successfully!', 'success');
         } else {
             throw new Error(data.detail || 'Failed to save vector store');
@@ -225,15 +287,16 @@ async function loadVectorStore() {
     try {
         showLoading(true);
         
-        const response = await fetch(`/load-vector-store`, {
+        const response = await fetch(`/load-vector-store${collectionQuery()}`, {
             method: 'POST'
         });
         
         const data = await response.json();
         
         if (response.ok) {
+            const job = await waitForJob(data.job_id);
             vectorStoreLoaded = true;
-            processingStats = data.stats || {};
+            processingStats = (job.result && job.result.stats) || {};
             updateUI();
             showAlert('Vector store loaded successfully!', 'success');
         } else {
@@ -263,21 +326,37 @@ async function sendMessage() {
     sendBtn.disabled = true;
     
     try {
-        const response = await fetch(`/chat`, {
+        const response = await fetch(`/chat/stream`, {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
             },
-            body: JSON.stringify({ message: message })
+            body: JSON.stringify({ message: message, collection: currentCollection() })
         });
         
-        const data = await response.json();
-        
-        if (response.ok) {
-            addMessageToChat('assistant', data.response, data.citations, data.themes);
-        } else {
+        if (!response.ok) {
+            const data = await response.json();
             throw new Error(data.detail || 'Failed to get response');
         }
+        
+        // Citations arrive first, then the answer token by token, then themes
+        const messageDiv = addMessageToChat('assistant', '');
+        const bubbleDiv = messageDiv.querySelector('.message-bubble');
+        let responseText = '';
+        
+        await readEventStream(response, (event, data) => {
+            if (event === 'citations' && data.length > 0) {
+                messageDiv.appendChild(createCitationsSection(data));
+            } else if (event === 'token') {
+                responseText += data.text;
+                bubbleDiv.innerHTML = formatMessage(responseText);
+            } else if (event === 'themes' && data.themes && data.themes.length > 0) {
+                messageDiv.appendChild(createThemesSection(data));
+            }
+            chatMessages.scrollTop = chatMessages.scrollHeight;
+        });
+        
+        addCopyButtonsToCodeBlocks(messageDiv);
     } catch (error) {
         addMessageToChat('assistant', `Error: ${error.message}`);
     } finally {
@@ -287,6 +366,39 @@ async function sendMessage() {
     }
 }
 
+async function readEventStream(response, onEvent) {
+    // Parse a server-sent event stream from a fetch response body
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    
+    while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const rawEvent = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+            
+            let event = 'message';
+            const dataLines = [];
+            rawEvent.split('\n').forEach(line => {
+                if (line.startsWith('event: ')) {
+                    event = line.slice(7);
+                } else if (line.startsWith('data: ')) {
+                    dataLines.push(line.slice(6));
+                }
+            });
+            
+            if (dataLines.length > 0) {
+                onEvent(event, JSON.parse(dataLines.join('\n')));
+            }
+        }
+    }
+}
+
 async function clearChatHistory() {
     try {
         // Show confirmation dialog
@@ -295,7 +407,7 @@ async function clearChatHistory() {
         }
         
         // Call the backend API to clear chat history
-        const response = await fetch(`/clear-chat`, {
+        const response = await fetch(`/clear-chat${collectionQuery()}`, {
             method: 'DELETE',
         });
         
@@ -378,6 +490,8 @@ function addMessageToChat(role, content, citations = null, themes = null) {
     
     // Add copy buttons to code blocks after DOM insertion
     addCopyButtonsToCodeBlocks(messageDiv);
+    
+    return messageDiv;
 }
 
 function createCitationsSection(citations) {
@@ -458,7 +572,7 @@ function createThemesSection(themes) {
 // Stats Management
 async function loadStats() {
     try {
-        const response = await fetch(`/stats`);
+        const response = await fetch(`/stats${collectionQuery()}`);
         const data = await response.json();
         
         if (response.ok) {
@@ -0,0 +1,123 @@
+# Semantic cache of chat answers
+# This file contains the cache EnhancedDocumentProcessor uses to skip LLM calls for reworded questions
+
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from rag_elements.config import Config
+
+
+class SemanticAnswerCache:
+    """
+    Cache answers keyed by query embedding and the chunks retrieved for the query.
+
+    A lookup hits when a cached query is at least as similar as the threshold (cosine)
+    and was answered from the same set of chunks. Entries expire after a TTL, the least
+    recently used entries are evicted beyond the size limit, and the whole cache is
+    dropped when the vector store version it was filled against changes.
+    """
+
+    def __init__(self, similarity_threshold: float = Config.ANSWER_CACHE_SIMILARITY_THRESHOLD,
+                 max_entries: int = Config.ANSWER_CACHE_MAX_ENTRIES,
+                 ttl_seconds: float = Config.ANSWER_CACHE_TTL_SECONDS):
+        self.similarity_threshold = similarity_threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+
+        self._entries: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._next_id = 0
+        self._store_version = None
+        self._lock = threading.Lock()
+
+        # Row-stacked unit vectors of the entries, rebuilt lazily after changes
+        self._matrix = None
+        self._matrix_ids: List[int] = []
+
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _normalize(vector: List[float]) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _check_version(self, store_version: int) -> bool:
+        """
+        Drop every entry if the vector store changed. Caller holds the lock.
+
+        Returns False for callers that searched an older version than the cache holds.
+        """
+        if self._store_version is None or store_version > self._store_version:
+            self._entries.clear()
+            self._matrix = None
+            self._store_version = store_version
+        return store_version == self._store_version
+
+    def _expire(self):
+        """Drop entries older than the TTL. Caller holds the lock."""
+        cutoff = time.monotonic() - self.ttl_seconds
+        expired = [entry_id for entry_id, entry in self._entries.items() if entry["created_at"] < cutoff]
+        for entry_id in expired:
+            del self._entries[entry_id]
+        if expired:
+            self._matrix = None
+
+    def get(self, query_vector: List[float], chunk_ids: List[str], store_version: int) -> Optional[Dict[str, Any]]:
+        """Return the cached answer and themes for a similar query over the same chunks, if any."""
+        with self._lock:
+            current = self._check_version(store_version)
+            self._expire()
+
+            if current and self._entries:
+                if self._matrix is None:
+                    self._matrix_ids = list(self._entries)
+                    self._matrix = np.stack([self._entries[entry_id]["vector"] for entry_id in self._matrix_ids])
+
+                similarities = self._matrix @ self._normalize(query_vector)
+                wanted = frozenset(chunk_ids)
+                for row in np.argsort(-similarities):
+                    if similarities[row] < self.similarity_threshold:
+                        break
+                    entry_id = self._matrix_ids[row]
+                    entry = self._entries[entry_id]
+                    if entry["chunk_ids"] == wanted:
+                        self._entries.move_to_end(entry_id)
+                        self.hits += 1
+                        return {"response": entry["response"], "themes": entry["themes"]}
+
+            self.misses += 1
+            return None
+
+    def put(self, query_vector: List[float], chunk_ids: List[str], store_version: int,
+            response: str, themes: Dict[str, Any]):
+        """Cache the answer and themes generated for a query."""
+        with self._lock:
+            if not self._check_version(store_version):
+                return
+
+            self._entries[self._next_id] = {
+                "vector": self._normalize(query_vector),
+                "chunk_ids": frozenset(chunk_ids),
+                "response": response,
+                "themes": themes,
+                "created_at": time.monotonic()
+            }
+            self._next_id += 1
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._matrix = None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,392 @@
+# Registry of named vector store collections
+# Collections live on disk under Config.COLLECTIONS_DIR and are loaded lazily into a memory-bounded LRU
+
+import os
+import re
+import time
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Any, Tuple
+
+from rag_elements.config import Config
+from rag_elements.enhanced_vectordb import EnhancedDocumentProcessor
+from rag_elements import snapshot_store
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-worker deployments only
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class CollectionRegistry:
+    """
+    Named collections, each backed by its own EnhancedDocumentProcessor.
+
+    Collections are loaded from disk on first use and kept in an LRU whose total
+    estimated size stays under the memory budget. Evicting a collection with
+    unsaved changes saves it first, so nothing is lost when it goes cold.
+
+    Several worker processes can share the same collections directory: a loaded
+    collection is reloaded when another worker publishes a newer snapshot of it,
+    unless this worker holds unsaved changes to it.
+
+    A collection belonging to a session is keyed "<session_id>/<name>" (see session_key)
+    and saved under the session's own directory; every other method takes such keys
+    wherever it takes a collection name.
+    """
+
+    def __init__(self, processor_factory: Callable[[], EnhancedDocumentProcessor],
+                 root_dir: str = Config.COLLECTIONS_DIR,
+                 memory_budget_mb: float = Config.COLLECTION_MEMORY_BUDGET_MB):
+        self.processor_factory = processor_factory
+        self.root_dir = root_dir
+        self.memory_budget_bytes = int(memory_budget_mb * 1024 * 1024)
+
+        self._loaded: "OrderedDict[str, EnhancedDocumentProcessor]" = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._dirty = set()
+        self._evicting: Dict[str, EnhancedDocumentProcessor] = {}
+        self._loading_locks: Dict[str, threading.Lock] = {}
+        self._writers: Dict[str, int] = {}
+        self._checked: Dict[str, float] = {}
+        self._lock = threading.RLock()
+        # Names of the collections whose publish lock the current thread holds
+        self._held_publish_locks = threading.local()
+
+    def validate_name(self, name: str) -> str:
+        """Return the name if it is a valid collection name, otherwise raise ValueError."""
+        if not re.match(Config.COLLECTION_NAME_PATTERN, name or ""):
+            raise ValueError(f"Invalid collection name: '{name}'")
+        return name
+
+    def session_key(self, session_id: str, name: str) -> str:
+        """Get the key of a session's collection, raising ValueError for invalid names."""
+        if not re.match(Config.SESSION_ID_PATTERN, session_id or ""):
+            raise ValueError("Invalid session ID")
+        return f"{session_id}/{self.validate_name(name)}"
+
+    @staticmethod
+    def split_key(key: str) -> Tuple[Optional[str], str]:
+        """Split a collection key into its session ID (None for shared collections) and name."""
+        session_id, _, name = key.rpartition("/")
+        return session_id or None, name
+
+    def _validate_key(self, key: str) -> str:
+        session_id, name = self.split_key(key or "")
+        return self.session_key(session_id, name) if session_id else self.validate_name(name)
+
+    def _directory(self, session_id: Optional[str] = None) -> str:
+        """Directory holding a session's collections, or the shared ones."""
+        if session_id:
+            return os.path.join(self.root_dir, Config.SESSIONS_DIR, session_id)
+        return self.root_dir
+
+    def path_for(self, name: str) -> str:
+        """Get the on-disk location of a collection."""
+        session_id, name = self.split_key(self._validate_key(name))
+        return os.path.join(self._directory(session_id), name)
+
+    def is_loaded(self, name: str) -> bool:
+        with self._lock:
+            processor = self._loaded.get(name) or self._evicting.get(name)
+            return processor is not None and processor.vector_store is not None
+
+    def vector_store_exists(self, name: str) -> bool:
+        """Check whether a collection is saved on disk."""
+        return EnhancedDocumentProcessor.vector_store_exists(self.path_for(name))
+
+    def exists(self, name: str) -> bool:
+        """Check whether a collection is loaded or saved on disk."""
+        return self.is_loaded(name) or self.vector_store_exists(name)
+
+    def _lookup(self, name: str) -> Optional[EnhancedDocumentProcessor]:
+        """Find an in-memory collection and mark it recently used. Caller holds the lock."""
+        if name in self._evicting:
+            # Still being spilled to disk; the in-memory copy is the newest one
+            self._loaded[name] = self._evicting.pop(name)
+            self._sizes[name] = self._loaded[name].estimate_memory_bytes()
+            self._dirty.add(name)
+
+        if name in self._loaded:
+            self._loaded.move_to_end(name)
+            return self._loaded[name]
+        return None
+
+    def get(self, name: str, create: bool = False) -> Optional[EnhancedDocumentProcessor]:
+        """
+        Get the processor for a collection, loading it from disk on first use.
+
+        Returns None if the collection does not exist and create is False.
+        """
+        self._validate_key(name)
+        with self._lock:
+            processor = self._lookup(name)
+        if processor and self._is_stale(name, processor):
+            logger.info(f"Reloading collection '{name}': another worker published a newer snapshot")
+            processor = self.load(name) or processor
+
+        with self._lock:
+            processor = processor or self._lookup(name)
+            if processor:
+                return processor
+            loading_lock = self._loading_locks.setdefault(name, threading.Lock())
+
+        # Load outside the registry lock so other collections stay available meanwhile
+        with loading_lock:
+            with self._lock:
+                processor = self._lookup(name)
+                if processor:
+                    return processor
+
+            path = self.path_for(name)
+            if EnhancedDocumentProcessor.vector_store_exists(path):
+                logger.info(f"Loading collection '{name}' from {path}")
+                processor = self.processor_factory()
+                processor.load_vector_store(path)
+            elif create:
+                processor = self.processor_factory()
+            else:
+                return None
+
+            self._install(name, processor)
+            return processor
+
+    def _is_stale(self, name: str, processor: EnhancedDocumentProcessor, force: bool = False) -> bool:
+        """
+        Whether disk holds a newer snapshot of a collection than memory.
+
+        Unless forced, disk is checked at most every Config.SNAPSHOT_RELOAD_CHECK_SECONDS
+        and not while the collection is being changed.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if name in self._dirty:
+                return False
+            if not force and (self._writers.get(name)
+                              or now - self._checked.get(name, 0) < Config.SNAPSHOT_RELOAD_CHECK_SECONDS):
+                return False
+            self._checked[name] = now
+
+        version = snapshot_store.read_current_version(self.path_for(name))
+        return version is not None and version != processor.snapshot_version
+
+    def _held_locks(self) -> set:
+        if not hasattr(self._held_publish_locks, "names"):
+            self._held_publish_locks.names = set()
+        return self._held_publish_locks.names
+
+    @contextmanager
+    def _publish_lock(self, name: str, blocking: bool = True):
+        """
+        Serialize changes to and saves of a collection across worker processes.
+
+        Re-entrant within a thread. Yields whether the lock is held, which is only
+        False when a non-blocking attempt finds it taken.
+        """
+        held = self._held_locks()
+        if name in held or fcntl is None:
+            yield True
+            return
+        directory, collection = os.path.split(self.path_for(name))
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, f".{collection}.lock"), "w") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            held.add(name)
+            try:
+                yield True
+            finally:
+                held.discard(name)
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @contextmanager
+    def writing(self, name: str, create: bool = False):
+        """
+        Get a collection's processor in order to change it.
+
+        Reloads of the collection are held off until the change is done. With
+        Config.PUBLISH_ON_WRITE, writers in every worker take turns, each starts from
+        the newest published snapshot and publishes its change as a new snapshot.
+        """
+        with self._lock:
+            self._writers[name] = self._writers.get(name, 0) + 1
+        try:
+            with self._publish_lock(name):
+                with self._lock:
+                    processor = self._lookup(name)
+                if processor and Config.PUBLISH_ON_WRITE and self._is_stale(name, processor, force=True):
+                    self.load(name)
+
+                processor = self.get(name, create=create)
+                yield processor
+                if Config.PUBLISH_ON_WRITE and processor and processor.vector_store:
+                    self.save(name)
+        finally:
+            with self._lock:
+                self._writers[name] -= 1
+                if not self._writers[name]:
+                    del self._writers[name]
+
+    def load(self, name: str) -> Optional[EnhancedDocumentProcessor]:
+        """
+        Reload a collection from disk, discarding its in-memory state.
+
+        The new store is built off to the side; the collection keeps serving from
+        its current state until the loaded one is swapped in.
+        """
+        path = self.path_for(name)
+        if not EnhancedDocumentProcessor.vector_store_exists(path):
+            return None
+
+        processor = self.processor_factory()
+        if not processor.load_vector_store(path):
+            return None
+
+        with self._lock:
+            self._evicting.pop(name, None)
+            self._dirty.discard(name)
+        self._install(name, processor)
+        return processor
+
+    def _install(self, name: str, processor: EnhancedDocumentProcessor):
+        """Put a processor in the LRU and evict cold collections if over budget."""
+        with self._lock:
+            self._loaded[name] = processor
+            self._loaded.move_to_end(name)
+            self._sizes[name] = processor.estimate_memory_bytes()
+            victims = self._select_victims(keep=name)
+        self._spill(victims)
+
+    def mark_updated(self, name: str):
+        """Record that a collection's vector store changed in memory."""
+        with self._lock:
+            if name not in self._loaded:
+                return
+            self._dirty.add(name)
+            self._sizes[name] = self._loaded[name].estimate_memory_bytes()
+            victims = self._select_victims(keep=name)
+        self._spill(victims)
+
+    def save(self, name: str):
+        """Save a loaded collection to disk, taking turns with writers in other workers."""
+        with self._lock:
+            processor = self._loaded.get(name) or self._evicting.get(name)
+            if not processor or not processor.vector_store:
+                raise ValueError(f"Collection '{name}' has no vector store to save")
+            # Changes made while saving mark the collection dirty again
+            self._dirty.discard(name)
+
+        path = self.path_for(name)
+        os.makedirs(path, exist_ok=True)
+        with self._publish_lock(name):
+            saved = processor.save_vector_store(path)
+        if not saved:
+            with self._lock:
+                self._dirty.add(name)
+            raise RuntimeError(f"Failed to save collection '{name}'")
+
+    def unload(self, name: str, save: bool = True):
+        """Drop a collection from memory, saving unsaved changes first unless save is False."""
+        with self._lock:
+            processor = self._loaded.pop(name, None)
+            self._sizes.pop(name, None)
+            dirty = name in self._dirty
+            self._dirty.discard(name)
+            if processor and save and dirty:
+                self._evicting[name] = processor
+
+        if processor and save and dirty:
+            self._spill([(name, processor)])
+        elif processor:
+            logger.info(f"Unloaded collection '{name}'")
+
+    def clear(self, save: bool = True):
+        """
+        Unload every collection.
+
+        Each collection is unloaded under its publish lock, so one being changed (see
+        writing) is unloaded after its writer has recorded the change, not while the
+        writer still holds a processor the registry has dropped.
+        """
+        with self._lock:
+            names = list(self._loaded)
+        for name in names:
+            with self._publish_lock(name):
+                self.unload(name, save=save)
+
+    def _select_victims(self, keep: Optional[str] = None) -> List[Tuple[str, EnhancedDocumentProcessor]]:
+        """
+        Remove least recently used collections until the memory budget is met.
+
+        Caller holds the lock. Victims with unsaved changes are returned for spilling.
+        """
+        victims = []
+        while sum(self._sizes.values()) > self.memory_budget_bytes:
+            victim = next((name for name in self._loaded if name != keep), None)
+            if victim is None:
+                break
+            logger.info(f"Evicting collection '{victim}' to stay within the memory budget")
+            processor = self._loaded.pop(victim)
+            self._sizes.pop(victim, None)
+            if victim in self._dirty:
+                self._dirty.discard(victim)
+                self._evicting[victim] = processor
+                victims.append((victim, processor))
+        return victims
+
+    def _spill(self, victims: List[Tuple[str, EnhancedDocumentProcessor]]):
+        """
+        Save evicted collections to disk outside the registry lock.
+
+        A thread already holding another collection's publish lock does not wait for a
+        victim's, since two workers doing so in opposite order would deadlock; a victim
+        it cannot lock stays loaded until the next eviction.
+        """
+        blocking = not self._held_locks()
+        for name, processor in victims:
+            path = self.path_for(name)
+            os.makedirs(path, exist_ok=True)
+            with self._publish_lock(name, blocking=blocking) as locked:
+                saved = locked and processor.save_vector_store(path)
+
+            with self._lock:
+                if self._evicting.get(name) is processor:
+                    if saved:
+                        self._evicting.pop(name)
+                        logger.info(f"Unloaded collection '{name}' after saving it")
+                    else:
+                        # Keep it in memory rather than lose unsaved changes
+                        logger.error(f"Could not spill collection '{name}' to disk; keeping it loaded")
+                        self._evicting.pop(name)
+                        self._loaded[name] = processor
+                        self._sizes[name] = processor.estimate_memory_bytes()
+                        self._dirty.add(name)
+
+    def list_collections(self, session_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """List a session's collections, or the shared ones, on disk and in memory."""
+        prefix = f"{session_id}/" if session_id else ""
+        directory = self._directory(session_id)
+        with self._lock:
+            keys = {key for key in set(self._loaded) | set(self._evicting) if self.split_key(key)[0] == session_id}
+            if os.path.isdir(directory):
+                keys.update(
+                    prefix + entry for entry in os.listdir(directory)
+                    if EnhancedDocumentProcessor.vector_store_exists(os.path.join(directory, entry))
+                )
+
+            return [
+                {
+                    "name": self.split_key(key)[1],
+                    "loaded": key in self._loaded,
+                    "unsaved_changes": key in self._dirty or key in self._evicting,
+                    "memory_bytes": self._sizes.get(key, 0)
+                }
+                for key in sorted(keys)
+            ]
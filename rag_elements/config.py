@@ -1,6 +1,25 @@
 # Configuration file for Enhanced Vector Database
 # This file contains all configurable parameters for the EnhancedDocumentProcessor
 
+import os
+import sys
+
+
+def _server_workers() -> int:
+    """Worker processes the server runs: its --workers (-w) option, else WEB_CONCURRENCY like uvicorn."""
+    # Workers spawned by uvicorn and forked by gunicorn keep the server's command line
+    args = sys.argv[1:]
+    for i, arg in enumerate(args):
+        if arg.startswith("--workers="):
+            value = arg.split("=", 1)[1]
+        elif arg in ("--workers", "-w") and i + 1 < len(args):
+            value = args[i + 1]
+        else:
+            continue
+        return int(value) if value.isdigit() else 1
+    return int(os.getenv("WEB_CONCURRENCY", "1"))
+
+
 # Model Configuration
 class Config: 
     # Model Names
@@ -13,9 +32,30 @@ class Config:
     CHUNK_OVERLAP = 100
     CHUNK_SEPARATORS = ["\n\n", "\n", ". ", "! ", "? ", " ", ""]
 
+    # Near-Duplicate Detection Configuration
+    ENABLE_NEAR_DUPLICATE_DETECTION = True
+    NEAR_DUPLICATE_THRESHOLD = 0.9
+    MINHASH_NUM_PERM = 128
+    LSH_BANDS = 16
+    SHINGLE_SIZE = 5
+
     # Search Configuration
     DEFAULT_SEARCH_K = 5
 
+    # Diversity Re-ranking (MMR) Configuration
+    ENABLE_MMR_RERANKING = False
+    # With cross-encoder re-ranking on, MMR picks the final results from the re-ranked candidates
+    MMR_FETCH_K = 20
+    MMR_LAMBDA = 0.5
+
+    # Cross-Encoder Re-ranking Configuration
+    ENABLE_CROSS_ENCODER_RERANKING = False
+    CROSS_ENCODER_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+    RERANK_TOP_N = 20
+    RERANK_BATCH_SIZE = 8
+    RERANK_TIME_BUDGET_MS = 300
+    RERANK_CACHE_SIZE = 4096
+
     # Logging Configuration
     LOG_LEVEL = "INFO"
     LOG_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
@@ -54,10 +94,133 @@ class Config:
     }}
     """
 
+    # "llm" asks the chat model for themes; "local" clusters the retrieved chunk vectors instead;
+    # "corpus" looks up the corpus theme map built at ingestion (falling back to "local" without one)
+    THEME_ANALYSIS_MODE = "llm"
+    LOCAL_THEME_MAX_CLUSTERS = 3
+    LOCAL_THEME_KEYPHRASES = 3
+    KMEANS_MAX_ITERATIONS = 25
+
+    # Corpus Theme Map Configuration
+    ENABLE_CORPUS_THEME_MAP = False
+    CORPUS_THEME_CLUSTERS = 12
+    CORPUS_THEME_SAMPLE_SIZE = 20000
+
     # File Processing Configuration
     ENABLE_RECURSIVE_DIRECTORY_PROCESSING = True
     MAX_CONTENT_LENGTH_FOR_THEME_ANALYSIS = 10000
 
+    # LLM Provider Configuration
+    # "groq" calls the GROQ API; "fake" is a deterministic offline stand-in for development and load tests
+    LLM_PROVIDER = os.getenv("LLM_PROVIDER", "groq")
+    FAKE_LLM_LATENCY_MS = float(os.getenv("FAKE_LLM_LATENCY_MS", "300"))
+    FAKE_LLM_TOKENS_PER_SECOND = float(os.getenv("FAKE_LLM_TOKENS_PER_SECOND", "80"))
+    FAKE_LLM_ERROR_RATE = float(os.getenv("FAKE_LLM_ERROR_RATE", "0"))
+    FAKE_LLM_SEED = int(os.getenv("FAKE_LLM_SEED", "42"))
+    FAKE_LLM_RESPONSE_WORDS = 120
+    # "sentence-transformers" or "fake" (deterministic hash embeddings, no model download)
+    EMBEDDINGS_PROVIDER = os.getenv("EMBEDDINGS_PROVIDER", "sentence-transformers")
+    FAKE_EMBEDDING_SIZE = 384
+
+    # LLM Gateway Configuration
+    LLM_BASE_URL = os.getenv("GROQ_BASE_URL")  # point at a local stub server for testing
+    LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+    # Request rate and burst of the whole server; each worker process gets an equal share (SERVER_WORKERS)
+    LLM_REQUESTS_PER_MINUTE = float(os.getenv("LLM_REQUESTS_PER_MINUTE", "30"))
+    LLM_BURST = int(os.getenv("LLM_BURST", "5"))
+    LLM_MAX_RETRIES = 3
+    LLM_BASE_BACKOFF_SECONDS = 0.5
+    LLM_MAX_BACKOFF_SECONDS = 20
+    LLM_REQUEST_TIMEOUT_SECONDS = 60
+    LLM_SEMAPHORE_POLL_SECONDS = 0.01
+    LLM_METRICS_WINDOW = 1000
+
+    # Concurrent Generation Configuration
+    THEME_ANALYSIS_TIMEOUT_SECONDS = 20
+    RESPONSE_GENERATION_TIMEOUT_SECONDS = 90
+
+    # Context Packing Configuration
+    CONTEXT_TOKEN_BUDGET = 3000
+    CONTEXT_TOKENIZER_ENCODING = "cl100k_base"
+    CHARS_PER_TOKEN_ESTIMATE = 4
+    MIN_OVERLAP_CHARS = 20
+    MIN_TRUNCATED_BLOCK_TOKENS = 64
+
+    # Context Compression Configuration
+    ENABLE_CONTEXT_COMPRESSION = False
+    COMPRESSION_MAX_SENTENCES = 12
+
+    # Semantic Answer Cache Configuration
+    ENABLE_ANSWER_CACHE = True
+    ANSWER_CACHE_SIMILARITY_THRESHOLD = 0.95
+    ANSWER_CACHE_MAX_ENTRIES = 512
+    ANSWER_CACHE_TTL_SECONDS = 3600
+
+    # Deletion and Compaction Configuration
+    ENABLE_BACKGROUND_COMPACTION = True
+    COMPACTION_DEAD_RATIO_THRESHOLD = 0.2
+    # Each ingestion adds an index segment that searches visit separately; compaction merges them
+    COMPACTION_MAX_SEGMENTS = 32
+
+    # Collection Registry Configuration
+    COLLECTIONS_DIR = "collections"
+    DEFAULT_COLLECTION_NAME = "default"
+    COLLECTION_NAME_PATTERN = r"^[A-Za-z0-9_-]{1,64}$"
+    COLLECTION_MEMORY_BUDGET_MB = 2048
+
+    # Session Configuration
+    # Each client gets its own collections, chat history and jobs, keyed by a session token it
+    # sends in the header or cookie below; sessions' collections share the collection memory budget
+    SESSION_ISOLATION = os.getenv("SESSION_ISOLATION", "true").lower() == "true"
+    SESSION_HEADER = "X-Session-ID"
+    SESSION_COOKIE_NAME = "rag_session"
+    SESSION_COOKIE_MAX_AGE_SECONDS = 30 * 24 * 3600
+    SESSION_ID_PATTERN = r"^[A-Za-z0-9_-]{16,64}$"
+    SESSIONS_DIR = "sessions"  # under COLLECTIONS_DIR
+
+    # Snapshot Configuration
+    SNAPSHOT_KEEP_VERSIONS = 3
+
+    # Shared State Configuration
+    # Settings, statistics, chat history and job status live in SQLite so every uvicorn worker sees the same state
+    SERVER_WORKERS = _server_workers()
+    SHARED_STATE_DB_PATH = os.getenv("SHARED_STATE_DB_PATH", os.path.join(COLLECTIONS_DIR, "shared_state.sqlite3"))
+    SHARED_STATE_BUSY_TIMEOUT_SECONDS = 10
+    # The API key set through any worker is picked up by the others within this many seconds
+    SHARED_SETTINGS_CHECK_SECONDS = 2.0
+    # Oldest exchanges beyond this are dropped; /chat-history returns the rest in pages
+    MAX_CHAT_HISTORY_ENTRIES = 1000
+    CHAT_HISTORY_PAGE_SIZE = 50
+    CHAT_HISTORY_MAX_PAGE_SIZE = 500
+    JOB_PROGRESS_PUBLISH_SECONDS = 0.5
+    # Loaded collections are reloaded when another worker publishes a newer snapshot; checked at most this often
+    SNAPSHOT_RELOAD_CHECK_SECONDS = 1.0
+    # With several workers (--workers or WEB_CONCURRENCY), every change is published as a snapshot right away
+    PUBLISH_ON_WRITE = os.getenv("PUBLISH_ON_WRITE", str(SERVER_WORKERS > 1)).lower() == "true"
+
+    # Executor Configuration
+    # Embedding, FAISS search and parsing run on the CPU pool; blocking LLM calls and disk loads on the I/O pool
+    CPU_EXECUTOR_WORKERS = int(os.getenv("CPU_EXECUTOR_WORKERS", str(os.cpu_count() or 4)))
+    IO_EXECUTOR_WORKERS = int(os.getenv("IO_EXECUTOR_WORKERS", "32"))
+
+    # Background Job Configuration
+    BACKGROUND_JOB_WORKERS = 2
+    UPLOAD_JOB_WORKERS = int(os.getenv("UPLOAD_JOB_WORKERS", "4"))  # streaming uploads in parallel
+    UPLOAD_IDLE_TIMEOUT_SECONDS = 600  # an upload job gives up when no file completes for this long
+    EMBEDDING_BATCH_SIZE = 64  # chunks embedded between ingestion progress updates
+    MAX_FINISHED_JOBS = 100
+
+    # Metrics Configuration
+    # Per-stage latency histograms served on /metrics; percentiles cover the last METRICS_WINDOW runs of a stage
+    METRICS_LATENCY_BUCKETS_SECONDS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+    METRICS_WINDOW = 1000
+    METRICS_THROUGHPUT_WINDOW_SECONDS = 60
+
+    # Tracing Configuration
+    # When set, every chat request is traced and its spans appended to this JSONL file;
+    # otherwise only requests with "debug": true are traced, and only returned to the caller
+    TRACE_LOG_PATH = os.getenv("TRACE_LOG_PATH") or None
+
     # Metadata Configuration
     ENHANCED_METADATA_FILENAME = "enhanced_metadata.json"
 
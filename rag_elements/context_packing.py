@@ -0,0 +1,149 @@
+# Token-budgeted context packing
+# This file contains the packer that fits search results into the answer prompt
+
+import logging
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from rag_elements.config import Config
+
+logger = logging.getLogger(__name__)
+
+_encoding = None
+_encoding_lock = threading.Lock()
+
+
+class _CharacterEstimate:
+    """Approximate token counts when the tiktoken encoding cannot be loaded (e.g. offline)."""
+
+    def encode(self, text: str) -> List[str]:
+        step = Config.CHARS_PER_TOKEN_ESTIMATE
+        return [text[i:i + step] for i in range(0, len(text), step)]
+
+    def decode(self, tokens: List[str]) -> str:
+        return "".join(tokens)
+
+
+def get_encoding():
+    """Get the shared tokenizer used for context budgeting."""
+    global _encoding
+    with _encoding_lock:
+        if _encoding is None:
+            try:
+                import tiktoken
+                _encoding = tiktoken.get_encoding(Config.CONTEXT_TOKENIZER_ENCODING)
+            except Exception as e:
+                logger.warning(f"Could not load tiktoken encoding '{Config.CONTEXT_TOKENIZER_ENCODING}' ({str(e)}); "
+                               f"estimating tokens from character counts")
+                _encoding = _CharacterEstimate()
+        return _encoding
+
+
+def count_tokens(text: str) -> int:
+    return len(get_encoding().encode(text))
+
+
+def _strip_overlap(previous: str, following: str, max_overlap: int) -> str:
+    """Drop the start of following that repeats the end of previous (text splitter overlap)."""
+    limit = min(len(previous), len(following), max_overlap)
+    for size in range(limit, Config.MIN_OVERLAP_CHARS - 1, -1):
+        if previous.endswith(following[:size]):
+            return following[size:]
+    return following
+
+
+def _citation_label(members: List[Dict[str, Any]]) -> str:
+    """Citation for a block of one or more adjacent chunks."""
+    if len(members) == 1:
+        return members[0]["citation"]
+    first, last = members[0], members[-1]
+    name = Path(first.get("source", "Unknown")).name
+    if first.get("page"):
+        return f"{name}, Page {first['page']}, Chunks {first['chunk_index'] + 1}-{last['chunk_index'] + 1}"
+    return f"{name}, Chunks {first['chunk_index'] + 1}-{last['chunk_index'] + 1}"
+
+
+def _merge_adjacent(search_results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Merge results that are consecutive chunks of the same source into single blocks.
+
+    Blocks keep the best (lowest) rank of their members so the packer can prefer them.
+    """
+    groups: Dict[Any, List[Dict[str, Any]]] = {}
+    for rank, result in enumerate(search_results):
+        key = (result.get("source"), result.get("page"))
+        groups.setdefault(key, []).append({**result, "_rank": rank})
+
+    blocks = []
+    for members in groups.values():
+        members.sort(key=lambda member: member.get("chunk_index", 0))
+        run = [members[0]]
+        for member in members[1:]:
+            if member.get("chunk_index", 0) == run[-1].get("chunk_index", 0) + 1:
+                run.append(member)
+            else:
+                blocks.append(run)
+                run = [member]
+        blocks.append(run)
+
+    packed = []
+    for run in blocks:
+        content = run[0]["content"]
+        for previous, member in zip(run, run[1:]):
+            content += " " + _strip_overlap(previous["content"], member["content"], Config.CHUNK_OVERLAP * 2)
+        packed.append({
+            "citation": _citation_label(run),
+            "content": content,
+            "rank": min(member["_rank"] for member in run)
+        })
+
+    packed.sort(key=lambda block: block["rank"])
+    return packed
+
+
+def _truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut text to at most max_tokens, backing off to the last sentence end when there is one."""
+    encoding = get_encoding()
+    truncated = encoding.decode(encoding.encode(text)[:max_tokens])
+    sentence_end = max(truncated.rfind(". "), truncated.rfind(".\n"))
+    if sentence_end > len(truncated) // 2:
+        truncated = truncated[:sentence_end + 1]
+    return truncated + " ..."
+
+
+def pack_context(search_results: List[Dict[str, Any]],
+                 token_budget: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Fit search results into a token budget for the answer prompt.
+
+    Adjacent chunks of a source are merged with their overlap removed, then blocks are
+    added best-ranked first until the budget is spent; the block that does not fit is
+    truncated if enough room is left. Returns blocks with "citation" and "content".
+    """
+    token_budget = token_budget or Config.CONTEXT_TOKEN_BUDGET
+    remaining = token_budget
+    packed = []
+
+    for block in _merge_adjacent(search_results):
+        tokens = count_tokens(block["content"])
+        if tokens <= remaining:
+            packed.append(block)
+            remaining -= tokens
+        elif remaining >= Config.MIN_TRUNCATED_BLOCK_TOKENS:
+            packed.append({**block, "content": _truncate_to_tokens(block["content"], remaining)})
+            remaining = 0
+        if remaining < Config.MIN_TRUNCATED_BLOCK_TOKENS:
+            break
+
+    logger.info(f"Packed {len(search_results)} results into {len(packed)} blocks "
+                f"using {token_budget - remaining} of {token_budget} context tokens")
+    return packed
+
+
+def format_context(search_results: List[Dict[str, Any]], token_budget: Optional[int] = None) -> str:
+    """Pack search results and render them as numbered document excerpts."""
+    return "\n\n".join(
+        f"Document {i+1} ({block['citation']}):\n{block['content']}"
+        for i, block in enumerate(pack_context(search_results, token_budget))
+    )
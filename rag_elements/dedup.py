@@ -0,0 +1,92 @@
+# Near-duplicate detection for document chunks
+# This file contains the MinHash/LSH detector EnhancedDocumentProcessor uses to collapse near-duplicate
+# chunks within an ingestion and against the chunks already indexed
+
+import re
+import zlib
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from rag_elements.config import Config
+
+# Prime just above 2**32 so (a * x + b) stays inside uint64 for 32-bit shingle hashes
+_MERSENNE_PRIME = np.uint64(4294967311)
+_MAX_HASH = np.uint64(0xFFFFFFFF)
+
+
+class NearDuplicateDetector:
+    """
+    Detect near-duplicate texts with MinHash signatures and an LSH banding index.
+
+    Each text is fingerprinted from its word shingles; texts sharing an LSH band are
+    compared by estimated Jaccard similarity against the configured threshold.
+    """
+
+    def __init__(self, threshold: float = Config.NEAR_DUPLICATE_THRESHOLD,
+                 num_perm: int = Config.MINHASH_NUM_PERM,
+                 bands: int = Config.LSH_BANDS,
+                 shingle_size: int = Config.SHINGLE_SIZE,
+                 seed: int = 1):
+        if num_perm % bands != 0:
+            raise ValueError("MINHASH_NUM_PERM must be divisible by LSH_BANDS")
+
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, 2**32 - 1, size=num_perm, dtype=np.uint64)
+        self._b = rng.randint(0, 2**32 - 1, size=num_perm, dtype=np.uint64)
+
+        self._signatures: List[np.ndarray] = []
+        self._buckets: List[Dict[bytes, List[int]]] = [defaultdict(list) for _ in range(bands)]
+
+    def _shingles(self, text: str) -> np.ndarray:
+        """Hash the word shingles of a text to 32-bit integers."""
+        words = re.findall(r"\w+", text.lower())
+        if len(words) < self.shingle_size:
+            words = words + [""] * (self.shingle_size - len(words))
+
+        hashes = {
+            zlib.crc32(" ".join(words[i:i + self.shingle_size]).encode())
+            for i in range(len(words) - self.shingle_size + 1)
+        }
+        return np.fromiter(hashes, dtype=np.uint64, count=len(hashes))
+
+    def fingerprint(self, text: str) -> np.ndarray:
+        """Compute the MinHash signature of a text (num_perm 32-bit values)."""
+        shingles = self._shingles(text)
+        hashed = (np.outer(shingles, self._a) + self._b) % _MERSENNE_PRIME
+        return np.minimum(hashed, _MAX_HASH).min(axis=0).astype(np.uint32)
+
+    def _band_keys(self, signature: np.ndarray) -> List[bytes]:
+        return [signature[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.bands)]
+
+    def find_duplicate(self, signature: np.ndarray,
+                       ignore: Optional[Callable[[int], bool]] = None) -> Optional[int]:
+        """Return the id of an indexed near-duplicate of the signature, if any, skipping ids ignore() rejects."""
+        candidates = set()
+        for band, key in enumerate(self._band_keys(signature)):
+            candidates.update(self._buckets[band].get(key, ()))
+
+        best_id, best_similarity = None, self.threshold
+        for candidate in candidates:
+            if ignore and ignore(candidate):
+                continue
+            similarity = float(np.mean(self._signatures[candidate] == signature))
+            if similarity >= best_similarity:
+                best_id, best_similarity = candidate, similarity
+
+        return best_id
+
+    def add(self, signature: np.ndarray) -> int:
+        """Index a signature and return its id."""
+        signature_id = len(self._signatures)
+        self._signatures.append(signature)
+        for band, key in enumerate(self._band_keys(signature)):
+            self._buckets[band][key].append(signature_id)
+        return signature_id
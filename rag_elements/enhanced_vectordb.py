@@ -1,26 +1,42 @@
 import os
 import base64
+import asyncio
 import logging
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, Optional, Tuple, Callable
 from pathlib import Path
 import json
 import hashlib
+import threading
+import time
+import uuid
 from datetime import datetime
 
 # LangChain imports
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.embeddings import SentenceTransformerEmbeddings
+from langchain_community.embeddings import SentenceTransformerEmbeddings, DeterministicFakeEmbedding
 from langchain_community.vectorstores import FAISS
+from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain.schema import Document
 from langchain_community.document_loaders import PyPDFLoader
-from langchain_groq import ChatGroq
 from langchain.schema.messages import HumanMessage
 
 # Additional imports
 from dotenv import load_dotenv
 import re
+import numpy as np
+import faiss
 
 from rag_elements.config import Config
+from rag_elements.dedup import NearDuplicateDetector
+from rag_elements.segmented_index import SegmentedIndex
+from rag_elements.reranking import maximal_marginal_relevance, scaled_scores, with_rerank_score, CrossEncoderReranker
+from rag_elements.answer_cache import SemanticAnswerCache
+from rag_elements.llm_gateway import get_llm_gateway
+from rag_elements.llm_providers import provider_requires_api_key
+from rag_elements.themes import local_theme_analysis, build_theme_map, assign_clusters, corpus_theme_analysis, recount_theme_map
+from rag_elements.metrics import pipeline_metrics
+from rag_elements.tracing import annotate, token_usage, traced
+from rag_elements import snapshot_store
 
 # Load environment variables
 load_dotenv()
@@ -29,6 +45,61 @@ load_dotenv()
 logging.basicConfig(level=getattr(logging, Config.LOG_LEVEL), format=Config.LOG_FORMAT)
 logger = logging.getLogger(__name__)
 
+# Progress reports from long ingestion stages: callback(stage, done, total)
+ProgressCallback = Callable[[str, int, int], None]
+
+# Process-wide models shared by every processor instance
+_shared_models = {}
+_shared_models_lock = threading.Lock()
+
+
+def get_shared_embeddings() -> SentenceTransformerEmbeddings:
+    """Return the process-wide embedding model, loading it on first use."""
+    with _shared_models_lock:
+        if "embeddings" not in _shared_models:
+            if Config.EMBEDDINGS_PROVIDER == "fake":
+                _shared_models["embeddings"] = DeterministicFakeEmbedding(size=Config.FAKE_EMBEDDING_SIZE)
+            else:
+                _shared_models["embeddings"] = SentenceTransformerEmbeddings(model_name=Config.EMBEDDINGS_MODEL)
+        return _shared_models["embeddings"]
+
+
+def get_shared_reranker() -> CrossEncoderReranker:
+    """Return the process-wide cross-encoder re-ranker."""
+    with _shared_models_lock:
+        if "reranker" not in _shared_models:
+            _shared_models["reranker"] = CrossEncoderReranker()
+        return _shared_models["reranker"]
+
+
+class IndexSnapshot:
+    """
+    One immutable state of a processor's index.
+
+    Holds the vector store with its tombstones, segments, search parameters, theme map,
+    processed documents and the MinHash signatures of its chunks by docstore ID. A
+    published snapshot is never changed: writers build the next one and publish it by
+    swapping a single reference, so a reader that took a snapshot keeps a consistent
+    view for as long as it uses it.
+    """
+
+    __slots__ = ("vector_store", "tombstones", "segments", "search_params", "theme_map",
+                 "processed_documents", "signatures", "version")
+
+    def __init__(self, vector_store: Optional[FAISS] = None, tombstones: frozenset = frozenset(),
+                 segments: tuple = (), search_params: Any = None, theme_map: Optional[Dict[str, Any]] = None,
+                 processed_documents: tuple = (), signatures: Optional[Dict[str, np.ndarray]] = None,
+                 version: int = 0):
+        self.vector_store = vector_store
+        self.tombstones = tombstones
+        self.segments = segments
+        self.search_params = search_params
+        self.theme_map = theme_map
+        self.processed_documents = processed_documents
+        self.signatures = signatures
+        self.version = version
+
+
 class EnhancedDocumentProcessor:
     """
     Enhanced document processor with citation tracking and theme analysis capabilities.
@@ -37,23 +108,20 @@ class EnhancedDocumentProcessor:
     def __init__(self, groq_api_key: Optional[str] = None):
         """Initialize the Enhanced DocumentProcessor."""
         self.groq_api_key = groq_api_key or os.getenv("GROQ_API_KEY")
-        if not self.groq_api_key:
+        llm_available = bool(self.groq_api_key) or not provider_requires_api_key()
+        if not llm_available:
             logger.warning("GROQ API key not found. Image OCR will not be available.")
             self.vision_llm = None
         else:
-            self.vision_llm = ChatGroq(
-                model=Config.VISION_LLM_MODEL,
-                api_key=self.groq_api_key
-            )
+            self.vision_llm = get_llm_gateway().client(Config.VISION_LLM_MODEL, self.groq_api_key)
         
-        # Initialize chat model for analysis
-        self.chat_llm = ChatGroq(
-            model=Config.CHAT_LLM_MODEL,
-            api_key=self.groq_api_key
-        ) if self.groq_api_key else None
+        # Initialize chat model for analysis (calls are pooled, rate limited and retried by the gateway)
+        self.chat_llm = get_llm_gateway().client(
+            Config.CHAT_LLM_MODEL, self.groq_api_key
+        ) if llm_available else None
         
-        # Initialize embeddings
-        self.embeddings = SentenceTransformerEmbeddings(model_name=Config.EMBEDDINGS_MODEL)
+        # Initialize embeddings (shared across processors)
+        self.embeddings = get_shared_embeddings()
         
         # Initialize text splitter with better chunk tracking
         self.text_splitter = RecursiveCharacterTextSplitter(
@@ -65,8 +133,28 @@ class EnhancedDocumentProcessor:
         
         # Document tracking
         self.document_metadata = {}
-        self.processed_documents = []
-        self.vector_store = None
+        
+        # Queries read the current snapshot without locking; changes publish a new one (see _swap).
+        # Tombstoned (deleted) chunks are masked out of searches until compaction removes them, and
+        # each ingestion adds a segment of index positions; saves only write segments missing on disk
+        self._snapshot = IndexSnapshot()
+        self._chunk_positions = None
+        # LSH index over the signatures of the current snapshot's chunks (see _duplicate_index_for)
+        self._duplicate_index = None
+        self._state_lock = threading.RLock()
+        self._compaction_thread = None
+        
+        # Ingestion, compaction, saves and loads take turns building the next snapshot
+        self._write_lock = threading.Lock()
+        
+        # Optional cross-encoder re-ranking (model is loaded on first use)
+        self.reranker = get_shared_reranker()
+        
+        # On-disk snapshot version this store was loaded from or last saved as
+        self.snapshot_version = None
+        
+        # Answers for reworded questions; publishing a changed snapshot invalidates them
+        self.answer_cache = SemanticAnswerCache()
         
         # Supported file extensions
         self.supported_extensions = {
@@ -86,6 +174,36 @@ class EnhancedDocumentProcessor:
             '.webp': self._process_image
         }
     
+    def snapshot(self) -> IndexSnapshot:
+        """Get the current index snapshot; it stays consistent however long it is used."""
+        return self._snapshot
+    
+    @property
+    def vector_store(self) -> Optional[FAISS]:
+        return self._snapshot.vector_store
+    
+    @property
+    def tombstones(self) -> frozenset:
+        return self._snapshot.tombstones
+    
+    @property
+    def segments(self) -> tuple:
+        return self._snapshot.segments
+    
+    @property
+    def theme_map(self) -> Optional[Dict[str, Any]]:
+        """Corpus-level theme clusters computed at ingestion (Config.ENABLE_CORPUS_THEME_MAP)."""
+        return self._snapshot.theme_map
+    
+    @property
+    def processed_documents(self) -> tuple:
+        return self._snapshot.processed_documents
+    
+    @property
+    def store_version(self) -> int:
+        """Version of the current snapshot; cached answers are tied to it."""
+        return self._snapshot.version
+    
     def _generate_chunk_id(self, content: str, source: str, chunk_index: int) -> str:
         """Generate a unique ID for a document chunk."""
         content_hash = hashlib.md5(content.encode()).hexdigest()[:Config.CONTENT_HASH_LENGTH]
@@ -146,7 +264,8 @@ class EnhancedDocumentProcessor:
                 )
             ]
 
-            response = self.vision_llm.invoke(message)
+            with pipeline_metrics.timed("ocr"):
+                response = self.vision_llm.invoke(message)
             extracted_text = response.content.strip()
             
             if extracted_text.lower() == "no text found":
@@ -256,13 +375,15 @@ class EnhancedDocumentProcessor:
         
         return documents
     
-    def process_files(self, file_paths: List[str]) -> List[Document]:
-        """Process a list of file paths."""
+    def process_files(self, file_paths: List[str], progress: Optional[ProgressCallback] = None) -> List[Document]:
+        """Process a list of file paths, reporting each parsed file to progress as stage "parse"."""
         documents = []
         
         logger.info(f"Processing {len(file_paths)} files...")
+        if progress:
+            progress("parse", 0, len(file_paths))
         
-        for file_path in file_paths:
+        for parsed, file_path in enumerate(file_paths, 1):
             try:
                 file_path_obj = Path(file_path)
                 if not file_path_obj.exists():
@@ -275,17 +396,22 @@ class EnhancedDocumentProcessor:
                     continue
                 
                 processor_func = self.supported_extensions[file_extension]
-                file_documents = processor_func(file_path)
+                with pipeline_metrics.timed("parse", file_type=file_extension.lstrip(".")):
+                    file_documents = processor_func(file_path)
                 documents.extend(file_documents)
                 
             except Exception as e:
                 logger.error(f"Error processing file {file_path}: {str(e)}")
+            finally:
+                if progress:
+                    progress("parse", parsed, len(file_paths))
         
         logger.info(f"Successfully processed {len(documents)} documents from {len(file_paths)} files")
         return documents
     
-    def process_directory(self, directory_path: str, recursive: bool = Config.ENABLE_RECURSIVE_DIRECTORY_PROCESSING) -> List[Document]:
-        """Process all supported files in a directory."""
+    def process_directory(self, directory_path: str, recursive: bool = Config.ENABLE_RECURSIVE_DIRECTORY_PROCESSING,
+                          progress: Optional[ProgressCallback] = None) -> List[Document]:
+        """Process all supported files in a directory, reporting each parsed file to progress as stage "parse"."""
         documents = []
         directory = Path(directory_path)
         
@@ -304,26 +430,70 @@ class EnhancedDocumentProcessor:
         ]
         
         logger.info(f"Found {len(supported_files)} supported files in {directory_path}")
+        if progress:
+            progress("parse", 0, len(supported_files))
         
-        for file_path in supported_files:
+        for parsed, file_path in enumerate(supported_files, 1):
             try:
                 file_extension = file_path.suffix.lower()
                 processor_func = self.supported_extensions[file_extension]
-                file_documents = processor_func(str(file_path))
+                with pipeline_metrics.timed("parse", file_type=file_extension.lstrip(".")):
+                    file_documents = processor_func(str(file_path))
                 documents.extend(file_documents)
                 
             except Exception as e:
                 logger.error(f"Error processing file {file_path}: {str(e)}")
+            finally:
+                if progress:
+                    progress("parse", parsed, len(supported_files))
         
         logger.info(f"Successfully processed {len(documents)} documents from {len(supported_files)} files")
         return documents
     
-    def create_enhanced_vector_store(self, documents: List[Document]) -> FAISS:
-        """Create FAISS vector store with enhanced chunk metadata."""
-        if not documents:
-            logger.error("No documents provided for vector store creation")
-            return None
+    @staticmethod
+    def _alias_entry(chunk: Document) -> Dict[str, Any]:
+        """The location of a collapsed duplicate, kept so it can still be cited."""
+        return {
+            "source": chunk.metadata.get("source", "Unknown"),
+            "type": chunk.metadata.get("type", "Unknown"),
+            "chunk_id": chunk.metadata.get("chunk_id", "Unknown"),
+            "chunk_index": chunk.metadata.get("chunk_index", 0),
+            "page": chunk.metadata.get("page", None)
+        }
+    
+    def _collapse_near_duplicates(self, chunks: List[Document]) -> Tuple[List[Document], List[np.ndarray]]:
+        """
+        Collapse near-duplicate chunks into one indexed chunk that lists the others as aliases.
+        
+        Returns the unique chunks and their MinHash signatures.
+        """
+        detector = NearDuplicateDetector()
+        unique_chunks, signatures = [], []
+        
+        for chunk in chunks:
+            signature = detector.fingerprint(chunk.page_content)
+            duplicate_of = detector.find_duplicate(signature)
+            
+            if duplicate_of is None:
+                detector.add(signature)
+                unique_chunks.append(chunk)
+                signatures.append(signature)
+                continue
+            
+            representative = unique_chunks[duplicate_of]
+            representative.metadata.setdefault("aliases", []).append(self._alias_entry(chunk))
         
+        removed = len(chunks) - len(unique_chunks)
+        if removed:
+            logger.info(f"Collapsed {removed} near-duplicate chunks ({len(unique_chunks)} unique chunks remain)")
+        return unique_chunks, signatures
+    
+    def _build_enhanced_chunks(self, documents: List[Document]) -> Tuple[List[Document], Optional[List[np.ndarray]]]:
+        """
+        Split documents into chunks carrying enhanced citation metadata.
+        
+        Returns the chunks and, with near-duplicate detection on, their MinHash signatures.
+        """
         logger.info("Creating enhanced document chunks...")
         enhanced_chunks = []
         
@@ -357,52 +527,431 @@ class EnhancedDocumentProcessor:
         
         logger.info(f"Created {len(enhanced_chunks)} enhanced document chunks")
         
+        if not Config.ENABLE_NEAR_DUPLICATE_DETECTION:
+            return enhanced_chunks, None
+        return self._collapse_near_duplicates(enhanced_chunks)
+    
+    def _embed_texts(self, texts: List[str], progress: Optional[ProgressCallback] = None) -> List[List[float]]:
+        """Embed chunk texts in batches, reporting embedded chunks to progress as stage "embed"."""
+        vectors = []
+        if progress:
+            progress("embed", 0, len(texts))
+        for start in range(0, len(texts), Config.EMBEDDING_BATCH_SIZE):
+            batch = texts[start:start + Config.EMBEDDING_BATCH_SIZE]
+            with pipeline_metrics.timed("embed", items=len(batch)):
+                vectors.extend(self.embeddings.embed_documents(batch))
+            if progress:
+                progress("embed", len(vectors), len(texts))
+        return vectors
+    
+    def create_enhanced_vector_store(self, documents: List[Document],
+                                     progress: Optional[ProgressCallback] = None) -> FAISS:
+        """Create FAISS vector store with enhanced chunk metadata."""
+        if not documents:
+            logger.error("No documents provided for vector store creation")
+            return None
+        
+        with pipeline_metrics.timed("chunk") as timer:
+            enhanced_chunks, signatures = self._build_enhanced_chunks(documents)
+            timer.items = len(enhanced_chunks)
+        
+        # Embed up front so the theme map can label chunks before they are indexed
+        texts = [chunk.page_content for chunk in enhanced_chunks]
+        vectors = self._embed_texts(texts, progress)
+        
+        theme_map = None
+        if Config.ENABLE_CORPUS_THEME_MAP:
+            logger.info("Building corpus theme map...")
+            theme_map, labels = build_theme_map(
+                texts, [chunk.metadata.get("source", "") for chunk in enhanced_chunks], vectors
+            )
+            for chunk, label in zip(enhanced_chunks, labels):
+                chunk.metadata["theme_cluster"] = int(label)
+        
         # Create vector store
         logger.info("Creating FAISS vector store...")
-        vector_store = FAISS.from_documents(enhanced_chunks, self.embeddings)
+        if progress:
+            progress("index", 0, len(enhanced_chunks))
+        vectors = np.asarray(vectors, dtype=np.float32)
+        vector_store = self._faiss_from_vectors(
+            vectors.shape[1], vectors, [str(uuid.uuid4()) for _ in enhanced_chunks], enhanced_chunks
+        )
         
-        self.vector_store = vector_store
-        self.processed_documents = documents
+        if signatures is not None:
+            signatures = dict(zip((vector_store.index_to_docstore_id[i] for i in range(len(signatures))), signatures))
+        
+        # Queries keep searching the previous store until the new one is published
+        with self._write_lock:
+            self._set_vector_store(
+                vector_store, segments=[self._new_segment(0, vector_store.index.ntotal)], signatures=signatures,
+                theme_map=theme_map, processed_documents=tuple(documents)
+            )
+        if progress:
+            progress("index", len(enhanced_chunks), len(enhanced_chunks))
         
         logger.info(f"Successfully created FAISS vector store with {len(enhanced_chunks)} chunks")
         return vector_store
     
-    def search_with_citations(self, query: str, k: int = Config.DEFAULT_SEARCH_K) -> List[Dict[str, Any]]:
-        """Search for similar documents and return results with citation information."""
+    def add_documents_to_vector_store(self, documents: List[Document],
+                                      progress: Optional[ProgressCallback] = None) -> FAISS:
+        """
+        Add documents to the existing vector store as a new segment, creating the store if needed.
+        
+        New chunks that near-duplicate a live indexed chunk are not indexed again: they become
+        aliases of that chunk, which is re-added with its stored vector and the longer alias list.
+        """
         if not self.vector_store:
+            return self.create_enhanced_vector_store(documents, progress)
+        if not documents:
+            logger.error("No documents provided to add to the vector store")
+            return None
+        
+        with pipeline_metrics.timed("chunk") as timer:
+            enhanced_chunks, signatures = self._build_enhanced_chunks(documents)
+            timer.items = len(enhanced_chunks)
+        
+        # Only chunks new to the index are embedded
+        checked = self._snapshot
+        keep, extended = self._match_indexed_duplicates(checked, enhanced_chunks, signatures)
+        embedded = dict(zip(keep, self._embed_texts([enhanced_chunks[i].page_content for i in keep], progress)))
+        
+        if progress:
+            progress("index", 0, len(enhanced_chunks))
+        with self._write_lock:
+            while True:
+                current = self._snapshot
+                if current.vector_store is not checked.vector_store or current.tombstones.intersection(extended):
+                    # The index changed while embedding; match against the current one
+                    checked = current
+                    keep, extended = self._match_indexed_duplicates(current, enhanced_chunks, signatures)
+                    missing = [i for i in keep if i not in embedded]
+                    embedded.update(zip(missing, self._embed_texts([enhanced_chunks[i].page_content for i in missing])))
+                chunks = [enhanced_chunks[i] for i in keep]
+                vectors = [embedded[i] for i in keep]
+                
+                theme_map = current.theme_map
+                if theme_map and chunks:
+                    # New chunks join the nearest existing theme, whose size is recounted when the
+                    # store is published; labels are kept until the next rebuild
+                    for chunk, label in zip(chunks, assign_clusters(vectors, theme_map["centroids"])):
+                        chunk.metadata["theme_cluster"] = int(label)
+                
+                # New chunks and the extended copies go into one new segment; queries keep
+                # searching the current store until the new one is published
+                start = current.vector_store.index.ntotal
+                vector_store, ids = self._extended_vector_store(
+                    current.vector_store, chunks + list(extended.values()),
+                    np.concatenate([
+                        np.asarray(vectors, dtype=np.float32).reshape(-1, current.vector_store.index.d),
+                        self._stored_vectors(current.vector_store, list(extended))
+                    ])
+                )
+                added_ids, copy_ids = ids[:len(chunks)], ids[len(chunks):]
+                
+                duplicate_index = new_signatures = None
+                if signatures is not None:
+                    duplicate_index = self._duplicate_index_for(current)
+                    new_signatures = dict(duplicate_index[2])
+                    new_signatures.update(zip(added_ids, (signatures[i] for i in keep)))
+                    new_signatures.update((copy_id, new_signatures[docstore_id]) for docstore_id, copy_id in zip(extended, copy_ids))
+                
+                with self._state_lock:
+                    if self._snapshot.tombstones.intersection(extended):
+                        # A deletion got to a chunk gaining aliases; match again
+                        continue
+                    # Only deletions can have published a snapshot meanwhile; they keep their tombstones
+                    self._swap(
+                        vector_store=vector_store,
+                        tombstones=self._snapshot.tombstones.union(extended),
+                        segments=self._snapshot.segments + (self._new_segment(start, vector_store.index.ntotal),),
+                        processed_documents=self._snapshot.processed_documents + tuple(documents),
+                        signatures=new_signatures
+                    )
+                break
+            
+            if duplicate_index:
+                # Extend the LSH index in step with the published signatures instead of rebuilding it
+                detector, entry_ids, _ = duplicate_index
+                for docstore_id in added_ids + copy_ids:
+                    entry_ids.append(docstore_id)
+                    detector.add(new_signatures[docstore_id])
+                self._duplicate_index = (new_signatures, detector, entry_ids, new_signatures)
+        if progress:
+            progress("index", len(enhanced_chunks), len(enhanced_chunks))
+        self._maybe_start_compaction()
+        
+        logger.info(f"Added {len(chunks)} chunks to the vector store ({vector_store.index.ntotal} total)")
+        return vector_store
+    
+    def _duplicate_index_for(self, snapshot: IndexSnapshot) -> Tuple[NearDuplicateDetector, List[str], Dict[str, np.ndarray]]:
+        """
+        LSH index over the MinHash signatures of a snapshot's chunks.
+        
+        Returns the detector, the docstore ID of each of its entries and the signatures by
+        docstore ID. Chunks without a kept signature (indexed with detection off, or loaded
+        from a segment saved without signatures) are fingerprinted here. The index is cached
+        until the snapshot's signatures change.
+        """
+        cached = self._duplicate_index
+        if cached and snapshot.signatures is not None and cached[0] is snapshot.signatures:
+            return cached[1:]
+        
+        detector = NearDuplicateDetector()
+        signatures = dict(snapshot.signatures or {})
+        entry_ids = []
+        for docstore_id, doc in snapshot.vector_store.docstore._dict.items():
+            if docstore_id not in signatures:
+                signatures[docstore_id] = detector.fingerprint(doc.page_content)
+            entry_ids.append(docstore_id)
+            detector.add(signatures[docstore_id])
+        
+        self._duplicate_index = (snapshot.signatures, detector, entry_ids, signatures)
+        return detector, entry_ids, signatures
+    
+    def _match_indexed_duplicates(self, snapshot: IndexSnapshot, chunks: List[Document],
+                                  signatures: Optional[List[np.ndarray]]) -> Tuple[List[int], Dict[str, Document]]:
+        """
+        Find new chunks that near-duplicate live chunks of a snapshot.
+        
+        Returns the positions in chunks of the chunks to index, and copies of the indexed
+        chunks that others duplicate, by docstore ID, listing those others as aliases.
+        """
+        if signatures is None:
+            return list(range(len(chunks))), {}
+        
+        detector, entry_ids, _ = self._duplicate_index_for(snapshot)
+        docstore = snapshot.vector_store.docstore._dict
+        tombstones = snapshot.tombstones
+        
+        def dead(entry: int) -> bool:
+            return entry_ids[entry] in tombstones or entry_ids[entry] not in docstore
+        
+        keep, extended = [], {}
+        for i, (chunk, signature) in enumerate(zip(chunks, signatures)):
+            entry = detector.find_duplicate(signature, ignore=dead)
+            if entry is None:
+                keep.append(i)
+                continue
+            
+            docstore_id = entry_ids[entry]
+            indexed = extended.get(docstore_id) or docstore[docstore_id]
+            aliases = indexed.metadata.get("aliases", []) + [self._alias_entry(chunk)] + chunk.metadata.get("aliases", [])
+            extended[docstore_id] = Document(page_content=indexed.page_content, metadata={**indexed.metadata, "aliases": aliases})
+        
+        if extended:
+            logger.info(f"{len(chunks) - len(keep)} new chunks duplicate indexed chunks and were added as their aliases")
+        return keep, extended
+    
+    @staticmethod
+    def _stored_vectors(vector_store: FAISS, docstore_ids: List[str]) -> np.ndarray:
+        """Stored vectors of chunks of a vector store, by docstore ID."""
+        if not docstore_ids:
+            return np.empty((0, vector_store.index.d), dtype=np.float32)
+        positions = {docstore_id: position for position, docstore_id in vector_store.index_to_docstore_id.items()}
+        return vector_store.index.reconstruct_batch(
+            np.array([positions[docstore_id] for docstore_id in docstore_ids], dtype=np.int64)
+        )
+    
+    @staticmethod
+    def _new_segment(start: int, end: int) -> Dict[str, Any]:
+        """Describe the index positions [start, end) added by one ingestion."""
+        return {"id": f"seg-{uuid.uuid4().hex[:16]}", "start": start, "end": end}
+    
+    def _swap(self, **changes) -> IndexSnapshot:
+        """
+        Publish the next snapshot, the current one with the given fields changed.
+        
+        Publishing is a single reference assignment, so queries see either the old or the
+        new snapshot and never wait for it. Search parameters and theme map sizes are
+        rebuilt when the vector store or tombstones change, and the version is bumped unless given.
+        """
+        with self._state_lock:
+            current = self._snapshot
+            fields = {name: getattr(current, name) for name in IndexSnapshot.__slots__}
+            fields.update(changes)
+            if "vector_store" in changes or "tombstones" in changes:
+                fields["search_params"] = self._build_search_params(fields["vector_store"], fields["tombstones"])
+                fields["theme_map"] = self._live_theme_map(fields["theme_map"], fields["vector_store"], fields["tombstones"])
+            fields["version"] = changes.get("version", current.version + 1)
+            self._snapshot = IndexSnapshot(**fields)
+            return self._snapshot
+    
+    @staticmethod
+    def _live_theme_map(theme_map: Optional[Dict[str, Any]], vector_store: Optional[FAISS],
+                        tombstones: frozenset) -> Optional[Dict[str, Any]]:
+        """The theme map with its cluster sizes and top sources counted over the chunks that are not tombstoned."""
+        if not theme_map or not vector_store:
+            return theme_map
+        return recount_theme_map(theme_map, (
+            doc.metadata for docstore_id, doc in vector_store.docstore._dict.items() if docstore_id not in tombstones
+        ))
+    
+    def _set_vector_store(self, vector_store: Optional[FAISS], tombstones: Optional[set] = None,
+                          segments: Optional[List[Dict[str, Any]]] = None,
+                          signatures: Optional[Dict[str, np.ndarray]] = None, **changes):
+        """Replace the vector store, its tombstones, its segments and its chunks' signatures together."""
+        self._swap(
+            vector_store=vector_store, tombstones=frozenset(tombstones or ()), segments=tuple(segments or ()),
+            signatures=signatures, **changes
+        )
+    
+    def _extended_vector_store(self, vector_store: FAISS, docs: List[Document],
+                               vectors: np.ndarray) -> Tuple[FAISS, List[str]]:
+        """
+        A new vector store with vector_store's chunks plus docs, whose vectors form a new index segment.
+        
+        The index segments already there are shared, not copied, so the original can still
+        be searched; the docstore maps are copied, which costs references, not vectors.
+        Returns the store and the docstore IDs given to docs.
+        """
+        ids = [str(uuid.uuid4()) for _ in docs]
+        start = vector_store.index.ntotal
+        return FAISS(
+            embedding_function=self.embeddings,
+            index=vector_store.index.appended(vectors),
+            docstore=InMemoryDocstore({**vector_store.docstore._dict, **dict(zip(ids, docs))}),
+            index_to_docstore_id={**vector_store.index_to_docstore_id, **{start + i: docstore_id for i, docstore_id in enumerate(ids)}}
+        ), ids
+    
+    def _faiss_from_vectors(self, dimension: int, vectors: np.ndarray, docstore_ids: List[str],
+                            docs: List[Document], metric_type: int = faiss.METRIC_L2) -> FAISS:
+        """Assemble a vector store with one flat index segment from precomputed vectors and their documents."""
+        return self._faiss_from_index(SegmentedIndex(dimension, metric_type).appended(vectors), docstore_ids, docs)
+    
+    def _faiss_from_index(self, index: SegmentedIndex, docstore_ids: List[str], docs: List[Document]) -> FAISS:
+        """Assemble a vector store from a segmented index and the documents at its positions."""
+        return FAISS(
+            embedding_function=self.embeddings,
+            index=index,
+            docstore=InMemoryDocstore(dict(zip(docstore_ids, docs))),
+            index_to_docstore_id=dict(enumerate(docstore_ids))
+        )
+    
+    def _build_search_params(self, vector_store: Optional[FAISS], tombstones: set):
+        """Build FAISS search parameters that exclude tombstoned index positions."""
+        if not vector_store or not tombstones:
+            return None
+        
+        return vector_store.index.search_parameters(np.array(
+            [position for position, docstore_id in vector_store.index_to_docstore_id.items() if docstore_id in tombstones],
+            dtype=np.int64
+        ))
+    
+    def _search_state(self) -> Tuple[Optional[FAISS], Any]:
+        """Get the vector store and matching search parameters as one consistent pair."""
+        snapshot = self._snapshot
+        return snapshot.vector_store, snapshot.search_params
+    
+    def _search_by_vector(self, vector_store: FAISS, search_params: Any, query_vector: List[float],
+                          k: int) -> List[Tuple[Document, float, int]]:
+        """Search the FAISS index directly, returning (document, score, index position) tuples."""
+        query = np.asarray([query_vector], dtype=np.float32)
+        scores, positions = vector_store.index.search(query, k, params=search_params)
+        
+        results = []
+        for score, position in zip(scores[0], positions[0]):
+            if position == -1:
+                continue
+            docstore_id = vector_store.index_to_docstore_id[int(position)]
+            doc = vector_store.docstore.search(docstore_id)
+            results.append((doc, float(score), int(position)))
+        
+        return results
+    
+    def _mmr_search(self, vector_store: FAISS, search_params: Any, query_vector: List[float],
+                    k: int) -> List[Tuple[Document, float]]:
+        """Fetch a larger candidate set and keep a diverse top-k using maximal marginal relevance."""
+        candidates = self._search_by_vector(vector_store, search_params, query_vector, max(Config.MMR_FETCH_K, k))
+        if not candidates:
+            return []
+        
+        positions = np.array([position for _, _, position in candidates], dtype=np.int64)
+        candidate_vectors = vector_store.index.reconstruct_batch(positions)
+        selected = maximal_marginal_relevance(query_vector, candidate_vectors, k, Config.MMR_LAMBDA)
+        
+        return [(candidates[i][0], candidates[i][1]) for i in selected]
+    
+    def _format_citation(self, doc: Document, score: float) -> Dict[str, Any]:
+        """Build the citation dictionary for a single search hit."""
+        citation_info = {
+            "content": doc.page_content,
+            "score": float(score),
+            "source": doc.metadata.get("source", "Unknown"),
+            "type": doc.metadata.get("type", "Unknown"),
+            "chunk_id": doc.metadata.get("chunk_id", "Unknown"),
+            "chunk_index": doc.metadata.get("chunk_index", 0),
+            "page": doc.metadata.get("page", None),
+            "word_count": doc.metadata.get("chunk_word_count", 0),
+            "sentences": doc.metadata.get("chunk_sentences", 0),
+            "processed_at": doc.metadata.get("processed_at", "Unknown"),
+            "aliases": doc.metadata.get("aliases", []),
+            "theme_cluster": doc.metadata.get("theme_cluster")
+        }
+        
+        # Add specific citation format based on document type
+        if doc.metadata.get("type") == "pdf" and doc.metadata.get("page"):
+            citation_info["citation"] = f"{Path(doc.metadata['source']).name}, Page {doc.metadata['page']}"
+        elif doc.metadata.get("type") == "text":
+            citation_info["citation"] = f"{Path(doc.metadata['source']).name}, Chunk {doc.metadata.get('chunk_index', 0) + 1}"
+        elif doc.metadata.get("type") == "image_ocr":
+            citation_info["citation"] = f"{Path(doc.metadata['source']).name} (OCR)"
+        else:
+            citation_info["citation"] = f"{Path(doc.metadata['source']).name}"
+        
+        return citation_info
+    
+    def search_with_citations(self, query: str, k: int = Config.DEFAULT_SEARCH_K,
+                              use_mmr: Optional[bool] = None, rerank: Optional[bool] = None,
+                              query_vector: Optional[List[float]] = None) -> List[Dict[str, Any]]:
+        """
+        Search for similar documents and return results with citation information.
+        
+        Pass query_vector to reuse an embedding of the query the caller already computed.
+        """
+        vector_store, search_params = self._search_state()
+        if not vector_store:
             logger.error("No vector store available. Create or load one first.")
             return []
         
+        if use_mmr is None:
+            use_mmr = Config.ENABLE_MMR_RERANKING
+        if rerank is None:
+            rerank = Config.ENABLE_CROSS_ENCODER_RERANKING
+        
         try:
+            # Over-fetch candidates when a cross-encoder will pick the final top-k
+            fetch_k = max(Config.RERANK_TOP_N, k) if rerank else k
+            if rerank and use_mmr:
+                fetch_k = max(fetch_k, Config.MMR_FETCH_K)
+            
             # Get similar documents
-            results = self.vector_store.similarity_search_with_score(query, k=k)
-            
-            citation_results = []
-            for doc, score in results:
-                citation_info = {
-                    "content": doc.page_content,
-                    "score": float(score),
-                    "source": doc.metadata.get("source", "Unknown"),
-                    "type": doc.metadata.get("type", "Unknown"),
-                    "chunk_id": doc.metadata.get("chunk_id", "Unknown"),
-                    "chunk_index": doc.metadata.get("chunk_index", 0),
-                    "page": doc.metadata.get("page", None),
-                    "word_count": doc.metadata.get("chunk_word_count", 0),
-                    "sentences": doc.metadata.get("chunk_sentences", 0),
-                    "processed_at": doc.metadata.get("processed_at", "Unknown")
-                }
-                
-                # Add specific citation format based on document type
-                if doc.metadata.get("type") == "pdf" and doc.metadata.get("page"):
-                    citation_info["citation"] = f"{Path(doc.metadata['source']).name}, Page {doc.metadata['page']}"
-                elif doc.metadata.get("type") == "text":
-                    citation_info["citation"] = f"{Path(doc.metadata['source']).name}, Chunk {doc.metadata.get('chunk_index', 0) + 1}"
-                elif doc.metadata.get("type") == "image_ocr":
-                    citation_info["citation"] = f"{Path(doc.metadata['source']).name} (OCR)"
+            if query_vector is None:
+                with pipeline_metrics.timed("embed_query"):
+                    query_vector = self.embeddings.embed_query(query)
+            with pipeline_metrics.timed("search", mmr=str(use_mmr).lower()):
+                if use_mmr and not rerank:
+                    results = self._mmr_search(vector_store, search_params, query_vector, fetch_k)
                 else:
-                    citation_info["citation"] = f"{Path(doc.metadata['source']).name}"
-                
-                citation_results.append(citation_info)
+                    hits = self._search_by_vector(vector_store, search_params, query_vector, fetch_k)
+                    results = [(doc, score) for doc, score, _ in hits]
+                annotate(k=k, fetch_k=fetch_k, results=len(results), vectors=vector_store.index.ntotal)
+            
+            citation_results = [self._format_citation(doc, score) for doc, score in results]
+            
+            if rerank and use_mmr:
+                # MMR ahead of the cross-encoder would only shuffle the pool it then ranks by relevance
+                # alone, so diversify afterwards, with the cross-encoder's scores as the relevance
+                with pipeline_metrics.timed("rerank", items=len(citation_results)):
+                    scores = self.reranker.score(query, citation_results)
+                positions = np.array([position for _, _, position in hits], dtype=np.int64)
+                selected = maximal_marginal_relevance(
+                    query_vector, vector_store.index.reconstruct_batch(positions), k, Config.MMR_LAMBDA,
+                    relevance=scaled_scores(scores)
+                ) if hits else []
+                citation_results = [with_rerank_score(citation_results[i], scores[i]) for i in selected]
+            elif rerank:
+                with pipeline_metrics.timed("rerank", items=len(citation_results)):
+                    citation_results = self.reranker.rerank(query, citation_results, top_k=k)
             
             logger.info(f"Found {len(citation_results)} results with citations for query: '{query}'")
             return citation_results
@@ -411,99 +960,602 @@ class EnhancedDocumentProcessor:
             logger.error(f"Error searching documents: {str(e)}")
             return []
     
-    def analyze_themes(self, query: str, search_results: List[Dict[str, Any]]) -> Dict[str, Any]:
-        """Analyze common themes across search results."""
-        if not self.chat_llm or not search_results:
-            return {"themes": [], "summary": "Unable to analyze themes"}
+    def compress_results(self, query: str, search_results: List[Dict[str, Any]],
+                         query_vector: Optional[List[float]] = None) -> List[Dict[str, Any]]:
+        """
+        Keep only the sentences of each search result that are most similar to the query.
+        
+        Every sentence of every hit is embedded in one batch and the top
+        COMPRESSION_MAX_SENTENCES are kept, plus the best sentence of each hit so no citation
+        drops out. Returns copies of the results with compressed content and the kept
+        sentences' character spans; returns the results unchanged when
+        Config.ENABLE_CONTEXT_COMPRESSION is off.
+        """
+        if not Config.ENABLE_CONTEXT_COMPRESSION or not search_results:
+            return search_results
         
         try:
-            # Prepare content for theme analysis
-            contents = [result["content"] for result in search_results]
-            combined_content = "\n\n---\n\n".join(contents)
+            sentences = [self._extract_sentences(result["content"]) for result in search_results]
+            owners = [i for i, result_sentences in enumerate(sentences) for _ in result_sentences]
+            flat = [sentence for result_sentences in sentences for sentence in result_sentences]
+            if not flat:
+                return search_results
+            
+            vectors = np.asarray(self.embeddings.embed_documents([text for text, _, _ in flat]), dtype=np.float32)
+            if query_vector is None:
+                query_vector = self.embeddings.embed_query(query)
+            query_array = np.asarray(query_vector, dtype=np.float32)
+            scores = (vectors @ query_array) / (np.linalg.norm(vectors, axis=1) * np.linalg.norm(query_array) + 1e-12)
+            
+            keep = set(np.argsort(-scores)[:Config.COMPRESSION_MAX_SENTENCES].tolist())
+            best_per_result = {}
+            for row, owner in enumerate(owners):
+                if owner not in best_per_result or scores[row] > scores[best_per_result[owner]]:
+                    best_per_result[owner] = row
+            keep.update(best_per_result.values())
+            
+            compressed = []
+            for i, result in enumerate(search_results):
+                kept = [flat[row] for row, owner in enumerate(owners) if owner == i and row in keep]
+                if not kept:
+                    compressed.append(result)
+                    continue
+                
+                # Mark gaps between non-adjacent sentences
+                parts, previous_end = [], None
+                for text, start, end in kept:
+                    if previous_end is not None and start > previous_end:
+                        parts.append("...")
+                    parts.append(text)
+                    previous_end = end
+                
+                compressed.append({
+                    **result,
+                    "content": " ".join(parts),
+                    "sentence_spans": [[start, end] for _, start, end in kept]
+                })
             
-            theme_analysis_prompt = Config.THEME_ANALYSIS_PROMPT_TEMPLATE.format(
-                query=query,
-                content=combined_content[:Config.MAX_CONTENT_LENGTH_FOR_THEME_ANALYSIS]
+            original = sum(len(result["content"]) for result in search_results)
+            kept_chars = sum(len(result["content"]) for result in compressed)
+            logger.info(f"Compressed context from {original} to {kept_chars} characters ({len(keep)} of {len(flat)} sentences)")
+            return compressed
+            
+        except Exception as e:
+            logger.error(f"Error compressing context: {str(e)}")
+            return search_results
+    
+    def get_cached_answer(self, query_vector: List[float], search_results: List[Dict[str, Any]],
+                          store_version: int) -> Optional[Dict[str, Any]]:
+        """
+        Look up a cached answer to a similar query that retrieved the same chunks.
+        
+        store_version is the value of self.store_version read before searching.
+        """
+        if not Config.ENABLE_ANSWER_CACHE:
+            return None
+        chunk_ids = [result["chunk_id"] for result in search_results]
+        return self.answer_cache.get(query_vector, chunk_ids, store_version)
+    
+    def cache_answer(self, query_vector: List[float], search_results: List[Dict[str, Any]], store_version: int,
+                     response: str, themes: Dict[str, Any]):
+        """Cache the answer generated from a set of search results."""
+        if not Config.ENABLE_ANSWER_CACHE:
+            return
+        chunk_ids = [result["chunk_id"] for result in search_results]
+        self.answer_cache.put(query_vector, chunk_ids, store_version, response, themes)
+    
+    def delete_chunks(self, chunk_ids: List[str]) -> int:
+        """Delete chunks and near-duplicate aliases by chunk ID. They are excluded from searches immediately."""
+        wanted = set(chunk_ids)
+        return self._delete_where(lambda metadata: metadata.get("chunk_id") in wanted)
+    
+    def delete_source(self, source: str) -> int:
+        """Delete every chunk and near-duplicate alias that came from the given source file."""
+        return self._delete_where(lambda metadata: metadata.get("source") == source)
+    
+    def _delete_where(self, predicate) -> int:
+        """
+        Delete the chunks and near-duplicate aliases whose metadata matches a predicate.
+        
+        A chunk is tombstoned when it and all its aliases match. A chunk with surviving
+        aliases is re-added in its place instead: a matching chunk is replaced by its first
+        surviving alias, and matching aliases are dropped from its list. Returns the number
+        of chunks and aliases deleted; compaction is triggered if needed.
+        """
+        while True:
+            snapshot = self._snapshot
+            vector_store = snapshot.vector_store
+            if not vector_store:
+                logger.error("No vector store available. Create or load one first.")
+                return 0
+            
+            # Scan outside the lock so other deletions are not held up
+            tombstoned, rewritten, deleted = set(), {}, 0
+            for docstore_id, doc in vector_store.docstore._dict.items():
+                if docstore_id in snapshot.tombstones:
+                    continue
+                aliases = doc.metadata.get("aliases") or []
+                surviving = [alias for alias in aliases if not predicate(alias)]
+                matched = predicate(doc.metadata)
+                if not matched and len(surviving) == len(aliases):
+                    continue
+                
+                deleted += int(matched) + len(aliases) - len(surviving)
+                tombstoned.add(docstore_id)
+                if surviving or not matched:
+                    rewritten[docstore_id] = self._without_aliases(doc, matched, surviving)
+            
+            if not tombstoned:
+                return 0
+            if rewritten:
+                snapshot = self._readd_chunks(vector_store, tombstoned, rewritten)
+            else:
+                with self._state_lock:
+                    current = self._snapshot
+                    if current.vector_store is not vector_store or current.tombstones & tombstoned:
+                        # Swapped by compaction or ingestion, or raced by another deletion; scan again
+                        continue
+                    snapshot = self._swap(tombstones=current.tombstones | tombstoned)
+            if snapshot is not None:
+                break
+        
+        logger.info(f"Deleted {deleted} chunks and aliases ({len(snapshot.tombstones)} dead of {snapshot.vector_store.index.ntotal})")
+        self._maybe_start_compaction()
+        return deleted
+    
+    @staticmethod
+    def _without_aliases(doc: Document, matched: bool, surviving: List[Dict[str, Any]]) -> Document:
+        """Copy a chunk keeping only its surviving aliases, promoting the first one if the chunk matched."""
+        metadata = dict(doc.metadata)
+        if matched:
+            # The alias takes over the chunk's location; its text is a near-duplicate of the chunk's
+            metadata.update(surviving[0])
+            surviving = surviving[1:]
+        metadata["aliases"] = surviving
+        if not surviving:
+            del metadata["aliases"]
+        return Document(page_content=doc.page_content, metadata=metadata)
+    
+    def _readd_chunks(self, vector_store: FAISS, tombstoned: set,
+                      rewritten: Dict[str, Document]) -> Optional[IndexSnapshot]:
+        """
+        Tombstone chunks and re-add rewritten copies of some of them as a new segment.
+        
+        The copies keep their stored vectors. Returns the published snapshot, or None if
+        the store changed since it was scanned.
+        """
+        # Extending the index takes turns with ingestion and compaction like any other write
+        with self._write_lock:
+            if self._snapshot.vector_store is not vector_store:
+                return None
+            
+            # Queries keep searching the current store until the new one is published
+            start = vector_store.index.ntotal
+            new_store, copy_ids = self._extended_vector_store(
+                vector_store, list(rewritten.values()), self._stored_vectors(vector_store, list(rewritten))
             )
             
-            response = self.chat_llm.invoke(theme_analysis_prompt)
+            signatures = self._snapshot.signatures
+            if signatures is not None:
+                # The copies keep their chunks' signatures
+                signatures = {**signatures, **{
+                    copy_id: signatures[docstore_id] for docstore_id, copy_id in zip(rewritten, copy_ids)
+                    if docstore_id in signatures
+                }}
+            with self._state_lock:
+                current = self._snapshot
+                if current.tombstones & tombstoned:
+                    # Another deletion got to these chunks first
+                    return None
+                return self._swap(
+                    vector_store=new_store,
+                    tombstones=current.tombstones | tombstoned,
+                    segments=current.segments + (self._new_segment(start, new_store.index.ntotal),),
+                    signatures=signatures
+                )
+    
+    def dead_ratio(self) -> float:
+        """Fraction of indexed vectors that are tombstoned."""
+        snapshot = self._snapshot
+        if not snapshot.vector_store or not snapshot.vector_store.index.ntotal:
+            return 0.0
+        return len(snapshot.tombstones) / snapshot.vector_store.index.ntotal
+    
+    def _maybe_start_compaction(self):
+        """Start a background compaction once the dead ratio or the number of index segments passes its limit."""
+        vector_store = self._snapshot.vector_store
+        too_many_segments = vector_store is not None and len(vector_store.index.parts) > Config.COMPACTION_MAX_SEGMENTS
+        if not Config.ENABLE_BACKGROUND_COMPACTION or (
+            self.dead_ratio() < Config.COMPACTION_DEAD_RATIO_THRESHOLD and not too_many_segments
+        ):
+            return
+        
+        with self._state_lock:
+            if self._compaction_thread and self._compaction_thread.is_alive():
+                return
+            self._compaction_thread = threading.Thread(target=self.compact, name="faiss-compaction", daemon=True)
+            self._compaction_thread.start()
+    
+    def compact(self) -> bool:
+        """
+        Rebuild the index as one segment without tombstoned vectors and swap it in atomically.
+        
+        The rebuild works on a snapshot, so queries keep running against the old
+        index until the swap.
+        """
+        # Ingestion waits for compaction so no vectors are added to the store being rebuilt
+        with self._write_lock:
+            return self._compact()
+    
+    def _compact(self) -> bool:
+        snapshot = self._snapshot
+        vector_store, tombstones = snapshot.vector_store, snapshot.tombstones
+        if not vector_store or (not tombstones and len(vector_store.index.parts) <= 1):
+            return False
+        
+        try:
+            index = vector_store.index
+            live = [
+                (position, docstore_id) for position, docstore_id in sorted(vector_store.index_to_docstore_id.items())
+                if docstore_id not in tombstones
+            ]
             
-            # Try to parse JSON response
-            try:
-                import json
-                theme_data = json.loads(response.content)
-                return theme_data
-            except json.JSONDecodeError:
-                # Fallback if JSON parsing fails
-                return {
-                    "themes": [{"name": "Analysis Available", "description": response.content[:200], "frequency": "varies"}],
-                    "summary": response.content,
-                    "insights": ["Theme analysis completed"]
-                }
+            positions = np.array([position for position, _ in live], dtype=np.int64)
+            compacted_store = self._faiss_from_vectors(
+                index.d,
+                index.reconstruct_batch(positions) if live else np.empty((0, index.d), dtype=np.float32),
+                [docstore_id for _, docstore_id in live],
+                [vector_store.docstore.search(docstore_id) for _, docstore_id in live],
+                index.metric_type
+            )
+            
+            with self._state_lock:
+                current = self._snapshot
+                if current.vector_store is not vector_store:
+                    logger.info("Vector store replaced during compaction; discarding compacted index")
+                    return False
+                
+                # Chunks deleted while compacting are still tombstoned in the new index. Searches
+                # return the same chunks as before, so the version and cached answers stay valid
+                self._swap(
+                    vector_store=compacted_store,
+                    tombstones=current.tombstones - tombstones,
+                    segments=(self._new_segment(0, len(live)),),
+                    signatures={
+                        docstore_id: current.signatures[docstore_id] for _, docstore_id in live
+                        if docstore_id in current.signatures
+                    } if current.signatures is not None else None,
+                    version=current.version
+                )
+            
+            logger.info(f"Compacted vector store: removed {len(tombstones)} dead vectors, {len(live)} remain")
+            return True
             
         except Exception as e:
-            logger.error(f"Error analyzing themes: {str(e)}")
+            logger.error(f"Error compacting vector store: {str(e)}")
+            return False
+    
+    def _theme_analysis_prompt(self, query: str, search_results: List[Dict[str, Any]]) -> str:
+        """Build the theme analysis prompt for a set of search results."""
+        contents = [result["content"] for result in search_results]
+        combined_content = "\n\n---\n\n".join(contents)
+        
+        return Config.THEME_ANALYSIS_PROMPT_TEMPLATE.format(
+            query=query,
+            content=combined_content[:Config.MAX_CONTENT_LENGTH_FOR_THEME_ANALYSIS]
+        )
+    
+    @staticmethod
+    def _parse_theme_response(content: str) -> Dict[str, Any]:
+        """Parse the LLM's theme analysis, falling back to the raw text if it is not JSON."""
+        try:
+            return json.loads(content)
+        except json.JSONDecodeError:
             return {
-                "themes": [{"name": "Error", "description": f"Theme analysis failed: {str(e)}", "frequency": "N/A"}],
-                "summary": "Unable to analyze themes due to an error",
-                "insights": []
+                "themes": [{"name": "Analysis Available", "description": content[:200], "frequency": "varies"}],
+                "summary": content,
+                "insights": ["Theme analysis completed"]
             }
     
-    def save_vector_store(self, save_path: str):
-        """Save the FAISS vector store with enhanced metadata."""
-        if not self.vector_store:
-            logger.error("No vector store to save. Create one first.")
-            return
+    @staticmethod
+    def _theme_error(message: str) -> Dict[str, Any]:
+        return {
+            "themes": [{"name": "Error", "description": f"Theme analysis failed: {message}", "frequency": "N/A"}],
+            "summary": "Unable to analyze themes due to an error",
+            "insights": []
+        }
+    
+    def _result_vectors(self, search_results: List[Dict[str, Any]]) -> np.ndarray:
+        """Reconstruct the stored embeddings of search results from the index."""
+        vector_store, _ = self._search_state()
+        cached = self._chunk_positions
+        if cached and cached[0] is vector_store:
+            positions = cached[1]
+        else:
+            # Rebuilt once per published store; stores are never changed in place
+            positions = {
+                vector_store.docstore.search(docstore_id).metadata.get("chunk_id"): position
+                for position, docstore_id in vector_store.index_to_docstore_id.items()
+            }
+            self._chunk_positions = (vector_store, positions)
+        
+        if any(result["chunk_id"] not in positions for result in search_results):
+            # Results from a store swapped out since the search; embed them instead
+            return np.asarray(self.embeddings.embed_documents([result["content"] for result in search_results]))
+        return vector_store.index.reconstruct_batch(
+            np.array([positions[result["chunk_id"]] for result in search_results], dtype=np.int64)
+        )
+    
+    def _local_theme_analysis(self, query: str, search_results: List[Dict[str, Any]]) -> Dict[str, Any]:
+        try:
+            return local_theme_analysis(query, search_results, self._result_vectors(search_results))
+        except Exception as e:
+            logger.error(f"Error analyzing themes locally: {str(e)}")
+            return self._theme_error(str(e))
+    
+    def _precomputed_theme_analysis(self, query: str, search_results: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Analyze themes from the index instead of the LLM ("local" and "corpus" modes)."""
+        theme_map = self.theme_map
+        if Config.THEME_ANALYSIS_MODE == "corpus" and theme_map:
+            theme_analysis = corpus_theme_analysis(query, search_results, theme_map)
+            if theme_analysis["themes"]:
+                return theme_analysis
+        # Chunks indexed without a theme cluster are clustered on the fly
+        return self._local_theme_analysis(query, search_results)
+    
+    def get_theme_map(self) -> List[Dict[str, Any]]:
+        """List the corpus theme clusters, largest first."""
+        theme_map = self.theme_map
+        if not theme_map:
+            return []
+        return sorted(theme_map["clusters"], key=lambda cluster: -cluster["size"])
+    
+    @traced("analyze_themes")
+    def analyze_themes(self, query: str, search_results: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Analyze common themes across search results."""
+        if search_results and Config.THEME_ANALYSIS_MODE != "llm":
+            return self._precomputed_theme_analysis(query, search_results)
+        if not self.chat_llm or not search_results:
+            return {"themes": [], "summary": "Unable to analyze themes"}
         
         try:
-            self.vector_store.save_local(save_path)
-            
-            # Save enhanced metadata
-            metadata = {
-                "num_documents": len(self.processed_documents),
-                "num_chunks": self.vector_store.index.ntotal,
-                "embedding_model": Config.EMBEDDINGS_MODEL,
-                "processed_files": [
-                    {
-                        "source": doc.metadata.get("source", ""),
-                        "type": doc.metadata.get("type", ""),
-                        "word_count": doc.metadata.get("word_count", 0),
-                        "processed_at": doc.metadata.get("processed_at", "")
-                    } for doc in self.processed_documents
-                ],
-                "created_at": datetime.now().isoformat(),
-                "chunk_size": self.text_splitter._chunk_size,
-                "chunk_overlap": self.text_splitter._chunk_overlap
-            }
-            
-            with open(f"{save_path}/{Config.ENHANCED_METADATA_FILENAME}", "w") as f:
-                json.dump(metadata, f, indent=2)
+            with pipeline_metrics.timed("theme_llm"):
+                response = self.chat_llm.invoke(self._theme_analysis_prompt(query, search_results))
+                annotate(**token_usage(response))
+            return self._parse_theme_response(response.content)
             
-            logger.info(f"Enhanced vector store saved to {save_path}")
+        except Exception as e:
+            logger.error(f"Error analyzing themes: {str(e)}")
+            return self._theme_error(str(e))
+    
+    @traced("analyze_themes")
+    async def aanalyze_themes(self, query: str, search_results: List[Dict[str, Any]],
+                              timeout: Optional[float] = Config.THEME_ANALYSIS_TIMEOUT_SECONDS) -> Dict[str, Any]:
+        """
+        Analyze common themes through the LLM's async interface.
+        
+        Gives up after timeout seconds so a slow theme call never holds back the caller.
+        The local modes run inline, so callers sharing an event loop should run
+        analyze_themes on a worker thread for them instead.
+        """
+        if search_results and Config.THEME_ANALYSIS_MODE != "llm":
+            return self._precomputed_theme_analysis(query, search_results)
+        if not self.chat_llm or not search_results:
+            return {"themes": [], "summary": "Unable to analyze themes"}
+        
+        try:
+            with pipeline_metrics.timed("theme_llm"):
+                response = await asyncio.wait_for(
+                    self.chat_llm.ainvoke(self._theme_analysis_prompt(query, search_results)),
+                    timeout=timeout
+                )
+                annotate(**token_usage(response))
+            return self._parse_theme_response(response.content)
             
+        except asyncio.TimeoutError:
+            logger.warning(f"Theme analysis timed out after {timeout}s")
+            return self._theme_error(f"timed out after {timeout}s")
         except Exception as e:
-            logger.error(f"Error saving vector store: {str(e)}")
+            logger.error(f"Error analyzing themes: {str(e)}")
+            return self._theme_error(str(e))
+    
+    def save_vector_store(self, save_path: str) -> bool:
+        """
+        Save the vector store as a new versioned snapshot with enhanced metadata.
+        
+        Only segments not already present under save_path are written; the new version
+        becomes visible through an atomic pointer switch once everything is on disk.
+        The store's lock is held throughout, so concurrent savers of the same path take
+        turns. Returns whether the snapshot was published.
+        """
+        with self._write_lock, snapshot_store.store_lock(save_path):
+            snapshot = self._snapshot
+            vector_store, tombstones, segments = snapshot.vector_store, snapshot.tombstones, snapshot.segments
+            
+            if not vector_store:
+                logger.error("No vector store to save. Create one first.")
+                return False
+            
+            started = time.perf_counter()
+            try:
+                os.makedirs(save_path, exist_ok=True)
+                
+                written = 0
+                for segment in segments:
+                    if snapshot_store.segment_exists(save_path, segment["id"]):
+                        continue
+                    
+                    count = segment["end"] - segment["start"]
+                    vectors = vector_store.index.reconstruct_n(segment["start"], count)
+                    chunks = []
+                    for position in range(segment["start"], segment["end"]):
+                        docstore_id = vector_store.index_to_docstore_id[position]
+                        doc = vector_store.docstore.search(docstore_id)
+                        chunks.append({"id": docstore_id, "page_content": doc.page_content, "metadata": doc.metadata})
+                    
+                    # Signatures are kept so later appends dedup against these chunks without re-hashing them
+                    signatures = [(snapshot.signatures or {}).get(chunk["id"]) for chunk in chunks]
+                    signatures = np.stack(signatures) if chunks and all(s is not None for s in signatures) else None
+                    
+                    snapshot_store.write_segment(
+                        save_path, segment["id"], vectors, chunks, signatures, metric_type=vector_store.index.metric_type
+                    )
+                    written += 1
+                
+                # Save enhanced metadata
+                metadata = {
+                    "num_documents": len(snapshot.processed_documents),
+                    "num_chunks": vector_store.index.ntotal - len(tombstones),
+                    "embedding_model": Config.EMBEDDINGS_MODEL,
+                    "processed_files": [
+                        {
+                            "source": doc.metadata.get("source", ""),
+                            "type": doc.metadata.get("type", ""),
+                            "word_count": doc.metadata.get("word_count", 0),
+                            "processed_at": doc.metadata.get("processed_at", ""),
+                            "content_sha256": doc.metadata.get("content_sha256")
+                        } for doc in snapshot.processed_documents
+                    ],
+                    "created_at": datetime.now().isoformat(),
+                    "chunk_size": self.text_splitter._chunk_size,
+                    "chunk_overlap": self.text_splitter._chunk_overlap
+                }
+                
+                version = snapshot_store.publish_manifest(save_path, {
+                    "created_at": metadata["created_at"],
+                    "dimension": vector_store.index.d,
+                    "metric_type": int(vector_store.index.metric_type),
+                    "segments": [segment["id"] for segment in segments],
+                    "tombstones": sorted(tombstones),
+                    "metadata": metadata,
+                    "theme_map": {
+                        "clusters": snapshot.theme_map["clusters"],
+                        "centroids": snapshot.theme_map["centroids"].tolist()
+                    } if snapshot.theme_map else None
+                })
+                snapshot_store.atomic_write_json(f"{save_path}/{Config.ENHANCED_METADATA_FILENAME}", metadata)
+                snapshot_store.collect_garbage(save_path)
+                self.snapshot_version = version
+                
+                logger.info(f"Enhanced vector store saved to {save_path} as version {version} "
+                            f"({written} of {len(segments)} segments written)")
+                pipeline_metrics.observe("save", time.perf_counter() - started, items=written)
+                return True
+                
+            except Exception as e:
+                logger.error(f"Error saving vector store: {str(e)}")
+                pipeline_metrics.observe("save", time.perf_counter() - started, items=0, error=True)
+                return False
+    
+    @staticmethod
+    def vector_store_exists(path: str) -> bool:
+        """Check whether a saved vector store exists at the given path."""
+        return snapshot_store.has_snapshot(path) or os.path.exists(os.path.join(path, "index.faiss"))
+    
+    def estimate_memory_bytes(self) -> int:
+        """Estimate the memory held by the loaded vector store (vectors plus chunk text)."""
+        vector_store = self._snapshot.vector_store
+        if not vector_store:
+            return 0
+        
+        index = vector_store.index
+        vector_bytes = index.ntotal * index.d * 4
+        text_bytes = sum(len(doc.page_content) for doc in vector_store.docstore._dict.values())
+        return vector_bytes + text_bytes
+    
+    def _load_snapshot(self, manifest: Dict[str, Any],
+                       segment_data: List[Tuple[Any, List[Dict[str, Any]], Optional[np.ndarray]]]) -> FAISS:
+        """
+        Assemble the vector store of a snapshot version from its segments' indexes, chunks and signatures.
+        
+        Each segment's index becomes a part of the store's SegmentedIndex as read, so memory-mapped
+        segment files are searched in place rather than copied into one index.
+        """
+        dimension = manifest["dimension"]
+        index = SegmentedIndex(dimension, manifest.get("metric_type", faiss.METRIC_L2))
+        docstore_ids, docs, segments = [], [], []
+        signatures = {}
+        position = 0
+        
+        for segment_id, (segment_index, chunks, segment_signatures) in zip(manifest["segments"], segment_data):
+            if segment_signatures is not None and segment_signatures.shape == (len(chunks), Config.MINHASH_NUM_PERM):
+                signatures.update(zip((chunk["id"] for chunk in chunks), segment_signatures))
+            index = index.with_part(segment_index)
+            docstore_ids.extend(chunk["id"] for chunk in chunks)
+            docs.extend(Document(page_content=chunk["page_content"], metadata=chunk["metadata"]) for chunk in chunks)
+            # Segments already on disk are never rewritten by later saves
+            segments.append({"id": segment_id, "start": position, "end": position + len(chunks)})
+            position += len(chunks)
+        
+        vector_store = self._faiss_from_index(index, docstore_ids, docs)
+        
+        theme_map = manifest.get("theme_map")
+        theme_map = {
+            "clusters": theme_map["clusters"],
+            "centroids": np.asarray(theme_map["centroids"], dtype=np.float32)
+        } if theme_map else None
+        
+        with self._write_lock:
+            self._set_vector_store(
+                vector_store, manifest.get("tombstones"), segments, signatures=signatures, theme_map=theme_map,
+                processed_documents=self._file_documents(manifest.get("metadata", {}))
+            )
+        self.snapshot_version = manifest["version"]
+        
+        logger.info(f"Loaded snapshot version {manifest['version']} with {len(segments)} segments")
+        return vector_store
+    
+    @staticmethod
+    def _file_documents(metadata: Dict[str, Any]) -> tuple:
+        """File-level documents from saved metadata, so later saves still describe every processed file."""
+        return tuple(
+            Document(page_content="", metadata=file_metadata)
+            for file_metadata in metadata.get("processed_files", [])
+        )
     
     def load_vector_store(self, load_path: str) -> FAISS:
         """Load a FAISS vector store from disk."""
+        started = time.perf_counter()
         try:
-            vector_store = FAISS.load_local(
-                load_path, 
-                self.embeddings, 
-                allow_dangerous_deserialization=Config.ENABLE_DANGEROUS_DESERIALIZATION
-            )
-            self.vector_store = vector_store
-            
-            # Load enhanced metadata if available
-            metadata_path = f"{load_path}/{Config.ENHANCED_METADATA_FILENAME}"
-            if os.path.exists(metadata_path):
-                with open(metadata_path, "r") as f:
-                    metadata = json.load(f)
-                logger.info(f"Loaded enhanced vector store with {metadata.get('num_chunks', 'unknown')} chunks")
+            # Savers do not collect the segments of a version while it is being read
+            with snapshot_store.store_lock(load_path, shared=True):
+                manifest = snapshot_store.read_current_manifest(load_path)
+                segment_data = [
+                    (*snapshot_store.read_segment(load_path, segment_id, manifest.get("metric_type", faiss.METRIC_L2)),
+                     snapshot_store.read_segment_signatures(load_path, segment_id))
+                    for segment_id in manifest["segments"]
+                ] if manifest else []
+            if manifest:
+                vector_store = self._load_snapshot(manifest, segment_data)
+                metadata = manifest.get("metadata", {})
+            else:
+                # Stores saved before versioned snapshots were introduced
+                vector_store = FAISS.load_local(
+                    load_path, 
+                    self.embeddings, 
+                    allow_dangerous_deserialization=Config.ENABLE_DANGEROUS_DESERIALIZATION
+                )
+                index = vector_store.index
+                vector_store.index = SegmentedIndex(index.d, index.metric_type, (index,))
+                
+                # Load enhanced metadata if available
+                metadata = {}
+                metadata_path = f"{load_path}/{Config.ENHANCED_METADATA_FILENAME}"
+                if os.path.exists(metadata_path):
+                    with open(metadata_path, "r") as f:
+                        metadata = json.load(f)
+                
+                with self._write_lock:
+                    self._set_vector_store(vector_store, metadata.get("tombstones"),
+                                           [self._new_segment(0, vector_store.index.ntotal)],
+                                           theme_map=None, processed_documents=self._file_documents(metadata))
             
+            logger.info(f"Loaded enhanced vector store with {metadata.get('num_chunks', 'unknown')} chunks")
             logger.info(f"Vector store loaded from {load_path}")
+            pipeline_metrics.observe("load", time.perf_counter() - started, items=vector_store.index.ntotal)
             return vector_store
             
         except Exception as e:
             logger.error(f"Error loading vector store: {str(e)}")
+            pipeline_metrics.observe("load", time.perf_counter() - started, items=0, error=True)
             return None
@@ -0,0 +1,304 @@
+# Shared gateway for LLM calls
+# Every chat, theme and OCR request goes through one process-wide gateway that pools HTTP
+# connections, limits concurrency and request rate, retries transient failures with jittered
+# backoff and records per-call latency.
+
+import time
+import random
+import asyncio
+import logging
+import threading
+import weakref
+from collections import defaultdict, deque
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+
+import groq
+import httpx
+
+from rag_elements.config import Config
+from rag_elements.llm_providers import create_chat_model
+from rag_elements.tracing import annotate
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """Token-bucket rate limiter shared by threads and event loops."""
+
+    def __init__(self, rate_per_second: float, capacity: float):
+        self.rate = rate_per_second
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_acquire(self) -> float:
+        """
+        Take a token if one is available.
+
+        Returns 0.0 when a token was taken, otherwise how many seconds until one will be.
+        Nothing is taken while the caller waits, so a caller cancelled while waiting owes nothing.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self):
+        """Block until a token is taken."""
+        while True:
+            wait = self.try_acquire()
+            if not wait:
+                return
+            time.sleep(wait)
+
+    async def aacquire(self):
+        """Wait without blocking the event loop until a token is taken."""
+        while True:
+            wait = self.try_acquire()
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+
+class LLMMetrics:
+    """Per-model call counts, failures, retries and latency percentiles."""
+
+    def __init__(self, window: int = Config.LLM_METRICS_WINDOW):
+        self._lock = threading.Lock()
+        self._calls = defaultdict(int)
+        self._errors = defaultdict(int)
+        self._retries = defaultdict(int)
+        self._latencies = defaultdict(lambda: deque(maxlen=window))
+
+    def record(self, key: Tuple[str, str], latency: float, success: bool):
+        with self._lock:
+            self._calls[key] += 1
+            if not success:
+                self._errors[key] += 1
+            self._latencies[key].append(latency)
+
+    def record_retry(self, key: Tuple[str, str]):
+        with self._lock:
+            self._retries[key] += 1
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            result = {}
+            for key in self._calls:
+                latencies = sorted(self._latencies[key])
+                result[f"{key[0]}:{key[1]}"] = {
+                    "calls": self._calls[key],
+                    "errors": self._errors[key],
+                    "retries": self._retries[key],
+                    "latency_p50_ms": round(latencies[len(latencies) // 2] * 1000, 1) if latencies else None,
+                    "latency_p95_ms": round(latencies[int(len(latencies) * 0.95)] * 1000, 1) if latencies else None
+                }
+            return result
+
+
+def is_retryable(error: Exception) -> bool:
+    """Whether an LLM call failure is transient (rate limits, server errors, network problems)."""
+    if isinstance(error, (groq.APIConnectionError, groq.APITimeoutError, httpx.TransportError, asyncio.TimeoutError)):
+        return True
+    return getattr(error, "status_code", None) in RETRYABLE_STATUS_CODES
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """Seconds the server asked us to wait, if it said so."""
+    response = getattr(error, "response", None)
+    try:
+        return float(response.headers["retry-after"])
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return None
+
+
+class LLMGateway:
+    """
+    Process-wide gateway for LLM calls.
+
+    Clients are shared per (model, API key) and use pooled HTTP connections. A global
+    semaphore caps calls in flight and a token bucket caps the request rate; transient
+    failures are retried with full-jitter exponential backoff. The rate and burst are split
+    evenly between the server's worker processes, each of which has its own gateway.
+    """
+
+    def __init__(self, max_concurrency: int = Config.LLM_MAX_CONCURRENCY,
+                 requests_per_minute: float = Config.LLM_REQUESTS_PER_MINUTE,
+                 max_retries: int = Config.LLM_MAX_RETRIES,
+                 base_url: Optional[str] = Config.LLM_BASE_URL,
+                 workers: int = Config.SERVER_WORKERS):
+        self.max_retries = max_retries
+        self.base_url = base_url
+        self.metrics = LLMMetrics()
+
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+        workers = max(1, workers)
+        self._bucket = TokenBucket(requests_per_minute / 60.0 / workers, max(1.0, Config.LLM_BURST / workers))
+        self._lock = threading.Lock()
+
+        limits = httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency)
+        self._limits = limits
+        self._http_client = httpx.Client(limits=limits, timeout=Config.LLM_REQUEST_TIMEOUT_SECONDS)
+        # httpx async clients are bound to the event loop they first run on
+        self._async_http_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+        self._clients: Dict[Tuple[str, str], "GatewayChatModel"] = {}
+
+    def client(self, model: str, api_key: str) -> "GatewayChatModel":
+        """Get the shared chat model for a model name and API key."""
+        with self._lock:
+            key = (model, api_key)
+            if key not in self._clients:
+                self._clients[key] = GatewayChatModel(self, model, api_key)
+            return self._clients[key]
+
+    def _chat_model(self, model: str, api_key: str, http_async_client: Optional[httpx.AsyncClient] = None):
+        """Create a chat model of the configured provider on the gateway's HTTP clients."""
+        return create_chat_model(
+            model, api_key, base_url=self.base_url,
+            http_client=self._http_client, http_async_client=http_async_client
+        )
+
+    def _async_http_client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if loop not in self._async_http_clients:
+                self._async_http_clients[loop] = httpx.AsyncClient(
+                    limits=self._limits, timeout=Config.LLM_REQUEST_TIMEOUT_SECONDS
+                )
+            return self._async_http_clients[loop]
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        retry_after = _retry_after(error)
+        if retry_after is not None:
+            return min(retry_after, Config.LLM_MAX_BACKOFF_SECONDS)
+        return random.uniform(0, min(Config.LLM_MAX_BACKOFF_SECONDS, Config.LLM_BASE_BACKOFF_SECONDS * 2 ** attempt))
+
+    def call(self, key: Tuple[str, str], func, *args, **kwargs):
+        """Run a blocking LLM call under the limits, retrying transient failures."""
+        for attempt in range(self.max_retries + 1):
+            self._bucket.acquire()
+            started = time.perf_counter()
+            with self._semaphore:
+                try:
+                    result = func(*args, **kwargs)
+                    self.metrics.record(key, time.perf_counter() - started, True)
+                    annotate(llm_attempts=attempt + 1)
+                    return result
+                except Exception as e:
+                    self.metrics.record(key, time.perf_counter() - started, False)
+                    if attempt == self.max_retries or not is_retryable(e):
+                        raise
+                    error = e
+            self.metrics.record_retry(key)
+            delay = self._backoff(attempt, error)
+            logger.warning(f"LLM call to {key[0]} failed ({str(error)}); retrying in {delay:.2f}s")
+            time.sleep(delay)
+
+    async def _acquire(self):
+        # Poll rather than block a thread so cancellation never leaks a permit
+        while not self._semaphore.acquire(blocking=False):
+            await asyncio.sleep(Config.LLM_SEMAPHORE_POLL_SECONDS)
+
+    async def acall(self, key: Tuple[str, str], func, *args, **kwargs):
+        """Await an LLM call under the limits, retrying transient failures."""
+        for attempt in range(self.max_retries + 1):
+            await self._bucket.aacquire()
+            await self._acquire()
+            started = time.perf_counter()
+            try:
+                result = await func(*args, **kwargs)
+                self.metrics.record(key, time.perf_counter() - started, True)
+                annotate(llm_attempts=attempt + 1)
+                return result
+            except Exception as e:
+                self.metrics.record(key, time.perf_counter() - started, False)
+                if attempt == self.max_retries or not is_retryable(e):
+                    raise
+                error = e
+            finally:
+                self._semaphore.release()
+            self.metrics.record_retry(key)
+            delay = self._backoff(attempt, error)
+            logger.warning(f"LLM call to {key[0]} failed ({str(error)}); retrying in {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+    async def astream(self, key: Tuple[str, str], make_stream) -> AsyncIterator[Any]:
+        """
+        Stream an LLM response under the limits.
+
+        Failures are retried only until the first chunk arrives; after that they propagate.
+        """
+        for attempt in range(self.max_retries + 1):
+            await self._bucket.aacquire()
+            await self._acquire()
+            started = time.perf_counter()
+            streamed = False
+            try:
+                async for chunk in make_stream():
+                    streamed = True
+                    yield chunk
+                self.metrics.record(key, time.perf_counter() - started, True)
+                return
+            except Exception as e:
+                self.metrics.record(key, time.perf_counter() - started, False)
+                if streamed or attempt == self.max_retries or not is_retryable(e):
+                    raise
+                error = e
+            finally:
+                self._semaphore.release()
+            self.metrics.record_retry(key)
+            delay = self._backoff(attempt, error)
+            logger.warning(f"LLM stream from {key[0]} failed ({str(error)}); retrying in {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+
+class GatewayChatModel:
+    """Chat model facade whose invoke/ainvoke/astream calls go through the gateway."""
+
+    def __init__(self, gateway: LLMGateway, model: str, api_key: str):
+        self.gateway = gateway
+        self.model = model
+        self.api_key = api_key
+        self._sync_model = gateway._chat_model(model, api_key)
+        self._async_models: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Any]" = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def _async_model(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if loop not in self._async_models:
+                self._async_models[loop] = self.gateway._chat_model(
+                    self.model, self.api_key, self.gateway._async_http_client()
+                )
+            return self._async_models[loop]
+
+    def invoke(self, messages, **kwargs):
+        return self.gateway.call((self.model, "invoke"), self._sync_model.invoke, messages, **kwargs)
+
+    async def ainvoke(self, messages, **kwargs):
+        return await self.gateway.acall((self.model, "ainvoke"), self._async_model().ainvoke, messages, **kwargs)
+
+    async def astream(self, messages, **kwargs):
+        model = self._async_model()
+        async for chunk in self.gateway.astream((self.model, "astream"), lambda: model.astream(messages, **kwargs)):
+            yield chunk
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def get_llm_gateway() -> LLMGateway:
+    """Get the process-wide LLM gateway."""
+    global _gateway
+    with _gateway_lock:
+        if _gateway is None:
+            _gateway = LLMGateway()
+        return _gateway
@@ -0,0 +1,151 @@
+# LLM providers
+# This file maps Config.LLM_PROVIDER to the chat model class the LLM gateway wraps. Besides GROQ
+# it contains a deterministic local stand-in used for offline development and load testing.
+
+import re
+import json
+import time
+import random
+import asyncio
+import hashlib
+import threading
+from collections import Counter
+from typing import Any, AsyncIterator, List, Optional
+
+import httpx
+from langchain_groq import ChatGroq
+from langchain.schema.messages import AIMessage, AIMessageChunk
+
+from rag_elements.config import Config
+
+
+class FakeLLMError(Exception):
+    """Injected failure; looks like a transient server error so the gateway retries it."""
+
+    status_code = 503
+
+
+class FakeChatModel:
+    """
+    Deterministic chat model that never leaves the machine.
+
+    Answers are derived from the prompt text, so the same prompt always gets the same
+    answer. Latency is a fixed time-to-first-token plus a steady token rate, and errors
+    are injected from a seeded random sequence at the configured rate.
+    """
+
+    def __init__(self, model: str,
+                 latency_ms: float = Config.FAKE_LLM_LATENCY_MS,
+                 tokens_per_second: float = Config.FAKE_LLM_TOKENS_PER_SECOND,
+                 error_rate: float = Config.FAKE_LLM_ERROR_RATE,
+                 seed: int = Config.FAKE_LLM_SEED):
+        self.model = model
+        self.latency_ms = latency_ms
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _prompt_text(messages: Any) -> str:
+        if isinstance(messages, str):
+            return messages
+        parts = []
+        for message in messages:
+            content = getattr(message, "content", message)
+            if isinstance(content, list):
+                parts.extend(item.get("text", "") for item in content if isinstance(item, dict))
+            else:
+                parts.append(str(content))
+        return "\n".join(parts)
+
+    def _response_text(self, messages: Any) -> str:
+        prompt = self._prompt_text(messages)
+        if isinstance(messages, list) and any(
+            isinstance(getattr(message, "content", None), list) for message in messages
+        ):
+            digest = hashlib.sha256(prompt.encode()).hexdigest()[:12]
+            return f"Fake OCR text {digest}"
+
+        words = re.findall(r"[a-z]{4,}", prompt.lower())
+        top_words = [word for word, _ in Counter(words).most_common(5)] or ["content"]
+
+        if '"themes"' in prompt:
+            return json.dumps({
+                "themes": [
+                    {"name": word.title(), "description": f"Passages mentioning {word}", "frequency": "varies"}
+                    for word in top_words[:3]
+                ],
+                "summary": f"The excerpts mostly discuss {', '.join(top_words[:3])}.",
+                "insights": [f"'{word}' recurs across the excerpts" for word in top_words[:2]]
+            })
+
+        # Deterministic filler sized like a real answer
+        rng = random.Random(hashlib.sha256(prompt.encode()).hexdigest())
+        filler = [rng.choice(words or top_words) for _ in range(Config.FAKE_LLM_RESPONSE_WORDS)]
+        return f"Based on the documents, the key topics are {', '.join(top_words)}. " + " ".join(filler)
+
+    def _tokens(self, text: str) -> List[str]:
+        return re.findall(r"\S+\s*", text)
+
+    def _maybe_fail(self):
+        with self._lock:
+            failed = self.error_rate and self._random.random() < self.error_rate
+        if failed:
+            raise FakeLLMError(f"Injected failure from fake model '{self.model}'")
+
+    def _duration(self, text: str) -> float:
+        return self.latency_ms / 1000 + len(self._tokens(text)) / self.tokens_per_second
+
+    def _message(self, messages: Any, text: str) -> AIMessage:
+        # Reports token usage the way hosted providers do, counting whitespace-separated words
+        input_tokens, output_tokens = len(self._tokens(self._prompt_text(messages))), len(self._tokens(text))
+        return AIMessage(content=text, usage_metadata={
+            "input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": input_tokens + output_tokens
+        })
+
+    def invoke(self, messages: Any, **kwargs) -> AIMessage:
+        self._maybe_fail()
+        text = self._response_text(messages)
+        time.sleep(self._duration(text))
+        return self._message(messages, text)
+
+    async def ainvoke(self, messages: Any, **kwargs) -> AIMessage:
+        self._maybe_fail()
+        text = self._response_text(messages)
+        await asyncio.sleep(self._duration(text))
+        return self._message(messages, text)
+
+    async def astream(self, messages: Any, **kwargs) -> AsyncIterator[AIMessageChunk]:
+        self._maybe_fail()
+        await asyncio.sleep(self.latency_ms / 1000)
+        for token in self._tokens(self._response_text(messages)):
+            await asyncio.sleep(1 / self.tokens_per_second)
+            yield AIMessageChunk(content=token)
+
+
+def provider_requires_api_key(provider: Optional[str] = None) -> bool:
+    """Whether the configured provider needs an API key."""
+    return (provider or Config.LLM_PROVIDER) != "fake"
+
+
+def create_chat_model(model: str, api_key: Optional[str], base_url: Optional[str] = None,
+                      http_client: Optional[httpx.Client] = None,
+                      http_async_client: Optional[httpx.AsyncClient] = None,
+                      provider: Optional[str] = None):
+    """Create the underlying chat model for the configured provider."""
+    provider = provider or Config.LLM_PROVIDER
+    if provider == "fake":
+        return FakeChatModel(model)
+    if provider == "groq":
+        # The gateway owns retries, so the SDK's own retries are disabled
+        return ChatGroq(
+            model=model,
+            api_key=api_key,
+            base_url=base_url,
+            max_retries=0,
+            timeout=Config.LLM_REQUEST_TIMEOUT_SECONDS,
+            http_client=http_client,
+            http_async_client=http_async_client
+        )
+    raise ValueError(f"Unknown LLM provider: '{provider}'")
@@ -0,0 +1,158 @@
+# Pipeline latency metrics
+# Every stage of ingestion and chat (parsing, OCR, chunking, embedding, FAISS search, LLM calls,
+# save/load) records its latency here; /metrics renders them in the Prometheus text format.
+
+import bisect
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Tuple
+
+from rag_elements.config import Config
+from rag_elements.tracing import span
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+LabelSet = Tuple[Tuple[str, str], ...]
+
+
+class StageTimer:
+    """Handle yielded by PipelineMetrics.timed; set items to the number of things the stage processed."""
+
+    def __init__(self, items: int = 1):
+        self.items = items
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(labels: LabelSet, **extra: str) -> str:
+    pairs = list(labels) + list(extra.items())
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class PipelineMetrics:
+    """
+    Latency histograms and counters for pipeline stages, kept in process memory.
+
+    Each observation is keyed by stage name and labels. Histogram buckets, sums and
+    counts cover the life of the process; percentiles are computed over the last
+    Config.METRICS_WINDOW observations and throughput over the last
+    Config.METRICS_THROUGHPUT_WINDOW_SECONDS.
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = Config.METRICS_LATENCY_BUCKETS_SECONDS,
+                 window: int = Config.METRICS_WINDOW):
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._bucket_counts: Dict[LabelSet, List[int]] = defaultdict(lambda: [0] * len(self.buckets))
+        self._sums: Dict[LabelSet, float] = defaultdict(float)
+        self._counts: Dict[LabelSet, int] = defaultdict(int)
+        self._items: Dict[LabelSet, int] = defaultdict(int)
+        self._errors: Dict[LabelSet, int] = defaultdict(int)
+        # (finished at, seconds, items) of recent observations
+        self._recent: Dict[LabelSet, deque] = defaultdict(lambda: deque(maxlen=window))
+
+    @staticmethod
+    def _key(stage: str, labels: Dict[str, str]) -> LabelSet:
+        return (("stage", stage),) + tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+    def observe(self, stage: str, seconds: float, items: int = 1, error: bool = False, **labels: str):
+        """Record one run of a stage that took seconds and processed items things."""
+        key = self._key(stage, labels)
+        with self._lock:
+            bucket_counts = self._bucket_counts[key]
+            bucket = bisect.bisect_left(self.buckets, seconds)
+            if bucket < len(bucket_counts):
+                bucket_counts[bucket] += 1
+            self._sums[key] += seconds
+            self._counts[key] += 1
+            self._items[key] += items
+            if error:
+                self._errors[key] += 1
+            self._recent[key].append((time.monotonic(), seconds, items))
+
+    @contextmanager
+    def timed(self, stage: str, items: int = 1, **labels: str) -> Iterator[StageTimer]:
+        """
+        Time the enclosed block as one run of a stage; exceptions are counted as errors.
+
+        Inside a traced request the block is also recorded as a span of the trace.
+        """
+        timer = StageTimer(items)
+        with span(stage, **labels) as current:
+            started = time.perf_counter()
+            try:
+                yield timer
+            except BaseException:
+                self.observe(stage, time.perf_counter() - started, timer.items, error=True, **labels)
+                raise
+            finally:
+                if current is not None:
+                    current.attributes["items"] = timer.items
+            self.observe(stage, time.perf_counter() - started, timer.items, **labels)
+
+    def render(self) -> str:
+        """Render every stage in the Prometheus text exposition format."""
+        now = time.monotonic()
+        window = Config.METRICS_THROUGHPUT_WINDOW_SECONDS
+        with self._lock:
+            keys = sorted(self._counts)
+            histograms = {key: (list(self._bucket_counts[key]), self._sums[key], self._counts[key]) for key in keys}
+            recent = {key: list(self._recent[key]) for key in keys}
+            items = dict(self._items)
+            errors = dict(self._errors)
+
+        lines = [
+            "# HELP rag_stage_duration_seconds Latency of pipeline stages.",
+            "# TYPE rag_stage_duration_seconds histogram"
+        ]
+        for key in keys:
+            bucket_counts, total, count = histograms[key]
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                cumulative += bucket_count
+                lines.append(f"rag_stage_duration_seconds_bucket{_format_labels(key, le=_format_value(bound))} {cumulative}")
+            lines.append(f"rag_stage_duration_seconds_bucket{_format_labels(key, le='+Inf')} {count}")
+            lines.append(f"rag_stage_duration_seconds_sum{_format_labels(key)} {total}")
+            lines.append(f"rag_stage_duration_seconds_count{_format_labels(key)} {count}")
+
+        lines += [
+            f"# HELP rag_stage_latency_seconds Latency percentiles of the last {Config.METRICS_WINDOW} runs of pipeline stages.",
+            "# TYPE rag_stage_latency_seconds gauge"
+        ]
+        for key in keys:
+            latencies = sorted(seconds for _, seconds, _ in recent[key])
+            for quantile in QUANTILES:
+                value = latencies[min(len(latencies) - 1, int(quantile * len(latencies)))]
+                lines.append(f"rag_stage_latency_seconds{_format_labels(key, quantile=_format_value(quantile))} {value}")
+
+        lines += [
+            f"# HELP rag_stage_throughput_items_per_second Items processed by pipeline stages over the last {window:g}s.",
+            "# TYPE rag_stage_throughput_items_per_second gauge"
+        ]
+        for key in keys:
+            processed = sum(count for finished, _, count in recent[key] if now - finished <= window)
+            lines.append(f"rag_stage_throughput_items_per_second{_format_labels(key)} {processed / window}")
+
+        lines += [
+            "# HELP rag_stage_items_total Items (files, chunks, vectors, calls) processed by pipeline stages.",
+            "# TYPE rag_stage_items_total counter"
+        ]
+        lines += [f"rag_stage_items_total{_format_labels(key)} {items.get(key, 0)}" for key in keys]
+
+        lines += [
+            "# HELP rag_stage_errors_total Pipeline stage runs that raised an exception.",
+            "# TYPE rag_stage_errors_total counter"
+        ]
+        lines += [f"rag_stage_errors_total{_format_labels(key)} {errors.get(key, 0)}" for key in keys]
+        return "\n".join(lines) + "\n"
+
+
+pipeline_metrics = PipelineMetrics()
@@ -0,0 +1,164 @@
+# Re-ranking helpers for search results
+# This file contains the diversity and cross-encoder re-ranking used by
+# EnhancedDocumentProcessor.search_with_citations
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Tuple
+
+import numpy as np
+
+from rag_elements.config import Config
+
+logger = logging.getLogger(__name__)
+
+
+def maximal_marginal_relevance(
+    query_vector: np.ndarray,
+    candidate_vectors: np.ndarray,
+    k: int,
+    lambda_mult: float = 0.5,
+    relevance: Optional[np.ndarray] = None
+) -> List[int]:
+    """
+    Select k diverse candidates using maximal marginal relevance.
+
+    Relevance defaults to each candidate's cosine similarity to the query; pass relevance
+    (scaled to [0, 1]) to rank by other scores, such as a cross-encoder's.
+    Returns the positions (into candidate_vectors) of the selected candidates, in selection order.
+    All similarities are computed up front with matrix products; the greedy loop only runs k times.
+    """
+    num_candidates = len(candidate_vectors)
+    if num_candidates == 0 or k <= 0:
+        return []
+
+    # Normalize so that dot products are cosine similarities
+    candidates = np.asarray(candidate_vectors, dtype=np.float32)
+    candidates = candidates / np.maximum(np.linalg.norm(candidates, axis=1, keepdims=True), 1e-12)
+    query = np.asarray(query_vector, dtype=np.float32).reshape(-1)
+    query = query / max(float(np.linalg.norm(query)), 1e-12)
+
+    relevance = candidates @ query if relevance is None else np.asarray(relevance, dtype=np.float32)
+    pairwise_similarity = candidates @ candidates.T
+
+    selected = [int(np.argmax(relevance))]
+    max_similarity_to_selected = pairwise_similarity[selected[0]].copy()
+    available = np.ones(num_candidates, dtype=bool)
+    available[selected[0]] = False
+
+    while len(selected) < min(k, num_candidates):
+        mmr_scores = lambda_mult * relevance - (1 - lambda_mult) * max_similarity_to_selected
+        mmr_scores[~available] = -np.inf
+        best = int(np.argmax(mmr_scores))
+
+        selected.append(best)
+        available[best] = False
+        np.maximum(max_similarity_to_selected, pairwise_similarity[best], out=max_similarity_to_selected)
+
+    return selected
+
+
+def scaled_scores(scores: List[Optional[float]]) -> np.ndarray:
+    """Min-max scale cross-encoder scores to [0, 1] for use as MMR relevance; unscored candidates get 0."""
+    scored = np.array([score for score in scores if score is not None], dtype=np.float32)
+    if not len(scored):
+        return np.zeros(len(scores), dtype=np.float32)
+
+    low, spread = float(scored.min()), float(scored.max() - scored.min())
+    return np.array([
+        0.0 if score is None else (score - low) / spread if spread else 1.0
+        for score in scores
+    ], dtype=np.float32)
+
+
+class CrossEncoderReranker:
+    """
+    Re-rank search results with a small local cross-encoder running on CPU.
+
+    Scores are cached per (query, chunk_id), candidates are scored in batches and
+    scoring stops once the time budget is spent; unscored candidates keep their
+    bi-encoder order after the scored ones.
+    """
+
+    def __init__(self, model_name: str = Config.CROSS_ENCODER_MODEL,
+                 batch_size: int = Config.RERANK_BATCH_SIZE,
+                 time_budget_ms: float = Config.RERANK_TIME_BUDGET_MS,
+                 cache_size: int = Config.RERANK_CACHE_SIZE):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.time_budget_ms = time_budget_ms
+        self.cache_size = cache_size
+        self._model = None
+        self._cache: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get_model(self):
+        """Load the cross-encoder on first use."""
+        if self._model is None:
+            from sentence_transformers import CrossEncoder
+            self._model = CrossEncoder(self.model_name, device="cpu")
+            logger.info(f"Loaded cross-encoder model: {self.model_name}")
+        return self._model
+
+    def _cache_get(self, key: Tuple[str, str]) -> Optional[float]:
+        with self._lock:
+            score = self._cache.get(key)
+            if score is not None:
+                self._cache.move_to_end(key)
+            return score
+
+    def _cache_put(self, key: Tuple[str, str], score: float):
+        with self._lock:
+            self._cache[key] = score
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def score(self, query: str, results: List[Dict[str, Any]]) -> List[Optional[float]]:
+        """Score the results against the query, in their order; None for results the time budget left unscored."""
+        scores: Dict[int, float] = {}
+        pending = []
+        for i, result in enumerate(results):
+            cached = self._cache_get((query, result["chunk_id"]))
+            if cached is not None:
+                scores[i] = cached
+            else:
+                pending.append(i)
+
+        start = time.perf_counter()
+        for batch_start in range(0, len(pending), self.batch_size):
+            if (time.perf_counter() - start) * 1000 > self.time_budget_ms:
+                logger.info(f"Re-ranking time budget exhausted, {len(pending) - batch_start} candidates left unscored")
+                break
+
+            batch = pending[batch_start:batch_start + self.batch_size]
+            pairs = [(query, results[i]["content"]) for i in batch]
+            batch_scores = self._get_model().predict(pairs, batch_size=self.batch_size, show_progress_bar=False)
+
+            for i, score in zip(batch, batch_scores):
+                scores[i] = float(score)
+                self._cache_put((query, results[i]["chunk_id"]), float(score))
+
+        return [scores.get(i) for i in range(len(results))]
+
+    def rerank(self, query: str, results: List[Dict[str, Any]], top_k: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Return the results ordered by cross-encoder score, truncated to top_k."""
+        if not results:
+            return results
+
+        scores = self.score(query, results)
+        scored = sorted((i for i, score in enumerate(scores) if score is not None), key=lambda i: scores[i], reverse=True)
+        unscored = [i for i, score in enumerate(scores) if score is None]
+
+        reranked = [with_rerank_score(results[i], scores[i]) for i in scored + unscored]
+        return reranked[:top_k] if top_k else reranked
+
+
+def with_rerank_score(result: Dict[str, Any], score: Optional[float]) -> Dict[str, Any]:
+    """Copy a search result, adding its cross-encoder score if it was scored."""
+    result = dict(result)
+    if score is not None:
+        result["rerank_score"] = score
+    return result
@@ -0,0 +1,92 @@
+# Segmented FAISS index
+# This file contains the index EnhancedDocumentProcessor keeps its vectors in: one flat FAISS index
+# per ingestion segment, searched as a single index, so appending never copies the existing vectors
+
+from typing import Any, List, Optional, Tuple
+
+import faiss
+import numpy as np
+
+
+class SegmentedIndex:
+    """
+    Immutable FAISS indexes, one per segment, searched as one index.
+
+    Positions run across the parts in order, as if their vectors were concatenated, and
+    the index answers the subset of the faiss.Index interface the processor uses (d,
+    ntotal, metric_type, search, reconstruct_batch, reconstruct_n). Parts are never
+    changed once added: appended() returns a new index sharing the existing parts, so
+    an index being searched is neither copied nor modified.
+    """
+
+    def __init__(self, d: int, metric_type: int = faiss.METRIC_L2, parts: Tuple[Any, ...] = ()):
+        self.d = d
+        self.metric_type = metric_type
+        self.parts = tuple(parts)
+        self._starts = np.cumsum([0] + [part.ntotal for part in self.parts], dtype=np.int64)
+        self.ntotal = int(self._starts[-1])
+
+    def appended(self, vectors: np.ndarray) -> "SegmentedIndex":
+        """A new index with the vectors added as a new flat part after the existing ones."""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32).reshape(-1, self.d)
+        if not len(vectors):
+            return self
+        part = faiss.IndexFlat(self.d, self.metric_type)
+        part.add(vectors)
+        return self.with_part(part)
+
+    def with_part(self, part: Any) -> "SegmentedIndex":
+        """A new index with a FAISS index added as a part after the existing ones."""
+        return SegmentedIndex(self.d, self.metric_type, self.parts + (part,))
+
+    def search_parameters(self, excluded: np.ndarray) -> List[Optional[Tuple[Any, Any]]]:
+        """Per-part search parameters that skip the excluded positions; pass them to search() as params."""
+        excluded = np.asarray(excluded, dtype=np.int64)
+        params = []
+        for start, end in zip(self._starts, self._starts[1:]):
+            local = excluded[(excluded >= start) & (excluded < end)] - start
+            if not len(local):
+                params.append(None)
+                continue
+            selector = faiss.IDSelectorNot(faiss.IDSelectorBatch(local))
+            # Keep the selector referenced alongside the parameters, which do not own it
+            params.append((faiss.SearchParameters(sel=selector), selector))
+        return params
+
+    def search(self, x: np.ndarray, k: int,
+               params: Optional[List[Optional[Tuple[Any, Any]]]] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Search every part and merge their hits; returns (distances, positions) like faiss.Index.search."""
+        x = np.ascontiguousarray(x, dtype=np.float32)
+        larger_is_better = self.metric_type == faiss.METRIC_INNER_PRODUCT
+        worst = -np.inf if larger_is_better else np.inf
+
+        all_distances = [np.full((len(x), k), worst, dtype=np.float32)]
+        all_positions = [np.full((len(x), k), -1, dtype=np.int64)]
+        for i, (part, start) in enumerate(zip(self.parts, self._starts)):
+            if not part.ntotal:
+                continue
+            part_params = params[i] if params else None
+            if part_params:
+                distances, labels = part.search(x, min(k, part.ntotal), params=part_params[0])
+            else:
+                distances, labels = part.search(x, min(k, part.ntotal))
+            all_distances.append(np.where(labels >= 0, distances, worst))
+            all_positions.append(np.where(labels >= 0, labels + start, -1))
+
+        distances, positions = np.hstack(all_distances), np.hstack(all_positions)
+        order = np.argsort(-distances if larger_is_better else distances, axis=1, kind="stable")[:, :k]
+        return np.take_along_axis(distances, order, axis=1), np.take_along_axis(positions, order, axis=1)
+
+    def reconstruct_batch(self, positions: np.ndarray) -> np.ndarray:
+        """Stored vectors at the given positions."""
+        positions = np.asarray(positions, dtype=np.int64)
+        vectors = np.empty((len(positions), self.d), dtype=np.float32)
+        owners = np.searchsorted(self._starts, positions, side="right") - 1
+        for owner in np.unique(owners):
+            mask = owners == owner
+            vectors[mask] = self.parts[owner].reconstruct_batch(positions[mask] - self._starts[owner])
+        return vectors
+
+    def reconstruct_n(self, start: int, n: int) -> np.ndarray:
+        """Stored vectors at positions start to start + n."""
+        return self.reconstruct_batch(np.arange(start, start + n, dtype=np.int64))
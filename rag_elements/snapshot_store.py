@@ -0,0 +1,256 @@
+# Versioned, crash-safe snapshots of a vector store on disk
+#
+# Layout under a store directory:
+#   segments/<segment_id>/index.faiss   flat FAISS index of the chunks added in one ingestion
+#                                       (vectors.npy in stores written before segments were indexes)
+#   segments/<segment_id>/chunks.json   the chunks' ids, content and metadata
+#   segments/<segment_id>/signatures.npy  the chunks' MinHash signatures, when near-duplicate detection kept them
+#   versions/<version>.json             manifest listing the segments and tombstones of a version
+#   CURRENT                             name of the manifest of the live version
+#
+# Segments are immutable once written, so a new version only writes the segments it adds.
+# A version becomes visible when CURRENT is atomically replaced, which happens after every
+# file it references has been fsynced. Savers hold the store's lock (store_lock) from their
+# first segment write until garbage collection is done, so savers in other threads or
+# processes never collect segments that are about to be published.
+#
+# Segment indexes are memory-mapped when read, so worker processes that load the same store
+# share their vectors through the page cache instead of each holding a copy.
+
+import os
+import json
+import shutil
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+import faiss
+import numpy as np
+
+from rag_elements.config import Config
+
+try:
+    import fcntl
+except ImportError:  # Windows: stores are only locked within one process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+CURRENT_POINTER = "CURRENT"
+SEGMENTS_DIR = "segments"
+VERSIONS_DIR = "versions"
+LOCK_FILE = ".lock"
+TMP_MARKER = ".tmp-"
+
+_process_locks: Dict[str, threading.Lock] = {}
+_process_locks_guard = threading.Lock()
+
+
+@contextmanager
+def store_lock(root: str, shared: bool = False):
+    """
+    Hold a store's lock across threads and processes.
+
+    Saving (writing segments, publishing a manifest and collecting garbage) takes it
+    exclusively; loading takes it shared so no segment of the version being read is
+    collected meanwhile.
+    """
+    if shared and not os.path.isdir(root):
+        yield
+        return
+    os.makedirs(root, exist_ok=True)
+
+    if fcntl is None:
+        with _process_locks_guard:
+            lock = _process_locks.setdefault(os.path.realpath(root), threading.Lock())
+        with lock:
+            yield
+        return
+
+    # Every caller opens its own descriptor, so threads of one process exclude each other too
+    with open(os.path.join(root, LOCK_FILE), "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _fsync_dir(path: str):
+    """Flush a directory entry so renames inside it survive a crash."""
+    if not hasattr(os, "O_DIRECTORY"):
+        return
+    fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def atomic_write_json(path: str, data: Any):
+    """Write JSON to a temporary file, fsync it and rename it over the target."""
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    _fsync_dir(os.path.dirname(path) or ".")
+
+
+def has_snapshot(root: str) -> bool:
+    """Check whether a directory holds a versioned snapshot."""
+    return os.path.exists(os.path.join(root, CURRENT_POINTER))
+
+
+def segment_exists(root: str, segment_id: str) -> bool:
+    return os.path.isdir(os.path.join(root, SEGMENTS_DIR, segment_id))
+
+
+def write_segment(root: str, segment_id: str, vectors: np.ndarray, chunks: List[Dict[str, Any]],
+                  signatures: Optional[np.ndarray] = None, metric_type: int = faiss.METRIC_L2):
+    """Write an immutable segment into a temporary directory and rename it into place."""
+    segments_root = os.path.join(root, SEGMENTS_DIR)
+    os.makedirs(segments_root, exist_ok=True)
+
+    final_dir = os.path.join(segments_root, segment_id)
+    tmp_dir = f"{final_dir}{TMP_MARKER}{os.getpid()}"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    index = faiss.IndexFlat(vectors.shape[1], metric_type)
+    index.add(vectors)
+    with open(os.path.join(tmp_dir, "index.faiss"), "wb") as f:
+        f.write(faiss.serialize_index(index).tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    with open(os.path.join(tmp_dir, "chunks.json"), "w") as f:
+        json.dump(chunks, f)
+        f.flush()
+        os.fsync(f.fileno())
+    if signatures is not None:
+        with open(os.path.join(tmp_dir, "signatures.npy"), "wb") as f:
+            np.save(f, np.ascontiguousarray(signatures, dtype=np.uint32))
+            f.flush()
+            os.fsync(f.fileno())
+    _fsync_dir(tmp_dir)
+
+    os.rename(tmp_dir, final_dir)
+    _fsync_dir(segments_root)
+
+
+def read_segment(root: str, segment_id: str, metric_type: int = faiss.METRIC_L2) -> Tuple[Any, List[Dict[str, Any]]]:
+    """
+    Read a segment's chunks and open its FAISS index.
+
+    The index is memory-mapped from the segment's file, read-only, so its vectors are shared
+    through the page cache by every worker that loads them. Segments written as vectors.npy
+    are loaded into a private index with the given metric.
+    """
+    segment_dir = os.path.join(root, SEGMENTS_DIR, segment_id)
+    index_path = os.path.join(segment_dir, "index.faiss")
+    if os.path.exists(index_path):
+        index = faiss.read_index(index_path, faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY)
+    else:
+        vectors = np.load(os.path.join(segment_dir, "vectors.npy"))
+        index = faiss.IndexFlat(vectors.shape[1], metric_type)
+        index.add(np.ascontiguousarray(vectors, dtype=np.float32))
+    with open(os.path.join(segment_dir, "chunks.json"), "r") as f:
+        chunks = json.load(f)
+    return index, chunks
+
+
+def read_segment_signatures(root: str, segment_id: str) -> Optional[np.ndarray]:
+    """Read the MinHash signatures of a segment's chunks, or None if it was written without them."""
+    path = os.path.join(root, SEGMENTS_DIR, segment_id, "signatures.npy")
+    return np.load(path) if os.path.exists(path) else None
+
+
+def read_current_manifest(root: str) -> Optional[Dict[str, Any]]:
+    """Read the manifest of the live version, if there is one."""
+    pointer_path = os.path.join(root, CURRENT_POINTER)
+    if not os.path.exists(pointer_path):
+        return None
+
+    with open(pointer_path, "r") as f:
+        manifest_name = f.read().strip()
+    with open(os.path.join(root, VERSIONS_DIR, manifest_name), "r") as f:
+        return json.load(f)
+
+
+def read_current_version(root: str) -> Optional[int]:
+    """Version number of the live snapshot, read from the pointer alone so polling it is cheap."""
+    try:
+        with open(os.path.join(root, CURRENT_POINTER), "r") as f:
+            return int(f.read().strip().split(".")[0])
+    except (OSError, ValueError):
+        return None
+
+
+def publish_manifest(root: str, manifest: Dict[str, Any]) -> int:
+    """
+    Write a new version's manifest and atomically make it the live version.
+
+    The caller holds store_lock(root), so the version number cannot be taken twice.
+    """
+    current = read_current_manifest(root)
+    version = (current["version"] + 1) if current else 1
+    manifest = {**manifest, "version": version}
+
+    versions_root = os.path.join(root, VERSIONS_DIR)
+    os.makedirs(versions_root, exist_ok=True)
+    manifest_name = f"{version:08d}.json"
+    atomic_write_json(os.path.join(versions_root, manifest_name), manifest)
+
+    tmp_pointer = os.path.join(root, f"{CURRENT_POINTER}.tmp-{os.getpid()}")
+    with open(tmp_pointer, "w") as f:
+        f.write(manifest_name)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_pointer, os.path.join(root, CURRENT_POINTER))
+    _fsync_dir(root)
+
+    return version
+
+
+def collect_garbage(root: str, keep_versions: int = Config.SNAPSHOT_KEEP_VERSIONS):
+    """
+    Delete old manifests and any segment not referenced by a retained version.
+
+    The caller holds store_lock(root). Temporary directories and segments written after
+    the newest manifest are left alone: they belong to a save that has not published yet.
+    """
+    versions_root = os.path.join(root, VERSIONS_DIR)
+    segments_root = os.path.join(root, SEGMENTS_DIR)
+    if not os.path.isdir(versions_root):
+        return
+
+    manifests = sorted(name for name in os.listdir(versions_root) if name.endswith(".json"))
+    if not manifests:
+        return
+    retained, expired = manifests[-keep_versions:], manifests[:-keep_versions]
+    newest_published = os.path.getmtime(os.path.join(versions_root, manifests[-1]))
+
+    referenced = set()
+    for name in retained:
+        with open(os.path.join(versions_root, name), "r") as f:
+            referenced.update(json.load(f).get("segments", []))
+
+    for name in expired:
+        os.remove(os.path.join(versions_root, name))
+
+    removed = 0
+    if os.path.isdir(segments_root):
+        for entry in os.listdir(segments_root):
+            if entry in referenced or TMP_MARKER in entry:
+                continue
+            segment_dir = os.path.join(segments_root, entry)
+            if os.path.getmtime(segment_dir) > newest_published:
+                continue
+            shutil.rmtree(segment_dir, ignore_errors=True)
+            removed += 1
+
+    if expired or removed:
+        logger.info(f"Snapshot GC removed {len(expired)} old versions and {removed} unreferenced segments")
@@ -0,0 +1,231 @@
+# Local theme analysis
+# This file contains the k-means clustering and TF-IDF keyphrase labelling used when
+# Config.THEME_ANALYSIS_MODE is "local" or "corpus", so themes are computed without an LLM call
+
+import re
+import math
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from rag_elements.config import Config
+
+_STOPWORDS = frozenset("""
+a about above after again against all also am an and any are as at be because been before being below
+between both but by can could did do does doing down during each few for from further had has have having
+he her here hers herself him himself his how i if in into is it its itself just me more most my myself no
+nor not now of off on once only or other our ours ourselves out over own same she should so some such than
+that the their theirs them themselves then there these they this those through to too under until up very
+was we were what when where which while who whom why will with would you your yours yourself yourselves
+may might must shall us one two however thus therefore within without upon via per etc
+""".split())
+
+
+def kmeans(vectors: np.ndarray, k: int, max_iterations: int = Config.KMEANS_MAX_ITERATIONS,
+           seed: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Cluster row vectors with k-means (k-means++ seeding, cosine geometry).
+
+    Returns (labels, centroids); centroids are unit length.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    points = vectors / np.where(norms == 0, 1, norms)
+    n = len(points)
+    k = max(1, min(k, n))
+
+    # k-means++: spread the initial centroids out
+    rng = np.random.RandomState(seed)
+    centroids = [points[rng.randint(n)]]
+    for _ in range(1, k):
+        distances = np.min(1 - points @ np.array(centroids).T, axis=1).clip(min=0)
+        total = distances.sum()
+        probabilities = distances / total if total > 0 else np.full(n, 1 / n)
+        centroids.append(points[rng.choice(n, p=probabilities)])
+    centroids = np.array(centroids)
+
+    labels = np.full(n, -1)
+    for _ in range(max_iterations):
+        new_labels = np.argmax(points @ centroids.T, axis=1)
+        if np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+        for cluster in range(k):
+            members = points[labels == cluster]
+            if len(members):
+                centroid = members.mean(axis=0)
+                centroids[cluster] = centroid / (np.linalg.norm(centroid) or 1)
+
+    return labels, centroids
+
+
+def _terms(text: str) -> List[str]:
+    """Unigram and bigram keyphrase candidates of a text, without stopwords."""
+    words = re.findall(r"[a-z][a-z0-9\-]+", text.lower())
+    unigrams = [word for word in words if word not in _STOPWORDS and len(word) > 2]
+    bigrams = [
+        f"{first} {second}" for first, second in zip(words, words[1:])
+        if first not in _STOPWORDS and second not in _STOPWORDS and len(first) > 2 and len(second) > 2
+    ]
+    return unigrams + bigrams
+
+
+def top_keyphrases(texts: List[str], labels: np.ndarray, top_n: int = Config.LOCAL_THEME_KEYPHRASES,
+                   document_frequencies: Optional[Counter] = None, num_documents: Optional[int] = None) -> Dict[int, List[str]]:
+    """
+    Label each cluster with its highest-scoring TF-IDF keyphrases.
+
+    Document frequencies default to those of texts; pass corpus-wide counts for sharper IDF.
+    """
+    term_counts = [Counter(_terms(text)) for text in texts]
+    if document_frequencies is None:
+        document_frequencies = Counter(term for counts in term_counts for term in counts)
+        num_documents = len(texts)
+
+    keyphrases = {}
+    for cluster in sorted(set(int(label) for label in labels)):
+        scores = Counter()
+        for counts, label in zip(term_counts, labels):
+            if label != cluster:
+                continue
+            total = sum(counts.values()) or 1
+            for term, count in counts.items():
+                idf = math.log((1 + num_documents) / (1 + document_frequencies.get(term, 0))) + 1
+                scores[term] += (count / total) * idf
+
+        ranked = [term for term, _ in scores.most_common()]
+        # Skip unigrams already covered by a higher-ranked bigram
+        chosen = []
+        for term in ranked:
+            if any(term in phrase.split() for phrase in chosen if " " in phrase):
+                continue
+            chosen.append(term)
+            if len(chosen) == top_n:
+                break
+        keyphrases[cluster] = chosen
+
+    return keyphrases
+
+
+def local_theme_analysis(query: str, search_results: List[Dict[str, Any]], vectors: np.ndarray,
+                         max_clusters: int = Config.LOCAL_THEME_MAX_CLUSTERS) -> Dict[str, Any]:
+    """Group search results into themes by clustering their vectors, in the LLM analysis format."""
+    if not search_results:
+        return {"themes": [], "summary": "Unable to analyze themes"}
+
+    labels, _ = kmeans(vectors, max_clusters)
+    keyphrases = top_keyphrases([result["content"] for result in search_results], labels)
+
+    themes, insights = [], []
+    clusters = sorted(keyphrases, key=lambda cluster: -int(np.sum(labels == cluster)))
+    for cluster in clusters:
+        members = [result for result, label in zip(search_results, labels) if label == cluster]
+        phrases = keyphrases[cluster] or ["general content"]
+        name = phrases[0].title()
+        sources = sorted({Path(member["source"]).name for member in members})
+
+        themes.append({
+            "name": name,
+            "description": f"Excerpts about {', '.join(phrases)}",
+            "frequency": f"{len(members)} of {len(search_results)} excerpts"
+        })
+        insights.append(f"'{name}' draws on {', '.join(sources)}")
+
+    summary = (
+        f"The {len(search_results)} excerpts retrieved for '{query}' group into {len(themes)} theme(s): "
+        + "; ".join(f"{theme['name']} ({theme['frequency']})" for theme in themes)
+    )
+    return {"themes": themes, "summary": summary, "insights": insights}
+
+
+def build_theme_map(texts: List[str], sources: List[str], vectors: np.ndarray,
+                    num_clusters: int = Config.CORPUS_THEME_CLUSTERS,
+                    sample_size: int = Config.CORPUS_THEME_SAMPLE_SIZE) -> Tuple[Dict[str, Any], np.ndarray]:
+    """
+    Cluster every chunk of a corpus and label the clusters with corpus-wide TF-IDF keyphrases.
+
+    Centroids are fitted on a random sample of at most sample_size chunks and every chunk is
+    then assigned to its nearest centroid. Returns the theme map and the chunk labels.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if len(vectors) > sample_size:
+        sample = np.random.RandomState(0).choice(len(vectors), sample_size, replace=False)
+        _, centroids = kmeans(vectors[sample], num_clusters)
+    else:
+        _, centroids = kmeans(vectors, num_clusters)
+    labels = assign_clusters(vectors, centroids)
+
+    keyphrases = top_keyphrases(texts, labels)
+    clusters = []
+    for cluster in range(len(centroids)):
+        members = labels == cluster
+        phrases = keyphrases.get(cluster) or ["general content"]
+        source_counts = Counter(source for source, member in zip(sources, members) if member)
+        clusters.append({
+            "id": cluster,
+            "name": phrases[0].title(),
+            "keyphrases": phrases,
+            "size": int(members.sum()),
+            "top_sources": [Path(source).name for source, _ in source_counts.most_common(5)]
+        })
+
+    return {"clusters": clusters, "centroids": centroids}, labels
+
+
+def recount_theme_map(theme_map: Dict[str, Any], metadatas: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    A copy of a theme map whose cluster sizes and top sources count only the given chunks.
+
+    metadatas are those of the chunks still in the collection; each is counted in the
+    cluster of its "theme_cluster" label, and chunks without one are skipped.
+    """
+    source_counts = {cluster["id"]: Counter() for cluster in theme_map["clusters"]}
+    for metadata in metadatas:
+        counts = source_counts.get(metadata.get("theme_cluster"))
+        if counts is not None:
+            counts[metadata.get("source", "")] += 1
+
+    clusters = [
+        {
+            **cluster,
+            "size": sum(source_counts[cluster["id"]].values()),
+            "top_sources": [Path(source).name for source, _ in source_counts[cluster["id"]].most_common(5)]
+        }
+        for cluster in theme_map["clusters"]
+    ]
+    return {**theme_map, "clusters": clusters}
+
+
+def assign_clusters(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Assign row vectors to their nearest (cosine) centroid."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return np.argmax((vectors / np.where(norms == 0, 1, norms)) @ centroids.T, axis=1)
+
+
+def corpus_theme_analysis(query: str, search_results: List[Dict[str, Any]],
+                          theme_map: Dict[str, Any]) -> Dict[str, Any]:
+    """Look up the precomputed themes of the clusters the search results belong to."""
+    clusters = {cluster["id"]: cluster for cluster in theme_map["clusters"]}
+    hits = Counter(result["theme_cluster"] for result in search_results if result.get("theme_cluster") in clusters)
+    if not hits:
+        return {"themes": [], "summary": "Unable to analyze themes"}
+
+    themes, insights = [], []
+    for cluster_id, count in hits.most_common():
+        cluster = clusters[cluster_id]
+        themes.append({
+            "name": cluster["name"],
+            "description": f"Excerpts about {', '.join(cluster['keyphrases'])}",
+            "frequency": f"{count} of {len(search_results)} excerpts ({cluster['size']} chunks in the collection)"
+        })
+        if cluster["top_sources"]:
+            insights.append(f"'{cluster['name']}' is covered mostly by {', '.join(cluster['top_sources'])}")
+
+    summary = (
+        f"The excerpts retrieved for '{query}' fall into {len(themes)} of the collection's "
+        f"{len(clusters)} themes: " + "; ".join(theme["name"] for theme in themes)
+    )
+    return {"themes": themes, "summary": summary, "insights": insights}
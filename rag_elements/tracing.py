@@ -0,0 +1,174 @@
+# Request tracing
+# A trace records the spans (name, start/end times and attributes such as k, cache hits and
+# token counts) of the pipeline stages one request ran through. The active trace lives in a
+# context variable, so stages record into it from coroutines, tasks and executor threads alike.
+
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from rag_elements.config import Config
+
+
+class Span:
+    """One timed stage of a traced request."""
+
+    __slots__ = ("name", "parent", "start", "end", "attributes", "error")
+
+    def __init__(self, name: str, parent: Optional[str] = None, start: Optional[float] = None,
+                 attributes: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.parent = parent
+        self.start = time.perf_counter() if start is None else start
+        self.end: Optional[float] = None
+        self.attributes = dict(attributes or {})
+        self.error: Optional[str] = None
+
+
+class Trace:
+    """The spans of one request, in the order they started."""
+
+    def __init__(self, **attributes: Any):
+        self.id = uuid.uuid4().hex
+        self.started_at = datetime.now().isoformat()
+        self.attributes = attributes
+        self._origin = time.perf_counter()
+        self._end: Optional[float] = None
+        self._spans: List[Span] = []
+        # Stages running in executor threads record concurrently
+        self._lock = threading.Lock()
+
+    def add(self, span: Span):
+        with self._lock:
+            self._spans.append(span)
+
+    def finish(self):
+        """Mark the end of the request; later calls keep the first end time."""
+        if self._end is None:
+            self._end = time.perf_counter()
+
+    def _ms(self, moment: float) -> float:
+        return round((moment - self._origin) * 1000, 3)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """The trace as JSON-serializable data; times are milliseconds since the request started."""
+        with self._lock:
+            spans = sorted(self._spans, key=lambda span: span.start)
+        end = self._end if self._end is not None else time.perf_counter()
+        return {
+            "id": self.id,
+            "started_at": self.started_at,
+            "duration_ms": self._ms(end),
+            "attributes": self.attributes,
+            "spans": [
+                {
+                    "name": span.name,
+                    "parent": span.parent,
+                    "start_ms": self._ms(span.start),
+                    "end_ms": self._ms(span.end),
+                    "duration_ms": round((span.end - span.start) * 1000, 3),
+                    "attributes": span.attributes,
+                    "error": span.error
+                } for span in spans
+            ]
+        }
+
+
+current_trace: ContextVar[Optional[Trace]] = ContextVar("current_trace", default=None)
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Optional[Span]]:
+    """Record the enclosed block as a span of the current trace; does nothing outside a trace."""
+    trace = current_trace.get()
+    if trace is None:
+        yield None
+        return
+
+    parent = _current_span.get()
+    current = Span(name, parent.name if parent else None, attributes=attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = str(e) or type(e).__name__
+        raise
+    finally:
+        current.end = time.perf_counter()
+        _current_span.reset(token)
+        trace.add(current)
+
+
+def record_span(name: str, started: float, error: Optional[str] = None, **attributes: Any):
+    """
+    Record a stage that started at time.perf_counter() value started and has just ended.
+
+    For stages that cannot be wrapped in span(), such as async generators that yield
+    across the stage.
+    """
+    trace = current_trace.get()
+    if trace is None:
+        return
+    parent = _current_span.get()
+    finished = Span(name, parent.name if parent else None, start=started, attributes=attributes)
+    finished.end = time.perf_counter()
+    finished.error = error
+    trace.add(finished)
+
+
+def annotate(**attributes: Any):
+    """Add attributes to the innermost active span, or to the trace itself outside any span."""
+    current = _current_span.get()
+    if current is not None:
+        current.attributes.update(attributes)
+        return
+    trace = current_trace.get()
+    if trace is not None:
+        trace.attributes.update(attributes)
+
+
+def traced(name: str) -> Callable:
+    """Decorator recording every call of a function or coroutine function as a span."""
+    def decorator(func: Callable) -> Callable:
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def token_usage(message: Any) -> Dict[str, int]:
+    """Input and output token counts an LLM reported for a response, when it reported them."""
+    usage = getattr(message, "usage_metadata", None) or {}
+    return {name: usage[name] for name in ("input_tokens", "output_tokens") if name in usage}
+
+
+_write_lock = threading.Lock()
+
+
+def write_trace(trace: Trace, path: Optional[str] = Config.TRACE_LOG_PATH):
+    """Append a trace as one JSON line to path."""
+    if not path:
+        return
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    line = json.dumps(trace.to_dict(), default=str) + "\n"
+    # One write per trace on an O_APPEND file keeps lines from several workers intact
+    with _write_lock, open(path, "a", encoding="utf-8") as f:
+        f.write(line)
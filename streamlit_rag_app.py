@@ -1,6 +1,7 @@
 import streamlit as st
 import os
 import sys
+import asyncio
 import tempfile
 import shutil
 import json
@@ -14,10 +15,12 @@ import plotly.express as px
 import plotly.graph_objects as go
 from datetime import datetime
 
-# Add the rag_elements directory to the path
+# Add the rag_elements and backend directories to the path
 sys.path.append(os.path.join(os.path.dirname(__file__), 'rag_elements'))
+sys.path.append(os.path.join(os.path.dirname(__file__), 'backend'))
 
 from rag_elements.enhanced_vectordb import EnhancedDocumentProcessor
+from utils import generate_response_with_themes
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -442,11 +445,10 @@ class AgenticRAGChatApp:
                         st.session_state.messages.append({"role": "assistant", "content": response})
                         return
                     
-                    # Analyze themes
-                    theme_analysis = self.processor.analyze_themes(prompt, search_results)
-                    
-                    # Generate response based on search results
-                    response = self.generate_response(prompt, search_results, theme_analysis)
+                    # Generate the response and analyze themes concurrently, as the API does
+                    response, theme_analysis = asyncio.run(
+                        generate_response_with_themes(self.processor, prompt, search_results)
+                    )
                     
                     # Display response
                     st.markdown(response)
@@ -495,48 +497,6 @@ class AgenticRAGChatApp:
                     st.error(error_msg)
                     st.session_state.messages.append({"role": "assistant", "content": error_msg})
     
-    def generate_response(self, query: str, search_results: List[Dict], theme_analysis: Dict) -> str:
-        """Generate a comprehensive response based on search results and theme analysis."""
-        if not self.processor.chat_llm:
-            # Fallback response without LLM
-            response_parts = [
-                f"Based on your query '{query}', I found {len(search_results)} relevant document sections.",
-                "\n**Key Information:**"
-            ]
-            
-            for i, result in enumerate(search_results[:3], 1):
-                content_preview = result['content'][:200] + "..." if len(result['content']) > 200 else result['content']
-                response_parts.append(f"\n{i}. From {result['citation']}: {content_preview}")
-            
-            return "\n".join(response_parts)
-        
-        try:
-            # Use LLM to generate comprehensive response
-            context_content = "\n\n".join([f"Document {i+1} ({result['citation']}):\n{result['content']}" 
-                                         for i, result in enumerate(search_results)])
-            
-            response_prompt = f"""
-            Based on the following document excerpts, provide a comprehensive answer to the user's query: "{query}"
-            
-            Document excerpts:
-            {context_content}
-            
-            Please provide:
-            1. A direct answer to the user's question
-            2. Key points from the documents
-            3. Any relevant details or context
-            4. Connections between different sources if applicable
-            
-            Make sure to reference the information from the documents and provide a helpful, accurate response.
-            """
-            
-            llm_response = self.processor.chat_llm.invoke(response_prompt)
-            return llm_response.content
-            
-        except Exception as e:
-            # Fallback to simple response
-            return f"Based on your query '{query}', I found relevant information in {len(search_results)} document sections. Please see the citations below for detailed information."
-    
     def run(self):
         """Run the Streamlit application."""
         # Render sidebar
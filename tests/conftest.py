@@ -0,0 +1,17 @@
+"""
+Shared setup for the unit tests.
+
+Unit tests run offline against the deterministic fake LLM and embeddings; the
+endpoint tests talk to a running server and are unaffected by these settings.
+"""
+
+import os
+import sys
+
+os.environ.setdefault("LLM_PROVIDER", "fake")
+os.environ.setdefault("EMBEDDINGS_PROVIDER", "fake")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (ROOT, os.path.join(ROOT, "backend")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
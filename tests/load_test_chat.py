@@ -0,0 +1,108 @@
+"""
+Load test for the /chat pipeline.
+
+Start the server with the deterministic local LLM so runs are reproducible offline:
+
+    LLM_PROVIDER=fake EMBEDDINGS_PROVIDER=fake LLM_REQUESTS_PER_MINUTE=6000 python backend/main.py
+
+then run:
+
+    python tests/load_test_chat.py --requests 200 --concurrency 20
+
+FAKE_LLM_LATENCY_MS, FAKE_LLM_TOKENS_PER_SECOND and FAKE_LLM_ERROR_RATE shape the fake model.
+"""
+
+import argparse
+import os
+import secrets
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+QUESTIONS = [
+    "What are the main topics of the documents?",
+    "Summarize the findings about retrieval quality.",
+    "Which sources discuss latency?",
+    "How is the vector index persisted?",
+    "What limitations are mentioned?"
+]
+
+
+def create_corpus(collection: str, base_url: str, headers: dict, num_files: int = 5):
+    """Upload a small synthetic corpus into the collection."""
+    paragraphs = [
+        "Retrieval quality depends on chunking, embeddings and re-ranking. ",
+        "Latency is dominated by LLM generation while retrieval takes milliseconds. ",
+        "The vector index is persisted as versioned snapshots with immutable segments. ",
+        "Limitations include the context window and the cost of theme analysis. "
+    ]
+    files = []
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for i in range(num_files):
+            path = os.path.join(temp_dir, f"load_test_{i}.txt")
+            with open(path, "w") as f:
+                f.write("".join(paragraphs[(i + j) % len(paragraphs)] * 5 for j in range(len(paragraphs))))
+            files.append(path)
+
+        handles = [("files", (os.path.basename(path), open(path, "rb"), "text/plain")) for path in files]
+        try:
+            response = requests.post(
+                f"{base_url}/upload-files", files=handles, data={"collection": collection}, headers=headers
+            )
+        finally:
+            for _, (_, handle, _) in handles:
+                handle.close()
+    response.raise_for_status()
+
+    # Files are processed in a background job
+    job_id = response.json()["job_id"]
+    while True:
+        job = requests.get(f"{base_url}/jobs/{job_id}", headers=headers).json()
+        if job["status"] == "failed":
+            raise RuntimeError(f"Upload failed: {job['error']}")
+        if job["status"] == "completed":
+            return
+        time.sleep(0.5)
+
+
+def send_chat(base_url: str, collection: str, headers: dict, question: str):
+    started = time.perf_counter()
+    response = requests.post(f"{base_url}/chat", json={"message": question, "collection": collection}, headers=headers)
+    return time.perf_counter() - started, response.status_code
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the /chat endpoint")
+    parser.add_argument("--base-url", default="http://localhost:7860")
+    parser.add_argument("--collection", default="load-test")
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--session", default=secrets.token_urlsafe(16),
+                        help="session token; reuse one with --skip-upload to query an earlier corpus")
+    parser.add_argument("--skip-upload", action="store_true")
+    args = parser.parse_args()
+
+    # Collections are private to a session, so every request carries the same token
+    headers = {"X-Session-ID": args.session}
+    if not args.skip_upload:
+        create_corpus(args.collection, args.base_url, headers)
+
+    questions = [QUESTIONS[i % len(QUESTIONS)] for i in range(args.requests)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        results = list(executor.map(lambda question: send_chat(args.base_url, args.collection, headers, question), questions))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency for latency, _ in results)
+    failures = sum(1 for _, status in results if status != 200)
+    print(f"Requests:    {len(results)} ({failures} failed) at concurrency {args.concurrency}")
+    print(f"Throughput:  {len(results) / elapsed:.1f} req/s")
+    print(f"Latency p50: {statistics.median(latencies) * 1000:.0f} ms")
+    print(f"Latency p95: {latencies[int(len(latencies) * 0.95) - 1] * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
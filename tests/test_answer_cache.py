@@ -0,0 +1,76 @@
+"""
+Unit tests for the semantic answer cache (rag_elements/answer_cache.py).
+Run with: pytest tests/test_answer_cache.py -v
+"""
+
+import pytest
+
+from rag_elements.answer_cache import SemanticAnswerCache
+
+QUERY = [1.0, 0.0, 0.0]
+REWORDED = [0.98, 0.2, 0.0]
+DIFFERENT = [0.0, 1.0, 0.0]
+CHUNKS = ["chunk-a", "chunk-b"]
+THEMES = {"themes": []}
+
+
+class TestSemanticAnswerCache:
+    """Tests for looking up, expiring and evicting cached answers."""
+
+    @pytest.fixture
+    def cache(self):
+        return SemanticAnswerCache(similarity_threshold=0.95, max_entries=2, ttl_seconds=60)
+
+    def test_similar_query_over_same_chunks_hits(self, cache):
+        """Test that a reworded query retrieving the same chunks, in any order, gets the cached answer."""
+        cache.put(QUERY, CHUNKS, 1, "answer", THEMES)
+
+        assert cache.get(REWORDED, list(reversed(CHUNKS)), 1) == {"response": "answer", "themes": THEMES}
+        assert cache.stats() == {"entries": 1, "hits": 1, "misses": 0}
+
+    def test_dissimilar_query_or_other_chunks_miss(self, cache):
+        """Test that a query below the threshold, or one answered from other chunks, misses."""
+        cache.put(QUERY, CHUNKS, 1, "answer", THEMES)
+
+        assert cache.get(DIFFERENT, CHUNKS, 1) is None
+        assert cache.get(QUERY, ["chunk-a"], 1) is None
+        assert cache.stats()["misses"] == 2
+
+    def test_newer_store_version_drops_entries(self, cache):
+        """Test that a change to the vector store invalidates every cached answer."""
+        cache.put(QUERY, CHUNKS, 1, "answer", THEMES)
+
+        assert cache.get(QUERY, CHUNKS, 2) is None
+        assert cache.stats()["entries"] == 0
+
+    def test_answers_from_older_version_are_not_cached(self, cache):
+        """Test that an answer generated against an outdated store is neither stored nor served."""
+        cache.put(QUERY, CHUNKS, 2, "current", THEMES)
+        cache.put(DIFFERENT, CHUNKS, 1, "stale", THEMES)
+
+        assert cache.stats()["entries"] == 1
+        assert cache.get(QUERY, CHUNKS, 1) is None
+        assert cache.get(QUERY, CHUNKS, 2)["response"] == "current"
+
+    def test_expired_entries_miss(self, cache, monkeypatch):
+        """Test that entries older than the TTL are dropped."""
+        cache.put(QUERY, CHUNKS, 1, "answer", THEMES)
+        monkeypatch.setattr(cache, "ttl_seconds", -1)
+
+        assert cache.get(QUERY, CHUNKS, 1) is None
+        assert cache.stats()["entries"] == 0
+
+    def test_least_recently_used_is_evicted(self, cache):
+        """Test that a hit keeps an entry alive while the least recently used one is evicted."""
+        cache.put(QUERY, ["first"], 1, "first", THEMES)
+        cache.put(QUERY, ["second"], 1, "second", THEMES)
+        assert cache.get(QUERY, ["first"], 1)["response"] == "first"
+
+        cache.put(QUERY, ["third"], 1, "third", THEMES)
+        assert cache.get(QUERY, ["second"], 1) is None
+        assert cache.get(QUERY, ["first"], 1)["response"] == "first"
+        assert cache.get(QUERY, ["third"], 1)["response"] == "third"
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
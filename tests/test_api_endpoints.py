@@ -114,7 +114,7 @@ class RAGAPITester:
             }
             
             if result["success"]:
-                print("✓ Files uploaded and processed successfully")
+                print(f"✓ Files uploaded, processing in job {result['response']['job_id']}")
             else:
                 print(f"✗ Failed to upload files: {result['response']}")
         
@@ -149,7 +149,7 @@ class RAGAPITester:
         }
         
         if result["success"]:
-            print("✓ Directory processed successfully")
+            print(f"✓ Directory processing in job {result['response']['job_id']}")
         else:
             print(f"✗ Failed to process directory: {result['response']}")
         
@@ -176,6 +176,16 @@ class RAGAPITester:
         
         return result
     
+    def wait_for_job(self, job_id: str, timeout: int = 120) -> Dict[str, Any]:
+        """Poll a background job until it completes or fails."""
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            job = self.session.get(f"{self.base_url}/jobs/{job_id}").json()
+            if job.get("status") in ("completed", "failed"):
+                return job
+            time.sleep(1)
+        return {"status": "timeout", "error": f"Job {job_id} did not finish in {timeout}s"}
+    
     def test_save_vector_store(self) -> Dict[str, Any]:
         """Test saving vector store."""
         print("Testing save vector store endpoint...")
@@ -189,6 +199,11 @@ class RAGAPITester:
             "success": response.status_code == 200
         }
         
+        if result["success"]:
+            job = self.wait_for_job(result["response"]["job_id"])
+            result["job"] = job
+            result["success"] = job["status"] == "completed"
+        
         if result["success"]:
             print("✓ Vector store saved successfully")
         else:
@@ -209,6 +224,11 @@ class RAGAPITester:
             "success": response.status_code == 200
         }
         
+        if result["success"]:
+            job = self.wait_for_job(result["response"]["job_id"])
+            result["job"] = job
+            result["success"] = job["status"] == "completed"
+        
         if result["success"]:
             print("✓ Vector store loaded successfully")
         else:
@@ -0,0 +1,102 @@
+"""
+Unit tests for the collection registry (rag_elements/collection_registry.py).
+Run with: pytest tests/test_collection_registry.py -v
+"""
+
+import os
+import threading
+
+import pytest
+from langchain.schema import Document
+
+from rag_elements import snapshot_store
+from rag_elements.collection_registry import CollectionRegistry, fcntl
+from rag_elements.enhanced_vectordb import EnhancedDocumentProcessor
+
+
+def add_documents(registry: CollectionRegistry, name: str, count: int = 3):
+    with registry.writing(name, create=True) as processor:
+        processor.add_documents_to_vector_store([
+            Document(page_content=f"{name} document {i} about subject {i}. " * 10,
+                     metadata={"source": f"/x/{name}_{i}.txt", "type": "text"})
+            for i in range(count)
+        ])
+    registry.mark_updated(name)
+
+
+class TestCollectionRegistry:
+    """Tests for loading, saving and evicting collections."""
+
+    @pytest.fixture
+    def registry(self, tmp_path):
+        return CollectionRegistry(EnhancedDocumentProcessor, root_dir=str(tmp_path))
+
+    def test_save_and_reload(self, registry, tmp_path):
+        """Test that a saved collection loads into a fresh registry."""
+        add_documents(registry, "docs")
+        registry.save("docs")
+
+        other = CollectionRegistry(EnhancedDocumentProcessor, root_dir=str(tmp_path))
+        processor = other.get("docs")
+        assert processor.vector_store.index.ntotal == registry.get("docs").vector_store.index.ntotal
+
+    def test_eviction_spills_unsaved_changes(self, tmp_path):
+        """Test that evicting a collection over the memory budget saves it first."""
+        registry = CollectionRegistry(EnhancedDocumentProcessor, root_dir=str(tmp_path), memory_budget_mb=0)
+        add_documents(registry, "first")
+        add_documents(registry, "second")
+
+        assert not registry.is_loaded("first")
+        assert snapshot_store.has_snapshot(registry.path_for("first"))
+
+    @pytest.mark.skipif(fcntl is None, reason="needs POSIX file locks")
+    def test_save_waits_for_publish_lock(self, registry):
+        """Test that saving takes turns with a writer in another process holding the publish lock."""
+        add_documents(registry, "docs")
+        directory, collection = os.path.split(registry.path_for("docs"))
+
+        with open(os.path.join(directory, f".{collection}.lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            saver = threading.Thread(target=registry.save, args=("docs",))
+            saver.start()
+            saver.join(timeout=0.5)
+            assert saver.is_alive()
+            assert not snapshot_store.has_snapshot(registry.path_for("docs"))
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+        saver.join(timeout=10)
+        assert not saver.is_alive()
+        assert snapshot_store.has_snapshot(registry.path_for("docs"))
+
+
+    @pytest.mark.skipif(fcntl is None, reason="needs POSIX file locks")
+    def test_clear_waits_for_writers(self, registry):
+        """Test that clearing the registry does not drop a change a writer has yet to record."""
+        add_documents(registry, "docs")
+        registry.save("docs")
+        writing, cleared = threading.Event(), threading.Event()
+
+        def write():
+            with registry.writing("docs") as processor:
+                writing.set()
+                cleared.wait(timeout=0.5)
+                processor.add_documents_to_vector_store([
+                    Document(page_content="A late addition. " * 10, metadata={"source": "/x/late.txt", "type": "text"})
+                ])
+                registry.mark_updated("docs")
+
+        writer = threading.Thread(target=write)
+        writer.start()
+        writing.wait(timeout=10)
+        clearer = threading.Thread(target=lambda: (registry.clear(), cleared.set()))
+        clearer.start()
+        writer.join(timeout=10)
+        clearer.join(timeout=10)
+
+        assert not registry.is_loaded("docs")
+        sources = {doc.metadata["source"] for doc in registry.get("docs").vector_store.docstore._dict.values()}
+        assert "/x/late.txt" in sources
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,100 @@
+"""
+Unit tests for token-budgeted context packing (rag_elements/context_packing.py).
+Run with: pytest tests/test_context_packing.py -v
+"""
+
+import pytest
+
+from rag_elements import context_packing
+from rag_elements.config import Config
+from rag_elements.context_packing import count_tokens, format_context, pack_context
+
+OVERLAP = "shared overlap between the two neighbouring chunks"
+
+
+def result(source: str, chunk_index: int, content: str) -> dict:
+    return {
+        "source": source,
+        "page": None,
+        "chunk_index": chunk_index,
+        "content": content,
+        "citation": f"{source.rsplit('/', 1)[-1]}, Chunk {chunk_index + 1}"
+    }
+
+
+@pytest.fixture(autouse=True)
+def character_estimate(monkeypatch):
+    # Count tokens the same way with or without the tiktoken encoding available
+    monkeypatch.setattr(context_packing, "_encoding", context_packing._CharacterEstimate())
+
+
+class TestMergingAdjacentChunks:
+    """Tests for merging consecutive chunks of a source into one block."""
+
+    def test_adjacent_chunks_merge_without_overlap(self):
+        """Test that neighbouring chunks become one block and their overlap appears once."""
+        packed = pack_context([
+            result("/x/a.txt", 1, f"The second part ends with {OVERLAP}"),
+            result("/x/a.txt", 0, f"The first part ends with {OVERLAP}"),
+        ], token_budget=1000)
+
+        assert len(packed) == 1
+        assert packed[0]["citation"] == "a.txt, Chunks 1-2"
+        assert packed[0]["content"].startswith("The first part")
+        assert "The second part" in packed[0]["content"]
+
+    def test_overlap_is_stripped(self):
+        """Test that the repeated start of the following chunk is dropped."""
+        packed = pack_context([
+            result("/x/a.txt", 0, f"Opening sentence. {OVERLAP}"),
+            result("/x/a.txt", 1, f"{OVERLAP} and then the rest."),
+        ], token_budget=1000)
+
+        assert packed[0]["content"].count(OVERLAP) == 1
+        assert packed[0]["content"].endswith("and then the rest.")
+
+    def test_separate_blocks_keep_best_rank_order(self):
+        """Test that non-adjacent chunks stay separate, ordered by their best search rank."""
+        packed = pack_context([
+            result("/x/b.txt", 0, "Best ranked chunk."),
+            result("/x/a.txt", 0, "Second ranked chunk."),
+            result("/x/a.txt", 5, "Far away chunk of the same file."),
+        ], token_budget=1000)
+
+        assert [block["content"] for block in packed] == [
+            "Best ranked chunk.", "Second ranked chunk.", "Far away chunk of the same file."
+        ]
+
+
+class TestTokenBudget:
+    """Tests for fitting blocks into the token budget."""
+
+    def test_blocks_fit_budget_and_last_is_truncated(self):
+        """Test that whole blocks are added in rank order and the one that does not fit is cut."""
+        first = "A complete sentence about the topic. " * 20
+        second = "Another sentence that will be cut short. " * 40
+        budget = count_tokens(first) + Config.MIN_TRUNCATED_BLOCK_TOKENS + 10
+
+        packed = pack_context([result("/x/a.txt", 0, first), result("/x/b.txt", 0, second)], token_budget=budget)
+
+        assert packed[0]["content"] == first
+        assert packed[1]["content"].endswith(" ...")
+        assert count_tokens(packed[1]["content"]) <= budget - count_tokens(first) + 1
+
+    def test_no_room_for_truncated_block(self):
+        """Test that a block is dropped rather than cut below the minimum truncated size."""
+        first = "x" * (Config.CHARS_PER_TOKEN_ESTIMATE * 100)
+        packed = pack_context(
+            [result("/x/a.txt", 0, first), result("/x/b.txt", 0, "y" * 4000)],
+            token_budget=100 + Config.MIN_TRUNCATED_BLOCK_TOKENS - 1
+        )
+        assert [block["content"] for block in packed] == [first]
+
+    def test_format_numbers_documents(self):
+        """Test that packed blocks are rendered as numbered excerpts with their citations."""
+        context = format_context([result("/x/a.txt", 0, "Alpha."), result("/x/b.txt", 2, "Beta.")], token_budget=1000)
+        assert context == "Document 1 (a.txt, Chunk 1):\nAlpha.\n\nDocument 2 (b.txt, Chunk 3):\nBeta."
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,140 @@
+"""
+Unit tests for near-duplicate detection (rag_elements/dedup.py) and collapsing near-duplicate
+chunks within and across ingestions (rag_elements/enhanced_vectordb.py).
+Run with: pytest tests/test_dedup.py -v
+"""
+
+import numpy as np
+import pytest
+from langchain.schema import Document
+
+from rag_elements.config import Config
+from rag_elements.dedup import NearDuplicateDetector
+from rag_elements.enhanced_vectordb import EnhancedDocumentProcessor
+
+SHARED_TEXT = "Retrieval augmented generation grounds answers in indexed documents. " * 8
+OTHER_TEXT = "Compaction rebuilds the index without dead vectors. " * 8
+
+
+def document(text: str, source: str) -> Document:
+    return Document(page_content=text, metadata={"source": source, "type": "text"})
+
+
+def live_chunks(processor: EnhancedDocumentProcessor):
+    snapshot = processor.snapshot()
+    return [
+        doc for docstore_id, doc in snapshot.vector_store.docstore._dict.items()
+        if docstore_id not in snapshot.tombstones
+    ]
+
+
+def aliases_of(processor: EnhancedDocumentProcessor, source: str):
+    chunk = next(doc for doc in live_chunks(processor) if doc.metadata["source"] == source)
+    return [alias["source"] for alias in chunk.metadata.get("aliases", [])]
+
+
+class TestNearDuplicateDetector:
+    """Tests for MinHash signatures and LSH lookups."""
+
+    def test_similar_texts_match(self):
+        """Test that a lightly edited text is found and an unrelated one is not."""
+        text = " ".join(f"sentence {i} describes step {i * 7} of the indexing pipeline." for i in range(40))
+        detector = NearDuplicateDetector()
+        detector.add(detector.fingerprint(text))
+
+        assert detector.find_duplicate(detector.fingerprint(text + " Citations follow.")) == 0
+        assert detector.find_duplicate(detector.fingerprint(OTHER_TEXT)) is None
+
+    def test_signature_is_stable_uint32(self):
+        """Test that signatures are deterministic 32-bit values, so saved ones stay comparable."""
+        first = NearDuplicateDetector().fingerprint(SHARED_TEXT)
+        second = NearDuplicateDetector().fingerprint(SHARED_TEXT)
+        assert first.dtype == np.uint32
+        assert first.shape == (Config.MINHASH_NUM_PERM,)
+        np.testing.assert_array_equal(first, second)
+
+    def test_ignored_candidates_are_skipped(self):
+        """Test that a match rejected by ignore falls through to the next best one."""
+        detector = NearDuplicateDetector()
+        signature = detector.fingerprint(SHARED_TEXT)
+        detector.add(signature)
+        detector.add(signature)
+
+        assert detector.find_duplicate(signature, ignore=lambda entry: entry == 0) == 1
+        assert detector.find_duplicate(signature, ignore=lambda entry: True) is None
+
+
+class TestCollapsingDuplicates:
+    """Tests for collapsing near-duplicate chunks into aliases of one indexed chunk."""
+
+    @pytest.fixture
+    def processor(self, monkeypatch):
+        monkeypatch.setattr(Config, "ENABLE_BACKGROUND_COMPACTION", False)
+        processor = EnhancedDocumentProcessor()
+        processor.create_enhanced_vector_store([document(SHARED_TEXT, "/x/original.txt")])
+        return processor
+
+    def test_within_one_ingestion(self):
+        """Test that duplicates in one batch are indexed once."""
+        processor = EnhancedDocumentProcessor()
+        processor.create_enhanced_vector_store([
+            document(SHARED_TEXT, "/x/original.txt"),
+            document(SHARED_TEXT, "/x/copy.txt")
+        ])
+        assert len(live_chunks(processor)) == 1
+        assert aliases_of(processor, "/x/original.txt") == ["/x/copy.txt"]
+
+    def test_appended_duplicate_becomes_alias(self, processor):
+        """Test that an appended chunk duplicating an indexed one is not indexed again."""
+        processor.add_documents_to_vector_store([
+            document(SHARED_TEXT, "/x/copy.txt"),
+            document(OTHER_TEXT, "/x/other.txt")
+        ])
+
+        assert sorted(doc.metadata["source"] for doc in live_chunks(processor)) == ["/x/original.txt", "/x/other.txt"]
+        assert aliases_of(processor, "/x/original.txt") == ["/x/copy.txt"]
+
+        results = processor.search_with_citations(SHARED_TEXT, k=2)
+        assert sorted(result["source"] for result in results) == ["/x/original.txt", "/x/other.txt"]
+
+    def test_aliases_accumulate_across_appends(self, processor):
+        """Test that later duplicates join the aliases of the same chunk."""
+        processor.add_documents_to_vector_store([document(SHARED_TEXT, "/x/copy.txt")])
+        processor.add_documents_to_vector_store([document(SHARED_TEXT, "/x/another.txt")])
+
+        assert len(live_chunks(processor)) == 1
+        assert aliases_of(processor, "/x/original.txt") == ["/x/copy.txt", "/x/another.txt"]
+
+    def test_deleted_chunk_is_not_matched(self, processor):
+        """Test that a tombstoned chunk is not used as the representative of a new duplicate."""
+        processor.delete_source("/x/original.txt")
+        processor.add_documents_to_vector_store([document(SHARED_TEXT, "/x/copy.txt")])
+
+        assert [doc.metadata["source"] for doc in live_chunks(processor)] == ["/x/copy.txt"]
+        assert aliases_of(processor, "/x/copy.txt") == []
+
+    def test_signatures_survive_save_and_reload(self, processor, tmp_path):
+        """Test that signatures are saved with their segment and used by appends after a reload."""
+        processor.save_vector_store(str(tmp_path))
+
+        loaded = EnhancedDocumentProcessor()
+        loaded.load_vector_store(str(tmp_path))
+        assert set(loaded.snapshot().signatures) == set(processor.snapshot().signatures)
+
+        loaded.add_documents_to_vector_store([document(SHARED_TEXT, "/x/copy.txt")])
+        assert aliases_of(loaded, "/x/original.txt") == ["/x/copy.txt"]
+
+    def test_store_without_signatures_is_fingerprinted(self, monkeypatch):
+        """Test that chunks indexed with detection off are still matched once it is on."""
+        monkeypatch.setattr(Config, "ENABLE_NEAR_DUPLICATE_DETECTION", False)
+        processor = EnhancedDocumentProcessor()
+        processor.create_enhanced_vector_store([document(SHARED_TEXT, "/x/original.txt")])
+        assert processor.snapshot().signatures is None
+
+        monkeypatch.setattr(Config, "ENABLE_NEAR_DUPLICATE_DETECTION", True)
+        processor.add_documents_to_vector_store([document(SHARED_TEXT, "/x/copy.txt")])
+        assert aliases_of(processor, "/x/original.txt") == ["/x/copy.txt"]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
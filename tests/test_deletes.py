@@ -0,0 +1,81 @@
+"""
+Unit tests for tombstone deletes of chunks and near-duplicate aliases (rag_elements/enhanced_vectordb.py).
+Run with: pytest tests/test_deletes.py -v
+"""
+
+import pytest
+from langchain.schema import Document
+
+from rag_elements.config import Config
+from rag_elements.enhanced_vectordb import EnhancedDocumentProcessor
+
+SHARED_TEXT = "Retrieval augmented generation grounds answers in indexed documents. " * 8
+
+
+def live_chunks(processor: EnhancedDocumentProcessor):
+    snapshot = processor.snapshot()
+    return [
+        doc for docstore_id, doc in snapshot.vector_store.docstore._dict.items()
+        if docstore_id not in snapshot.tombstones
+    ]
+
+
+class TestAliasDeletes:
+    """Tests for deleting sources whose chunks were collapsed as near-duplicates."""
+
+    @pytest.fixture
+    def processor(self, monkeypatch):
+        monkeypatch.setattr(Config, "ENABLE_BACKGROUND_COMPACTION", False)
+        processor = EnhancedDocumentProcessor()
+        processor.create_enhanced_vector_store([
+            Document(page_content=SHARED_TEXT, metadata={"source": "/x/original.txt", "type": "text"}),
+            Document(page_content=SHARED_TEXT, metadata={"source": "/x/copy.txt", "type": "text"}),
+            Document(page_content="Compaction rebuilds the index without dead vectors. " * 8,
+                     metadata={"source": "/x/other.txt", "type": "text"})
+        ])
+        return processor
+
+    def test_deleting_representative_promotes_alias(self, processor):
+        """Test that the copy of a deleted source's chunk stays searchable under the copy's source."""
+        shared = next(doc for doc in live_chunks(processor) if doc.metadata["source"] == "/x/original.txt")
+        assert [alias["source"] for alias in shared.metadata["aliases"]] == ["/x/copy.txt"]
+
+        assert processor.delete_source("/x/original.txt") == 1
+
+        sources = sorted(doc.metadata["source"] for doc in live_chunks(processor))
+        assert sources == ["/x/copy.txt", "/x/other.txt"]
+        promoted = next(doc for doc in live_chunks(processor) if doc.metadata["source"] == "/x/copy.txt")
+        assert "aliases" not in promoted.metadata
+        assert promoted.metadata["chunk_id"] == shared.metadata["aliases"][0]["chunk_id"]
+
+        results = processor.search_with_citations(SHARED_TEXT, k=3)
+        assert sorted(result["source"] for result in results) == ["/x/copy.txt", "/x/other.txt"]
+
+    def test_deleting_alias_keeps_representative(self, processor):
+        """Test that deleting a duplicate's source only drops its alias entry."""
+        assert processor.delete_source("/x/copy.txt") == 1
+
+        chunks = live_chunks(processor)
+        assert sorted(doc.metadata["source"] for doc in chunks) == ["/x/original.txt", "/x/other.txt"]
+        assert all("aliases" not in doc.metadata for doc in chunks)
+
+    def test_deleting_every_copy_tombstones_chunk(self, processor):
+        """Test that a chunk is tombstoned once it and all its aliases are deleted."""
+        processor.delete_source("/x/copy.txt")
+        processor.delete_source("/x/original.txt")
+
+        assert [doc.metadata["source"] for doc in live_chunks(processor)] == ["/x/other.txt"]
+
+    def test_promoted_alias_survives_save_and_reload(self, processor, tmp_path):
+        """Test that a rewritten chunk is saved as a new segment and reloaded."""
+        processor.save_vector_store(str(tmp_path))
+        processor.delete_source("/x/original.txt")
+        processor.save_vector_store(str(tmp_path))
+
+        loaded = EnhancedDocumentProcessor()
+        loaded.load_vector_store(str(tmp_path))
+        assert sorted(doc.metadata["source"] for doc in live_chunks(loaded)) == ["/x/copy.txt", "/x/other.txt"]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
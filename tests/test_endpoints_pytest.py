@@ -8,9 +8,20 @@ import requests
 import tempfile
 import os
 import json
+import time
 from typing import Dict, Any
 
 
+def wait_for_job(session: requests.Session, base_url: str, job_id: str, timeout: int = 60) -> Dict[str, Any]:
+    """Poll a background job until it completes or fails."""
+    for _ in range(timeout):
+        job = session.get(f"{base_url}/jobs/{job_id}").json()
+        if job["status"] in ("completed", "failed"):
+            break
+        time.sleep(1)
+    return job
+
+
 class TestRAGAPI:
     """Test class for RAG API endpoints."""
     
@@ -68,6 +79,15 @@ class TestRAGAPI:
         # Should fail without documents loaded
         assert response.status_code in [400, 500]
     
+    def test_chat_stream_without_documents(self):
+        """Test streaming chat endpoint without uploaded documents."""
+        response = self.session.post(
+            f"{self.BASE_URL}/chat/stream",
+            json={"message": "What is the main topic?"}
+        )
+        # Should fail before streaming starts
+        assert response.status_code in [400, 500]
+    
     def test_upload_no_files(self):
         """Test upload endpoint with no files."""
         response = self.session.post(f"{self.BASE_URL}/upload-files")
@@ -92,6 +112,64 @@ class TestRAGAPI:
         # This might succeed if there's a saved store, or fail if not
         assert response.status_code in [200, 400]
     
+    def test_list_collections(self):
+        """Test listing collections."""
+        response = self.session.get(f"{self.BASE_URL}/collections")
+        assert response.status_code == 200
+        data = response.json()
+        assert "collections" in data
+        assert isinstance(data["collections"], list)
+    
+    def test_get_stats_for_collection(self):
+        """Test the stats endpoint for a named collection."""
+        response = self.session.get(f"{self.BASE_URL}/stats", params={"collection": "pytest-empty"})
+        assert response.status_code == 200
+        data = response.json()
+        assert data["collection"] == "pytest-empty"
+        assert data["vector_store_loaded"] is False
+    
+    def test_get_themes_without_data(self):
+        """Test theme map endpoint without a loaded collection."""
+        response = self.session.get(f"{self.BASE_URL}/themes", params={"collection": "empty-collection"})
+        assert response.status_code in [400, 500]
+    
+    def test_delete_documents_without_data(self):
+        """Test deleting documents from a collection without a vector store."""
+        response = self.session.delete(
+            f"{self.BASE_URL}/documents",
+            params={"source": "missing.txt", "collection": "pytest-empty"}
+        )
+        assert response.status_code in [400, 500]
+    
+    def test_get_unknown_job(self):
+        """Test getting the status of a job that does not exist."""
+        response = self.session.get(f"{self.BASE_URL}/jobs/does-not-exist")
+        assert response.status_code == 404
+    
+    def test_session_token_issued(self):
+        """Test that a new client gets a session token that later requests keep."""
+        response = self.session.get(f"{self.BASE_URL}/stats")
+        assert response.status_code == 200
+        session_id = response.headers["X-Session-ID"]
+        assert self.session.cookies.get("rag_session") == session_id
+        
+        response = self.session.get(f"{self.BASE_URL}/stats")
+        assert response.headers["X-Session-ID"] == session_id
+        assert "set-cookie" not in response.headers
+    
+    def test_metrics(self):
+        """Test that pipeline metrics are served in the Prometheus text format."""
+        response = self.session.get(f"{self.BASE_URL}/metrics")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        assert "# TYPE rag_stage_duration_seconds histogram" in response.text
+        assert "# TYPE rag_chat_coalesced_total counter" in response.text
+    
+    def test_invalid_collection_name(self):
+        """Test that collection names cannot reach into another session."""
+        response = self.session.get(f"{self.BASE_URL}/stats", params={"collection": "other/default"})
+        assert response.status_code == 400
+    
     def test_clear_chat(self):
         """Test clearing chat history."""
         response = self.session.delete(f"{self.BASE_URL}/clear-chat")
@@ -134,8 +212,26 @@ class TestRAGAPI:
             
             if response.status_code == 200:
                 data = response.json()
-                assert data["status"] == "success"
-                assert "stats" in data
+                assert data["status"] == "accepted"
+                
+                job = wait_for_job(self.session, self.BASE_URL, data["job_id"])
+                assert job["status"] == "completed"
+                assert "stats" in job["result"]
+                assert job["progress"]["stages"]["parse"]["done"] == len(test_files)
+                
+                # A debug chat returns the timing trace of its pipeline stages
+                response = self.session.post(
+                    f"{self.BASE_URL}/chat",
+                    json={"message": "What is in the documents?", "debug": True}
+                )
+                assert response.status_code == 200
+                spans = [span["name"] for span in response.json()["trace"]["spans"]]
+                assert "retrieve" in spans and "search" in spans
+                
+                # Another session neither sees the collection nor the job
+                other = requests.Session()
+                assert other.get(f"{self.BASE_URL}/stats").json()["vector_store_loaded"] is False
+                assert data["job_id"] not in [job["id"] for job in other.get(f"{self.BASE_URL}/jobs").json()["jobs"]]
         finally:
             for _, (_, file_handle) in files:
                 file_handle.close()
@@ -155,8 +251,11 @@ class TestRAGAPI:
         
         if response.status_code == 200:
             data = response.json()
-            assert data["status"] == "success"
-            assert "stats" in data
+            assert data["status"] == "accepted"
+            
+            job = wait_for_job(self.session, self.BASE_URL, data["job_id"])
+            assert job["status"] == "completed"
+            assert "stats" in job["result"]
 
 
 class TestRAGAPIWithSetup:
@@ -199,6 +298,9 @@ class TestRAGAPIWithSetup:
                 response = self.session.post(f"{self.BASE_URL}/upload-files", files=files)
                 assert response.status_code == 200
             
+            job = wait_for_job(self.session, self.BASE_URL, response.json()["job_id"])
+            assert job["status"] == "completed"
+            
             # Test chat
             response = self.session.post(
                 f"{self.BASE_URL}/chat",
@@ -209,10 +311,16 @@ class TestRAGAPIWithSetup:
             assert "response" in data
             assert "citations" in data
             assert "themes" in data
+            assert data["trace"] is None
             
             # Test save vector store
             response = self.session.post(f"{self.BASE_URL}/save-vector-store")
             assert response.status_code == 200
+            job_id = response.json()["job_id"]
+            
+            # Wait for the background save to finish
+            job = wait_for_job(self.session, self.BASE_URL, job_id)
+            assert job["status"] == "completed"
             
         finally:
             import shutil
@@ -0,0 +1,91 @@
+"""
+Unit tests for the background job endpoints (backend/routes/job_routes.py).
+Run with: pytest tests/test_job_routes.py -v
+"""
+
+import asyncio
+import threading
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from jobs import JobManager
+from routes import job_routes
+from sessions import SessionMiddleware
+
+OWNER = "owner-session-0123456789"
+OTHER = "other-session-0123456789"
+
+
+def get(app: FastAPI, path: str, session_id: str) -> httpx.Response:
+    async def request():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.get(path, headers={"X-Session-ID": session_id})
+    return asyncio.run(request())
+
+
+class TestJobRoutes:
+    """Tests for reading job status across sessions."""
+
+    @pytest.fixture
+    def manager(self, monkeypatch):
+        manager = JobManager(store=None)
+        monkeypatch.setattr(job_routes, "job_manager", manager)
+        return manager
+
+    @pytest.fixture
+    def app(self, manager):
+        app = FastAPI()
+        app.add_middleware(SessionMiddleware)
+        app.include_router(job_routes.router)
+        return app
+
+    def test_owner_sees_job(self, manager, app):
+        """Test that the session that started a job can poll it, without seeing the owner field."""
+        job_id = manager.submit("test", lambda: "done", owner=OWNER)
+        response = get(app, f"/jobs/{job_id}", OWNER)
+        assert response.status_code == 200
+        assert response.json()["id"] == job_id
+        assert "owner" not in response.json()
+
+    def test_other_session_gets_404(self, manager, app):
+        """Test that another session's job is reported as not found."""
+        job_id = manager.submit("test", lambda: "done", owner=OWNER)
+        response = get(app, f"/jobs/{job_id}", OTHER)
+        assert response.status_code == 404
+
+        listed = get(app, "/jobs", OTHER).json()["jobs"]
+        assert job_id not in [job["id"] for job in listed]
+
+
+class RecordingStore:
+    """Shared store stand-in that records which threads publish job status."""
+
+    def __init__(self):
+        self.threads = []
+        self.published = threading.Event()
+
+    def put_job(self, status, max_finished_jobs):
+        self.threads.append(threading.current_thread().name)
+        if status["status"] == "completed":
+            self.published.set()
+
+
+class TestJobPublishing:
+    """Tests for publishing job status to the store shared by worker processes."""
+
+    def test_submit_does_not_write_to_store(self):
+        """Test that submitting, e.g. from the event loop, never waits on the shared store."""
+        store = RecordingStore()
+        manager = JobManager(store=store)
+        manager.submit("test", lambda: "done")
+
+        assert store.published.wait(5)
+        assert threading.current_thread().name not in store.threads
+        assert all(name.startswith("rag-job") for name in store.threads)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
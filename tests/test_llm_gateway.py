@@ -0,0 +1,51 @@
+"""
+Unit tests for the LLM gateway's rate limiting (rag_elements/llm_gateway.py).
+Run with: pytest tests/test_llm_gateway.py -v
+"""
+
+import asyncio
+
+import pytest
+
+from rag_elements.llm_gateway import LLMGateway, TokenBucket
+
+
+class TestTokenBucket:
+    """Tests for taking tokens and waiting for them."""
+
+    def test_takes_burst_then_reports_wait(self):
+        """Test that the burst is available at once and the next token after 1/rate seconds."""
+        bucket = TokenBucket(rate_per_second=2.0, capacity=2)
+        assert bucket.try_acquire() == 0.0
+        assert bucket.try_acquire() == 0.0
+        assert bucket.try_acquire() == pytest.approx(0.5, abs=0.05)
+
+    def test_cancelled_waiter_takes_no_token(self):
+        """Test that a caller cancelled while waiting leaves the bucket as it found it."""
+        bucket = TokenBucket(rate_per_second=1.0, capacity=1)
+        bucket.try_acquire()
+
+        async def cancel_waiters():
+            waiters = [asyncio.create_task(bucket.aacquire()) for _ in range(5)]
+            await asyncio.sleep(0.05)
+            for waiter in waiters:
+                waiter.cancel()
+            await asyncio.gather(*waiters, return_exceptions=True)
+
+        asyncio.run(cancel_waiters())
+        # Only the time spent waiting has passed; no cancelled waiter left a debt behind
+        assert bucket.try_acquire() == pytest.approx(0.9, abs=0.1)
+
+
+class TestGatewayLimits:
+    """Tests for how the gateway splits the server's limits between workers."""
+
+    def test_rate_is_split_between_workers(self):
+        """Test that each worker enforces its share of the server-wide rate and burst."""
+        gateway = LLMGateway(requests_per_minute=120, workers=4)
+        assert gateway._bucket.rate == pytest.approx(0.5)
+        assert gateway._bucket.capacity >= 1
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,87 @@
+"""
+Unit tests for pipeline latency metrics and their Prometheus rendering (rag_elements/metrics.py).
+Run with: pytest tests/test_metrics.py -v
+"""
+
+import pytest
+
+from rag_elements.metrics import PipelineMetrics
+
+
+def samples(text: str) -> dict:
+    """Map each sample line's name and labels to its value."""
+    return {
+        line.rsplit(" ", 1)[0]: float(line.rsplit(" ", 1)[1])
+        for line in text.splitlines() if line and not line.startswith("#")
+    }
+
+
+class TestPipelineMetrics:
+    """Tests for recording stage runs and rendering them."""
+
+    @pytest.fixture
+    def metrics(self):
+        return PipelineMetrics(buckets=(0.1, 1.0), window=100)
+
+    def test_histogram_buckets_are_cumulative(self, metrics):
+        """Test that bucket counts accumulate up to +Inf and sum and count cover every run."""
+        for seconds in (0.05, 0.5, 5.0):
+            metrics.observe("search", seconds)
+        rendered = samples(metrics.render())
+
+        assert rendered['rag_stage_duration_seconds_bucket{stage="search",le="0.1"}'] == 1
+        assert rendered['rag_stage_duration_seconds_bucket{stage="search",le="1"}'] == 2
+        assert rendered['rag_stage_duration_seconds_bucket{stage="search",le="+Inf"}'] == 3
+        assert rendered['rag_stage_duration_seconds_sum{stage="search"}'] == pytest.approx(5.55)
+        assert rendered['rag_stage_duration_seconds_count{stage="search"}'] == 3
+
+    def test_labels_are_sorted_and_escaped(self, metrics):
+        """Test that each label set is its own series, with labels sorted and values escaped."""
+        metrics.observe("search", 0.01, mmr="true")
+        metrics.observe("search", 0.01, mmr="false", note='say "hi"\nbye')
+        text = metrics.render()
+
+        assert 'rag_stage_duration_seconds_count{stage="search",mmr="true"} 1' in text
+        assert 'rag_stage_duration_seconds_count{stage="search",mmr="false",note="say \\"hi\\"\\nbye"} 1' in text
+
+    def test_percentiles_items_and_errors(self, metrics):
+        """Test that percentiles, processed items and errors are reported per stage."""
+        for i in range(1, 101):
+            metrics.observe("embed", i / 100, items=10, error=(i % 50 == 0))
+        rendered = samples(metrics.render())
+
+        assert rendered['rag_stage_latency_seconds{stage="embed",quantile="0.5"}'] == pytest.approx(0.51)
+        assert rendered['rag_stage_latency_seconds{stage="embed",quantile="0.99"}'] == pytest.approx(1.0)
+        assert rendered['rag_stage_items_total{stage="embed"}'] == 1000
+        assert rendered['rag_stage_errors_total{stage="embed"}'] == 2
+        assert rendered['rag_stage_throughput_items_per_second{stage="embed"}'] > 0
+
+    def test_timed_counts_exceptions_as_errors(self, metrics):
+        """Test that a timed block records its items, and records an error when it raises."""
+        with metrics.timed("chunk") as timer:
+            timer.items = 7
+        with pytest.raises(ValueError):
+            with metrics.timed("chunk"):
+                raise ValueError("bad input")
+        rendered = samples(metrics.render())
+
+        assert rendered['rag_stage_duration_seconds_count{stage="chunk"}'] == 2
+        assert rendered['rag_stage_items_total{stage="chunk"}'] == 8
+        assert rendered['rag_stage_errors_total{stage="chunk"}'] == 1
+
+    def test_every_metric_has_help_and_type(self, metrics):
+        """Test that the exposition declares each metric family once and ends with a newline."""
+        metrics.observe("save", 0.2)
+        text = metrics.render()
+
+        assert text.endswith("\n")
+        types = [line.split()[2] for line in text.splitlines() if line.startswith("# TYPE")]
+        assert types == [
+            "rag_stage_duration_seconds", "rag_stage_latency_seconds", "rag_stage_throughput_items_per_second",
+            "rag_stage_items_total", "rag_stage_errors_total"
+        ]
+        assert text.count("# HELP") == len(types)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
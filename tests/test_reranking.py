@@ -0,0 +1,106 @@
+"""
+Unit tests for diversity and cross-encoder re-ranking (rag_elements/reranking.py) and how
+search_with_citations combines them (rag_elements/enhanced_vectordb.py).
+Run with: pytest tests/test_reranking.py -v
+"""
+
+import zlib
+
+import numpy as np
+import pytest
+from langchain.schema import Document
+
+from rag_elements.config import Config
+from rag_elements.enhanced_vectordb import EnhancedDocumentProcessor
+from rag_elements.reranking import CrossEncoderReranker, maximal_marginal_relevance, scaled_scores
+
+ORIGINAL = "Solar panels convert sunlight into electricity for homes."
+NEAR_DUPLICATE = "Solar panels convert sunlight into electricity for homes and offices."
+DIFFERENT = "Wind turbines also generate electricity for the grid."
+UNRELATED = "Sourdough bread needs a long fermentation."
+
+
+class WordEmbeddings:
+    """Bag-of-words embeddings, so texts sharing most words get nearly the same vector."""
+
+    def _embed(self, text: str):
+        vector = np.zeros(64, dtype=np.float32)
+        for word in text.lower().split():
+            vector[zlib.crc32(word.strip(".").encode()) % 64] += 1.0
+        return vector.tolist()
+
+    def embed_documents(self, texts):
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+
+class KeywordCrossEncoder:
+    """Stands in for the cross-encoder: scores solar texts highest, the near-duplicate first."""
+
+    def predict(self, pairs, **kwargs):
+        scores = {ORIGINAL: 9.0, NEAR_DUPLICATE: 9.5, DIFFERENT: 5.0, UNRELATED: -3.0}
+        return [scores[text] for _, text in pairs]
+
+
+class TestMaximalMarginalRelevance:
+    """Tests for greedy MMR selection."""
+
+    def test_skips_near_duplicate(self):
+        """Test that the second pick is the relevant alternative, not a copy of the first."""
+        query = np.array([1.0, 0.3, 0.0])
+        candidates = np.array([
+            [1.0, 0.0, 0.0],
+            [0.99, 0.05, 0.0],
+            [0.5, 0.8, 0.0],
+            [0.0, 0.0, 1.0]
+        ])
+        assert maximal_marginal_relevance(query, candidates, k=2) == [1, 2]
+
+    def test_relevance_overrides_query_similarity(self):
+        """Test that given relevance scores decide the first pick."""
+        candidates = np.eye(3)
+        selected = maximal_marginal_relevance(np.array([1.0, 0.0, 0.0]), candidates, k=3,
+                                              relevance=np.array([0.1, 1.0, 0.5]))
+        assert selected == [1, 2, 0]
+
+    def test_scaled_scores(self):
+        """Test that scores are scaled to [0, 1] and unscored candidates rank last."""
+        np.testing.assert_allclose(scaled_scores([2.0, None, 0.0, 1.0]), [1.0, 0.0, 0.0, 0.5])
+        np.testing.assert_allclose(scaled_scores([3.0, 3.0]), [1.0, 1.0])
+
+
+class TestSearchReranking:
+    """Tests for search with MMR, cross-encoder re-ranking or both."""
+
+    @pytest.fixture
+    def processor(self, monkeypatch):
+        # Keep the near-duplicate as its own chunk so search has to diversify
+        monkeypatch.setattr(Config, "ENABLE_NEAR_DUPLICATE_DETECTION", False)
+        processor = EnhancedDocumentProcessor()
+        processor.embeddings = WordEmbeddings()
+        processor.create_enhanced_vector_store([
+            Document(page_content=text, metadata={"source": f"/x/{i}.txt", "type": "text"})
+            for i, text in enumerate([ORIGINAL, NEAR_DUPLICATE, DIFFERENT, UNRELATED])
+        ])
+
+        reranker = CrossEncoderReranker()
+        reranker._model = KeywordCrossEncoder()
+        processor.reranker = reranker
+        return processor
+
+    def test_rerank_alone_keeps_both_copies(self, processor):
+        """Test that the cross-encoder alone ranks by relevance, duplicates included."""
+        results = processor.search_with_citations("solar electricity", k=2, use_mmr=False, rerank=True)
+        assert [result["content"] for result in results] == [NEAR_DUPLICATE, ORIGINAL]
+
+    def test_mmr_with_rerank_diversifies(self, processor):
+        """Test that with both on the final results hold one copy and the next best alternative."""
+        results = processor.search_with_citations("solar electricity", k=2, use_mmr=True, rerank=True)
+        assert [result["content"] for result in results] == [NEAR_DUPLICATE, DIFFERENT]
+        assert results[0]["rerank_score"] == 9.5
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,115 @@
+"""
+Unit tests for the segmented FAISS index (rag_elements/segmented_index.py) and copy-on-write
+appends to the processor's vector store (rag_elements/enhanced_vectordb.py).
+Run with: pytest tests/test_segmented_index.py -v
+"""
+
+import faiss
+import numpy as np
+import pytest
+from langchain.schema import Document
+
+from rag_elements.config import Config
+from rag_elements.enhanced_vectordb import EnhancedDocumentProcessor
+from rag_elements.segmented_index import SegmentedIndex
+
+
+def random_vectors(n: int, d: int = 8, seed: int = 0) -> np.ndarray:
+    return np.random.RandomState(seed).rand(n, d).astype(np.float32)
+
+
+class TestSegmentedIndex:
+    """Tests for searching several parts as one index."""
+
+    @pytest.mark.parametrize("metric_type", [faiss.METRIC_L2, faiss.METRIC_INNER_PRODUCT])
+    def test_search_matches_single_flat_index(self, metric_type):
+        """Test that searching three parts gives the hits of one index over all their vectors."""
+        vectors = random_vectors(60)
+        segmented = SegmentedIndex(8, metric_type)
+        for chunk in np.split(vectors, [10, 35]):
+            segmented = segmented.appended(chunk)
+        flat = faiss.IndexFlat(8, metric_type)
+        flat.add(vectors)
+
+        queries = random_vectors(4, seed=1)
+        distances, positions = segmented.search(queries, 5)
+        expected_distances, expected_positions = flat.search(queries, 5)
+        np.testing.assert_array_equal(positions, expected_positions)
+        np.testing.assert_allclose(distances, expected_distances, rtol=1e-5)
+
+    def test_excluded_positions_are_skipped(self):
+        """Test that search parameters exclude positions in any part."""
+        vectors = random_vectors(20)
+        segmented = SegmentedIndex(8).appended(vectors[:10]).appended(vectors[10:])
+
+        _, positions = segmented.search(vectors[[3, 15]], 1)
+        assert positions[:, 0].tolist() == [3, 15]
+
+        params = segmented.search_parameters(np.array([3, 15]))
+        assert params[0] is not None and params[1] is not None
+        _, positions = segmented.search(vectors[[3, 15]], 20, params=params)
+        assert 3 not in positions and 15 not in positions
+        assert (positions == -1).sum() == 4
+
+    def test_reconstruct_across_parts(self):
+        """Test that positions map to the right part's vectors."""
+        vectors = random_vectors(20)
+        segmented = SegmentedIndex(8).appended(vectors[:7]).appended(vectors[7:])
+
+        np.testing.assert_array_equal(segmented.reconstruct_batch(np.array([19, 0, 7, 6])), vectors[[19, 0, 7, 6]])
+        np.testing.assert_array_equal(segmented.reconstruct_n(5, 4), vectors[5:9])
+
+    def test_appended_leaves_original_unchanged(self):
+        """Test that appending shares the existing parts and does not change the original index."""
+        original = SegmentedIndex(8).appended(random_vectors(10))
+        extended = original.appended(random_vectors(3, seed=1))
+
+        assert original.ntotal == 10 and len(original.parts) == 1
+        assert extended.ntotal == 13 and extended.parts[0] is original.parts[0]
+
+
+class TestCopyOnWriteAppends:
+    """Tests for appending to and compacting the processor's segmented store."""
+
+    @pytest.fixture
+    def processor(self, monkeypatch):
+        monkeypatch.setattr(Config, "ENABLE_BACKGROUND_COMPACTION", False)
+        processor = EnhancedDocumentProcessor()
+        processor.create_enhanced_vector_store([
+            Document(page_content=f"Original document {i} about its own topic. " * 10,
+                     metadata={"source": f"/x/{i}.txt", "type": "text"})
+            for i in range(3)
+        ])
+        return processor
+
+    def test_append_adds_a_segment_without_copying(self, processor):
+        """Test that an append publishes a new index whose existing segments are the old ones."""
+        before = processor.snapshot().vector_store
+        processor.add_documents_to_vector_store([
+            Document(page_content="An appended note on a new subject. " * 10, metadata={"source": "/x/new.txt", "type": "text"})
+        ])
+        after = processor.snapshot().vector_store
+
+        assert after.index.parts[:-1] == before.index.parts
+        assert after.index.ntotal == before.index.ntotal + 1
+        assert len(before.docstore._dict) == before.index.ntotal
+        appended = after.docstore.search(after.index_to_docstore_id[after.index.ntotal - 1])
+        assert processor.search_with_citations(appended.page_content, k=1)[0]["source"] == "/x/new.txt"
+
+    def test_compaction_merges_segments(self, processor):
+        """Test that compaction rebuilds many segments as one, without changing search results."""
+        for i in range(3):
+            processor.add_documents_to_vector_store([
+                Document(page_content=f"Appended document {i} on another topic. " * 10,
+                         metadata={"source": f"/x/appended-{i}.txt", "type": "text"})
+            ])
+        assert len(processor.snapshot().vector_store.index.parts) == 4
+        results = processor.search_with_citations("Appended document 1 on another topic.", k=3)
+
+        assert processor.compact()
+        assert len(processor.snapshot().vector_store.index.parts) == 1
+        assert processor.search_with_citations("Appended document 1 on another topic.", k=3) == results
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,52 @@
+"""
+Unit tests for the state shared by worker processes (backend/shared_state.py).
+Run with: pytest tests/test_shared_state.py -v
+"""
+
+import pytest
+
+from shared_state import SharedStateStore
+
+
+class TestChatHistory:
+    """Tests for paging and capping a collection's chat history."""
+
+    @pytest.fixture
+    def store(self, tmp_path):
+        return SharedStateStore(str(tmp_path / "state.sqlite3"))
+
+    def test_pages_count_back_from_newest(self, store):
+        """Test that a page holds the newest exchanges after offset, oldest first."""
+        for i in range(10):
+            store.append_chat("docs", {"user_message": str(i)})
+        store.append_chat("other", {"user_message": "x"})
+
+        assert [e["user_message"] for e in store.get_chat_history("docs", limit=3)] == ["7", "8", "9"]
+        assert [e["user_message"] for e in store.get_chat_history("docs", limit=3, offset=3)] == ["4", "5", "6"]
+        assert len(store.get_chat_history("docs")) == 10
+        assert store.count_chat_history("docs") == 10
+
+    def test_append_drops_oldest_beyond_cap(self, store):
+        """Test that only the newest max_entries exchanges of a collection are kept."""
+        for i in range(8):
+            store.append_chat("docs", {"user_message": str(i)}, max_entries=5)
+        store.append_chat("other", {"user_message": "x"}, max_entries=5)
+
+        assert [e["user_message"] for e in store.get_chat_history("docs")] == ["3", "4", "5", "6", "7"]
+        assert store.count_chat_history("other") == 1
+
+    def test_clear_keeps_stats_and_other_collections(self, store):
+        """Test that clearing a collection's chat leaves its statistics and other collections alone."""
+        store.append_chat("docs", {"user_message": "a"})
+        store.append_chat("other", {"user_message": "b"})
+        store.set_stats("docs", {"total_files": 3})
+
+        store.clear_chat_history("docs")
+
+        assert store.count_chat_history("docs") == 0
+        assert store.count_chat_history("other") == 1
+        assert store.get_stats("docs") == {"total_files": 3}
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
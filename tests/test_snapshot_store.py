@@ -0,0 +1,167 @@
+"""
+Unit tests for versioned vector store snapshots (rag_elements/snapshot_store.py).
+Run with: pytest tests/test_snapshot_store.py -v
+"""
+
+import json
+import os
+import threading
+
+import faiss
+import numpy as np
+import pytest
+from langchain.schema import Document
+
+from rag_elements import snapshot_store
+from rag_elements.enhanced_vectordb import EnhancedDocumentProcessor
+
+
+def make_documents(name: str, count: int = 3):
+    return [
+        Document(
+            page_content=f"Document {name} part {i} talks about topic {name}-{i} in its own words. " * 5,
+            metadata={"source": f"/x/{name}_{i}.txt", "type": "text"}
+        )
+        for i in range(count)
+    ]
+
+
+def publish(root: str, segments):
+    with snapshot_store.store_lock(root):
+        return snapshot_store.publish_manifest(root, {"segments": list(segments), "tombstones": []})
+
+
+class TestSnapshotStore:
+    """Tests for segments, manifests and garbage collection."""
+
+    def test_publish_increments_version(self, tmp_path):
+        """Test that each published manifest becomes the live version."""
+        root = str(tmp_path)
+        assert snapshot_store.read_current_version(root) is None
+        assert publish(root, []) == 1
+        assert publish(root, []) == 2
+        assert snapshot_store.read_current_version(root) == 2
+        assert snapshot_store.read_current_manifest(root)["version"] == 2
+
+    def test_segment_round_trip(self, tmp_path):
+        """Test that a written segment reads back unchanged, with its index memory-mapped from the file."""
+        root = str(tmp_path)
+        vectors = np.arange(12, dtype=np.float32).reshape(3, 4)
+        chunks = [{"id": str(i), "page_content": f"chunk {i}", "metadata": {}} for i in range(3)]
+        snapshot_store.write_segment(root, "seg-a", vectors, chunks, metric_type=faiss.METRIC_INNER_PRODUCT)
+
+        assert snapshot_store.segment_exists(root, "seg-a")
+        index, read_chunks = snapshot_store.read_segment(root, "seg-a")
+        np.testing.assert_array_equal(index.reconstruct_n(0, index.ntotal), vectors)
+        assert index.metric_type == faiss.METRIC_INNER_PRODUCT
+        assert not index.codes.is_owned
+        assert read_chunks == chunks
+
+    def test_read_legacy_vectors_segment(self, tmp_path):
+        """Test that a segment saved as vectors.npy is still read, into an index of the given metric."""
+        root = str(tmp_path)
+        vectors = np.arange(8, dtype=np.float32).reshape(2, 4)
+        segment_dir = os.path.join(root, snapshot_store.SEGMENTS_DIR, "seg-old")
+        os.makedirs(segment_dir)
+        np.save(os.path.join(segment_dir, "vectors.npy"), vectors)
+        with open(os.path.join(segment_dir, "chunks.json"), "w") as f:
+            json.dump([{"id": "a"}, {"id": "b"}], f)
+
+        index, chunks = snapshot_store.read_segment(root, "seg-old", faiss.METRIC_INNER_PRODUCT)
+        np.testing.assert_array_equal(index.reconstruct_n(0, 2), vectors)
+        assert index.metric_type == faiss.METRIC_INNER_PRODUCT
+        assert [chunk["id"] for chunk in chunks] == ["a", "b"]
+
+    def test_gc_removes_segments_of_expired_versions(self, tmp_path):
+        """Test that segments only referenced by expired versions are deleted."""
+        root = str(tmp_path)
+        vectors = np.zeros((1, 4), dtype=np.float32)
+        for segment_id in ("seg-old", "seg-new"):
+            snapshot_store.write_segment(root, segment_id, vectors, [{"id": segment_id}])
+        publish(root, ["seg-old"])
+        for _ in range(3):
+            publish(root, ["seg-new"])
+        os.utime(os.path.join(root, snapshot_store.SEGMENTS_DIR, "seg-old"), (0, 0))
+
+        with snapshot_store.store_lock(root):
+            snapshot_store.collect_garbage(root, keep_versions=3)
+
+        assert not snapshot_store.segment_exists(root, "seg-old")
+        assert snapshot_store.segment_exists(root, "seg-new")
+        assert len(os.listdir(os.path.join(root, snapshot_store.VERSIONS_DIR))) == 3
+
+    def test_gc_keeps_unpublished_segments_and_tmp_dirs(self, tmp_path):
+        """Test that GC never deletes a segment written after the newest manifest, or a temporary dir."""
+        root = str(tmp_path)
+        publish(root, [])
+        newest = os.path.join(root, snapshot_store.VERSIONS_DIR, "00000001.json")
+        os.utime(newest, (0, 0))
+        snapshot_store.write_segment(root, "seg-pending", np.zeros((1, 4), dtype=np.float32), [{"id": "a"}])
+        tmp_dir = os.path.join(root, snapshot_store.SEGMENTS_DIR, "seg-other.tmp-1")
+        os.makedirs(tmp_dir)
+        os.utime(tmp_dir, (0, 0))
+
+        with snapshot_store.store_lock(root):
+            snapshot_store.collect_garbage(root)
+
+        assert snapshot_store.segment_exists(root, "seg-pending")
+        assert os.path.isdir(tmp_dir)
+
+
+class TestConcurrentSaves:
+    """Tests for processors saving to the same store at the same time."""
+
+    def test_concurrent_saves_then_reload(self, tmp_path):
+        """Test that two savers of one path never leave a published version with missing segments."""
+        root = str(tmp_path / "store")
+        processors = [EnhancedDocumentProcessor(), EnhancedDocumentProcessor()]
+        for i, processor in enumerate(processors):
+            processor.create_enhanced_vector_store(make_documents(f"base{i}"))
+
+        rounds = 5
+        barrier = threading.Barrier(len(processors))
+        failures = []
+
+        def save_rounds(i: int, processor: EnhancedDocumentProcessor):
+            for round_number in range(rounds):
+                processor.add_documents_to_vector_store(make_documents(f"p{i}r{round_number}", count=1))
+                barrier.wait()
+                if not processor.save_vector_store(root):
+                    failures.append((i, round_number))
+
+        threads = [threading.Thread(target=save_rounds, args=(i, p)) for i, p in enumerate(processors)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert not failures
+        manifest = snapshot_store.read_current_manifest(root)
+        assert manifest["version"] == 2 * rounds
+        for segment_id in manifest["segments"]:
+            assert snapshot_store.segment_exists(root, segment_id)
+
+        loaded = EnhancedDocumentProcessor()
+        assert loaded.load_vector_store(root) is not None
+        assert loaded.vector_store.index.ntotal in {p.vector_store.index.ntotal for p in processors}
+
+
+    def test_loaded_segments_are_memory_mapped(self, tmp_path):
+        """Test that a loaded store searches its segment files in place instead of copying them."""
+        root = str(tmp_path / "store")
+        processor = EnhancedDocumentProcessor()
+        processor.create_enhanced_vector_store(make_documents("base"))
+        processor.add_documents_to_vector_store(make_documents("more", count=1))
+        assert processor.save_vector_store(root)
+
+        loaded = EnhancedDocumentProcessor()
+        loaded.load_vector_store(root)
+        parts = loaded.vector_store.index.parts
+        assert len(parts) == 2
+        assert not any(part.codes.is_owned for part in parts)
+        appended = loaded.vector_store.docstore.search(loaded.vector_store.index_to_docstore_id[parts[0].ntotal])
+        assert loaded.search_with_citations(appended.page_content, k=1)[0]["source"] == "/x/more_0.txt"
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
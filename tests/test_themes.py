@@ -0,0 +1,144 @@
+"""
+Unit tests for local theme analysis (rag_elements/themes.py).
+Run with: pytest tests/test_themes.py -v
+"""
+
+import asyncio
+import threading
+
+import numpy as np
+import pytest
+from langchain.schema import Document
+
+from rag_elements.config import Config
+from rag_elements.enhanced_vectordb import EnhancedDocumentProcessor
+from rag_elements.themes import assign_clusters, kmeans, local_theme_analysis, top_keyphrases
+from utils import aanalyze_themes
+
+
+def two_blobs(per_blob: int = 10, seed: int = 0):
+    rng = np.random.RandomState(seed)
+    first = np.array([1.0, 0.0, 0.0]) + rng.normal(scale=0.05, size=(per_blob, 3))
+    second = np.array([0.0, 1.0, 0.0]) + rng.normal(scale=0.05, size=(per_blob, 3))
+    return np.vstack([first, second]).astype(np.float32)
+
+
+class TestKMeans:
+    """Tests for clustering vectors and assigning new ones."""
+
+    def test_separates_blobs(self):
+        """Test that two well-separated groups get one label each."""
+        labels, centroids = kmeans(two_blobs(), k=2)
+        assert len(set(labels[:10])) == 1
+        assert len(set(labels[10:])) == 1
+        assert labels[0] != labels[10]
+        np.testing.assert_allclose(np.linalg.norm(centroids, axis=1), 1, rtol=1e-5)
+
+    def test_k_capped_at_points(self):
+        """Test that asking for more clusters than points yields one per point."""
+        labels, centroids = kmeans(np.eye(3, dtype=np.float32), k=10)
+        assert len(centroids) == 3
+        assert sorted(labels) == [0, 1, 2]
+
+    def test_assign_clusters_uses_nearest_centroid(self):
+        """Test that new vectors join the centroid they point towards."""
+        labels, centroids = kmeans(two_blobs(), k=2)
+        assigned = assign_clusters(np.array([[2.0, 0.1, 0.0], [0.1, 3.0, 0.0]]), centroids)
+        assert list(assigned) == [labels[0], labels[10]]
+
+
+class TestKeyphrases:
+    """Tests for labelling clusters with TF-IDF keyphrases."""
+
+    def test_labels_clusters_with_distinctive_terms(self):
+        """Test that each cluster is labelled with the terms that set it apart."""
+        texts = [
+            "vector databases store embeddings for search",
+            "embeddings in vector databases enable search",
+            "gradient descent trains neural networks",
+            "neural networks learn by gradient descent",
+        ]
+        keyphrases = top_keyphrases(texts, np.array([0, 0, 1, 1]), top_n=3)
+        assert any("vector" in phrase or "databases" in phrase for phrase in keyphrases[0])
+        assert any("gradient" in phrase or "neural" in phrase for phrase in keyphrases[1])
+
+
+class TestLocalThemeAnalysis:
+    """Tests for theme analysis of search results without an LLM."""
+
+    def test_groups_results_into_themes(self):
+        """Test that results are grouped in the LLM analysis format, largest theme first."""
+        vectors = two_blobs(per_blob=3)
+        results = (
+            [{"content": "vector search over embeddings", "source": "/x/a.txt"}] * 3
+            + [{"content": "neural network training", "source": "/x/b.txt"}] * 3
+        )
+        analysis = local_theme_analysis("what is covered", results, vectors, max_clusters=2)
+        assert len(analysis["themes"]) == 2
+        assert all(theme["frequency"] == "3 of 6 excerpts" for theme in analysis["themes"])
+        assert "what is covered" in analysis["summary"]
+
+    def test_local_mode_runs_off_the_event_loop(self, monkeypatch):
+        """Test that the chat path runs local clustering on the CPU pool, not the event loop thread."""
+        monkeypatch.setattr(Config, "THEME_ANALYSIS_MODE", "local")
+        processor = EnhancedDocumentProcessor()
+        processor.create_enhanced_vector_store([
+            Document(page_content=f"Topic {i} covers its own subject. " * 20, metadata={"source": f"/x/{i}.txt", "type": "text"})
+            for i in range(4)
+        ])
+        results = processor.search_with_citations("topic", k=4)
+
+        threads = []
+        analyze = processor._precomputed_theme_analysis
+        monkeypatch.setattr(processor, "_precomputed_theme_analysis",
+                            lambda *args: threads.append(threading.current_thread().name) or analyze(*args))
+
+        async def run():
+            loop_thread = threading.current_thread().name
+            analysis = await aanalyze_themes(processor, "topic", results)
+            return loop_thread, analysis
+
+        loop_thread, analysis = asyncio.run(run())
+        assert analysis["themes"]
+        assert threads and threads[0] != loop_thread
+
+
+class TestCorpusThemeMap:
+    """Tests for keeping the corpus theme map in step with the collection."""
+
+    @pytest.fixture
+    def processor(self, monkeypatch):
+        monkeypatch.setattr(Config, "ENABLE_CORPUS_THEME_MAP", True)
+        monkeypatch.setattr(Config, "CORPUS_THEME_CLUSTERS", 3)
+        monkeypatch.setattr(Config, "ENABLE_BACKGROUND_COMPACTION", False)
+        processor = EnhancedDocumentProcessor()
+        processor.create_enhanced_vector_store([
+            Document(page_content=f"Document {i} explains subject {i} at length. " * 20,
+                     metadata={"source": f"/x/{i}.txt", "type": "text"})
+            for i in range(6)
+        ])
+        return processor
+
+    @staticmethod
+    def live_chunks(processor) -> int:
+        snapshot = processor.snapshot()
+        return len(set(snapshot.vector_store.docstore._dict) - snapshot.tombstones)
+
+    def test_sizes_follow_appends_deletes_and_compaction(self, processor):
+        """Test that cluster sizes and top sources count only the chunks still in the collection."""
+        processor.add_documents_to_vector_store([
+            Document(page_content="An appended note on a fresh subject. " * 20, metadata={"source": "/x/new.txt", "type": "text"})
+        ])
+        assert sum(cluster["size"] for cluster in processor.get_theme_map()) == self.live_chunks(processor)
+
+        assert processor.delete_source("/x/0.txt")
+        themes = processor.get_theme_map()
+        assert sum(cluster["size"] for cluster in themes) == self.live_chunks(processor)
+        assert not any("0.txt" in cluster["top_sources"] for cluster in themes)
+
+        assert processor.compact()
+        assert processor.get_theme_map() == themes
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,87 @@
+"""
+Unit tests for request tracing (rag_elements/tracing.py) and the spans pipeline stages record.
+Run with: pytest tests/test_tracing.py -v
+"""
+
+import asyncio
+from collections import Counter
+
+import pytest
+from langchain.schema import Document
+
+from rag_elements.config import Config
+from rag_elements.enhanced_vectordb import EnhancedDocumentProcessor
+from rag_elements.tracing import Trace, current_trace, span, traced
+from utils import aanalyze_themes, compress_for_prompt
+
+
+def span_names(trace: Trace):
+    return [recorded["name"] for recorded in trace.to_dict()["spans"]]
+
+
+class TestSpans:
+    """Tests for recording spans into the current trace."""
+
+    def test_nested_spans_record_parent(self):
+        """Test that spans record their enclosing span and nothing is recorded outside a trace."""
+        with span("outside") as outside:
+            assert outside is None
+
+        trace = Trace()
+        token = current_trace.set(trace)
+        try:
+            with span("outer"):
+                traced("inner")(lambda: None)()
+        finally:
+            current_trace.reset(token)
+
+        spans = {recorded["name"]: recorded for recorded in trace.to_dict()["spans"]}
+        assert spans["inner"]["parent"] == "outer"
+        assert spans["outer"]["parent"] is None
+
+
+class TestStageSpans:
+    """Tests that each pipeline stage appears once per call in a trace."""
+
+    def test_theme_analysis_records_one_span(self, monkeypatch):
+        """Test that theme analysis on the chat path records a single analyze_themes span."""
+        monkeypatch.setattr(Config, "THEME_ANALYSIS_MODE", "local")
+        processor = EnhancedDocumentProcessor()
+        processor.create_enhanced_vector_store([
+            Document(page_content=f"Topic {i} covers its own subject. " * 20, metadata={"source": f"/x/{i}.txt", "type": "text"})
+            for i in range(4)
+        ])
+        results = processor.search_with_citations("topic", k=4)
+
+        async def run():
+            trace = Trace()
+            current_trace.set(trace)
+            await aanalyze_themes(processor, "topic", results)
+            return trace
+
+        counts = Counter(span_names(asyncio.run(run())))
+        assert counts["analyze_themes"] == 1
+        assert all(count == 1 for count in counts.values())
+
+    @pytest.mark.parametrize("enabled", [True, False])
+    def test_compress_span_only_when_enabled(self, monkeypatch, enabled):
+        """Test that compression records its span only when it runs."""
+        monkeypatch.setattr(Config, "ENABLE_CONTEXT_COMPRESSION", enabled)
+        processor = EnhancedDocumentProcessor()
+        processor.create_enhanced_vector_store([
+            Document(page_content="A sentence about compression. Another about tracing. " * 5,
+                     metadata={"source": "/x/a.txt", "type": "text"})
+        ])
+        results = processor.search_with_citations("compression", k=1)
+
+        async def run():
+            trace = Trace()
+            current_trace.set(trace)
+            await compress_for_prompt(processor, "compression", results)
+            return trace
+
+        assert span_names(asyncio.run(run())).count("compress") == (1 if enabled else 0)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])